@@ -0,0 +1,425 @@
+import asyncio
+import re
+import sys
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict, deque
+
+# Raid detection settings
+RAID_WINDOW = 30  # Seconds a content cluster stays alive without new messages
+RAID_DUPLICATE_USERS = 5  # Distinct users posting the same content before it is a raid
+RAID_SIMHASH_DISTANCE = 3  # Max differing bits for two messages to count as near-duplicates
+RAID_MIN_CONTENT_LENGTH = 12  # Ignore short messages like "gg" or "thanks"
+RAID_MAX_FEATURE_CHARS = 256  # Only fingerprint the start of long messages
+RAID_MAX_CLUSTERS = 2000  # Clusters kept per channel/guild scope
+RAID_MAX_CLUSTER_MESSAGES = 100  # Messages remembered per cluster for mass deletion
+RAID_MAX_SCOPES = 5000  # Channel/guild scopes kept in memory
+RAID_NEW_ACCOUNT_AGE = 7 * 24 * 3600  # Accounts younger than this (seconds) are a raid signal
+
+# Join-rate raid guard settings
+JOIN_WINDOW = 60  # Sliding window for join counting, in seconds
+JOIN_RAID_THRESHOLD = 20  # Joins per window that switch a guild into raid mode
+RAID_MODE_COOLDOWN = 300  # Raid mode stays on until joins calm down for this long
+
+# Welcome DM pipeline settings
+WELCOME_QUEUE_SIZE = 200  # Pending welcome DMs before new joiners go to the digest
+WELCOME_DM_INTERVAL = 1.0  # Seconds between two welcome DMs
+WELCOME_RECENT_SIZE = 10000  # Members remembered to avoid sending the same DM twice
+
+_MASK64 = (1 << 64) - 1
+_BAND_BITS = 16
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_ZERO_WIDTH_RE = re.compile('[\u200b-\u200f\u2060\ufeff]')
+_MENTION_RE = re.compile(r'<(@[!&]?|#)\d+>')
+_URL_RE = re.compile(r'https?://([^\s/?#]+)([^\s?#]*)[^\s]*')
+_SPACE_RE = re.compile(r'\s+')
+
+def normalize_content(text):
+    """Normalize message text so trivially altered copies compare equal"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = _ZERO_WIDTH_RE.sub('', text)
+    # Mentions differ per raider, the payload does not
+    text = _MENTION_RE.sub(r'<\1>', text)
+    # Keep host and path of links, drop scheme, query strings and tracking fragments
+    text = _URL_RE.sub(lambda m: m.group(1).removeprefix('www.') + m.group(2).rstrip('/'), text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+def simhash_features(text):
+    """Character 4-grams of the start of the text"""
+    text = text[:RAID_MAX_FEATURE_CHARS]
+    return [text[i:i + 4] for i in range(max(len(text) - 3, 1))]
+
+def simhash64(text, hash_fn=hash):
+    """Compute a 64-bit SimHash of normalized text"""
+    features = simhash_features(text)
+
+    # Bit-sliced counters: planes[k] holds bit k of the per-position vote count,
+    # so each feature costs a short ripple-carry add instead of 64 increments
+    planes = []
+    for carry in map(hash_fn, features):
+        carry &= _MASK64
+        k = 0
+        while carry:
+            if k == len(planes):
+                planes.append(carry)
+                break
+            plane = planes[k]
+            planes[k] = plane ^ carry
+            carry &= plane
+            k += 1
+
+    # A bit is set when more than half of the features voted for it
+    threshold = len(features) // 2
+    greater = 0
+    equal = _MASK64
+    for k in range(max(len(planes), threshold.bit_length()) - 1, -1, -1):
+        plane = planes[k] if k < len(planes) else 0
+        if (threshold >> k) & 1:
+            equal &= plane
+        else:
+            greater |= equal & plane
+            equal &= ~plane & _MASK64
+    return greater
+
+def hamming_distance(a, b):
+    """Number of differing bits between two fingerprints"""
+    return (a ^ b).bit_count()
+
+def simhash_bands(fingerprint):
+    """Split a fingerprint into 4 bands; near-duplicates share at least one band"""
+    return [(i, (fingerprint >> (i * _BAND_BITS)) & _BAND_MASK) for i in range(64 // _BAND_BITS)]
+
+class ContentCluster:
+    """Messages in one scope that share the same (or nearly the same) content"""
+    __slots__ = ('exact_keys', 'fingerprint', 'authors', 'messages', 'last_seen', 'flagged')
+
+    def __init__(self, exact, fingerprint, now):
+        self.exact_keys = {exact}  # Exact texts indexed to this cluster, removed with it
+        self.fingerprint = fingerprint
+        self.authors = set()
+        self.messages = deque(maxlen=RAID_MAX_CLUSTER_MESSAGES)
+        self.last_seen = now
+        self.flagged = False
+
+class ContentWindow:
+    """Sliding window of content clusters for a single channel or guild"""
+
+    def __init__(self):
+        self.clusters = OrderedDict()  # cluster_id -> ContentCluster, oldest activity first
+        self.index = {}  # exact hash or (band, value) -> cluster_id
+        self.next_id = 0
+
+    def expire(self, now):
+        """Drop clusters that have been quiet for longer than the window"""
+        while self.clusters:
+            cluster_id, cluster = next(iter(self.clusters.items()))
+            if cluster.last_seen >= now - RAID_WINDOW and len(self.clusters) <= RAID_MAX_CLUSTERS:
+                break
+            self._drop(cluster_id, cluster)
+
+    def _drop(self, cluster_id, cluster):
+        del self.clusters[cluster_id]
+        for key in list(cluster.exact_keys) + simhash_bands(cluster.fingerprint):
+            if self.index.get(key) == cluster_id:
+                del self.index[key]
+
+    def find(self, exact, fingerprint):
+        """Find the cluster for this content with at most 5 dictionary lookups"""
+        cluster_id = self.index.get(exact)
+        if cluster_id is not None:
+            return cluster_id
+        if fingerprint is None:
+            return None
+        for band in simhash_bands(fingerprint):
+            cluster_id = self.index.get(band)
+            if cluster_id is None:
+                continue
+            cluster = self.clusters[cluster_id]
+            if hamming_distance(cluster.fingerprint, fingerprint) <= RAID_SIMHASH_DISTANCE:
+                return cluster_id
+        return None
+
+    def add(self, exact, fingerprint, author_id, ref, now):
+        """Record a message and return its cluster"""
+        cluster_id = self.find(exact, fingerprint)
+        if cluster_id is None:
+            cluster_id = self.next_id
+            self.next_id += 1
+            cluster = ContentCluster(exact, fingerprint, now)
+            self.clusters[cluster_id] = cluster
+            for key in [exact] + simhash_bands(fingerprint):
+                self.index[key] = cluster_id
+        else:
+            cluster = self.clusters[cluster_id]
+            self.clusters.move_to_end(cluster_id)
+            # Later exact copies of a near-duplicate jump straight to the cluster
+            if exact not in self.index:
+                self.index[exact] = cluster_id
+                cluster.exact_keys.add(exact)
+
+        cluster.last_seen = now
+        cluster.authors.add(author_id)
+        cluster.messages.append(ref)
+        return cluster
+
+class RaidDetector:
+    """Detect many accounts posting the same content in a channel or across a guild"""
+
+    def __init__(self):
+        self.windows = OrderedDict()  # scope key -> ContentWindow
+
+    def _window(self, key):
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = ContentWindow()
+            if len(self.windows) > RAID_MAX_SCOPES:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(key)
+        return window
+
+    def observe(self, guild_id, channel_id, author_id, content, ref, now=None, raid_signal=False):
+        """Record a message and return the messages to act on if it belongs to a raid
+
+        The first time a cluster crosses RAID_DUPLICATE_USERS every remembered message
+        in it is returned for mass deletion. After that each new copy is returned alone.
+
+        The guild-wide scope only sees messages with a raid signal: a link in the
+        content, or raid_signal from the caller (raid mode, new account). Members
+        cheering the same "congrats!" across channels are not a raid.
+        """
+        normalized = normalize_content(content or '')
+        if len(normalized) < RAID_MIN_CONTENT_LENGTH:
+            return []
+        scopes = (('c', channel_id), ('g', guild_id)) if raid_signal or _URL_RE.search(content) else (('c', channel_id),)
+
+        now = time.time() if now is None else now
+        exact = ('x', hash(normalized))
+        fingerprint = None
+
+        hits = []
+        seen = set()
+        for key in scopes:
+            window = self._window(key)
+            window.expire(now)
+            # Exact copies skip the SimHash entirely
+            if fingerprint is None and exact not in window.index:
+                fingerprint = simhash64(normalized)
+            cluster = window.add(exact, fingerprint, author_id, ref, now)
+
+            if cluster.flagged:
+                candidates = [ref]
+            elif len(cluster.authors) >= RAID_DUPLICATE_USERS:
+                cluster.flagged = True
+                candidates = list(cluster.messages)
+            else:
+                continue
+
+            for candidate in candidates:
+                if id(candidate) not in seen:
+                    seen.add(id(candidate))
+                    hits.append(candidate)
+        return hits
+
+class JoinRateTracker:
+    """Sliding-window join counter per guild with an automatic raid mode"""
+
+    def __init__(self):
+        # Only the last JOIN_RAID_THRESHOLD timestamps matter: the rate is exceeded
+        # when the oldest of them is still inside the window
+        self.joins = defaultdict(lambda: deque(maxlen=JOIN_RAID_THRESHOLD))
+        self.raid_until = {}  # guild_id -> timestamp when raid mode ends
+
+    def record(self, guild_id, now=None):
+        """Record a join and return True if the guild is in raid mode"""
+        now = time.time() if now is None else now
+        joins = self.joins[guild_id]
+        joins.append(now)
+        if len(joins) == JOIN_RAID_THRESHOLD and joins[0] >= now - JOIN_WINDOW:
+            self.raid_until[guild_id] = now + RAID_MODE_COOLDOWN
+        return self.in_raid_mode(guild_id, now)
+
+    def in_raid_mode(self, guild_id, now=None):
+        """Check if a guild is currently in raid mode"""
+        now = time.time() if now is None else now
+        raid_until = self.raid_until.get(guild_id)
+        if raid_until is None:
+            return False
+        if now >= raid_until:
+            del self.raid_until[guild_id]
+            return False
+        return True
+
+    def recent_joins(self, guild_id, now=None):
+        """Number of joins inside the window, capped at the raid threshold"""
+        now = time.time() if now is None else now
+        return sum(1 for t in self.joins.get(guild_id, ()) if t >= now - JOIN_WINDOW)
+
+class WelcomeQueue:
+    """Bounded, deduplicated queue of welcome DMs with an overflow digest"""
+
+    def __init__(self, maxsize=WELCOME_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.pending = OrderedDict()  # (guild_id, member_id) -> payload
+        self.recent = OrderedDict()  # (guild_id, member_id) already sent or dropped
+        self.dropped = defaultdict(dict)  # guild_id -> {member_id: None} waiting for the digest
+        self.ready = asyncio.Event()
+        self.dropped_count = 0
+
+    def _remember(self, key):
+        self.recent[key] = None
+        self.recent.move_to_end(key)
+        if len(self.recent) > WELCOME_RECENT_SIZE:
+            self.recent.popitem(last=False)
+
+    def offer(self, guild_id, member_id, payload):
+        """Queue a welcome DM, returns False if it was a duplicate or went to the digest"""
+        key = (guild_id, member_id)
+        if key in self.pending or key in self.recent:
+            return False
+        if len(self.pending) >= self.maxsize:
+            self.drop(guild_id, member_id)
+            return False
+        self.pending[key] = payload
+        self.ready.set()
+        return True
+
+    def drop(self, guild_id, member_id):
+        """Skip the DM and list the member in the verification-channel digest"""
+        key = (guild_id, member_id)
+        self.pending.pop(key, None)
+        self._remember(key)
+        if member_id not in self.dropped[guild_id]:
+            self.dropped[guild_id][member_id] = None
+            self.dropped_count += 1
+
+    async def get(self):
+        """Wait for the next pending welcome DM"""
+        while not self.pending:
+            self.ready.clear()
+            await self.ready.wait()
+        key, payload = self.pending.popitem(last=False)
+        self._remember(key)
+        return key[0], key[1], payload
+
+    def take_dropped(self):
+        """Return and clear the digest backlog as {guild_id: [member_id, ...]}"""
+        dropped = {guild_id: list(members) for guild_id, members in self.dropped.items()}
+        self.dropped.clear()
+        return dropped
+
+def _benchmark(total=50000, raid_every=20):
+    """Replay synthetic traffic through the detector and print throughput"""
+    import random
+
+    rng = random.Random(1234)
+    words = ['boost', 'rank', 'price', 'ticket', 'help', 'thanks', 'order', 'champion',
+             'grand', 'diamond', 'season', 'reward', 'when', 'can', 'you', 'start', 'today']
+    raid_links = [f"FREE NITRO https://discord-gift{i}.example/claim?ref={i}" for i in range(5)]
+
+    messages = []
+    for i in range(total):
+        if i % raid_every == 0:
+            content = rng.choice(raid_links) + ' ' + '\u200b' * rng.randint(0, 3)
+            author = 10_000_000 + i
+        else:
+            content = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 15)))
+            author = rng.randint(1, 5000)
+        messages.append((rng.randint(1, 3), rng.randint(1, 50), author, content, object()))
+
+    detector = RaidDetector()
+    now = 1_700_000_000.0
+    flagged = 0
+    start = time.perf_counter()
+    for i, (guild_id, channel_id, author, content, ref) in enumerate(messages):
+        # 10k messages per simulated second
+        flagged += len(detector.observe(guild_id, channel_id, author, content, ref, now + i / 10_000))
+    elapsed = time.perf_counter() - start
+
+    print(f"Replayed {total} messages in {elapsed:.3f}s ({total / elapsed:,.0f} msg/s)")
+    print(f"Flagged {flagged} raid messages, {sum(len(w.clusters) for w in detector.windows.values())} live clusters")
+
+async def _benchmark_join_burst(total=1000, burst_seconds=10, dm_latency=0.05):
+    """Simulate a join burst through the guard and welcome queue"""
+    tracker = JoinRateTracker()
+    queue = WelcomeQueue()
+    guild_id = 1
+    sent = []
+    max_depth = 0
+
+    async def worker():
+        while True:
+            _, member_id, _ = await queue.get()
+            # Joiners queued before raid mode kicked in still go to the digest
+            if tracker.in_raid_mode(guild_id):
+                queue.drop(guild_id, member_id)
+                continue
+            await asyncio.sleep(dm_latency)
+            sent.append(member_id)
+            await asyncio.sleep(WELCOME_DM_INTERVAL / 100)  # Time-compressed pacing
+
+    task = asyncio.create_task(worker())
+    start = time.perf_counter()
+    handler_time = 0.0
+    for i in range(total):
+        member_id = 1_000_000 + i % (total - total // 20)  # ~5% duplicate join events
+        t0 = time.perf_counter()
+        if tracker.record(guild_id):
+            queue.drop(guild_id, member_id)
+        else:
+            queue.offer(guild_id, member_id, None)
+        handler_time += time.perf_counter() - t0
+        max_depth = max(max_depth, len(queue.pending))
+        await asyncio.sleep(burst_seconds / total / 100)
+    while queue.pending:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+
+    digest = queue.take_dropped()
+    print(f"Join burst: {total} joins, {len(sent)} DMs sent, {sum(len(v) for v in digest.values())} members in digest")
+    print(f"Handler cost {handler_time / total * 1e6:.1f}us/join, max queue depth {max_depth}, drained in {elapsed:.2f}s")
+
+def _selftest():
+    """Expired clusters leave no index entries behind"""
+    detector = RaidDetector()
+    now = 1_700_000_000.0
+    text = "FREE NITRO for everyone who joins https://example.org/claim today, limited offer for the first hundred members"
+    near = "x" + text[1:]  # 2 bits away from text
+    detector.observe(1, 1, 1, text, object(), now)
+    detector.observe(1, 1, 2, near, object(), now + 1)
+
+    # Both texts expire with their cluster, a repost starts a new one
+    later = now + RAID_WINDOW + 10
+    for author in range(3, 3 + RAID_DUPLICATE_USERS):
+        detector.observe(1, 1, author, near, object(), later)
+    for window in detector.windows.values():
+        live = set(window.clusters)
+        assert all(cluster_id in live for cluster_id in window.index.values()), window.index
+        assert len(window.clusters) == 1
+
+    # Expiring everything empties the index
+    for window in detector.windows.values():
+        window.expire(later + RAID_WINDOW + 10)
+        assert not window.index and not window.clusters
+    print("Expired clusters removed from the index")
+
+    # The same cheer from several members across channels: no guild-wide raid...
+    detector = RaidDetector()
+    cheer = "Congrats on the win, well deserved!"
+    hits = [detector.observe(1, author % 3, author, cheer, object(), now + author) for author in range(RAID_DUPLICATE_USERS)]
+    assert not any(hits), hits
+    # ...unless it carries a raid signal
+    hits = [detector.observe(1, author % 3, author, cheer, object(), now + author, raid_signal=True)
+            for author in range(RAID_DUPLICATE_USERS)]
+    assert len(hits[-1]) == RAID_DUPLICATE_USERS
+    print("Guild-wide clusters need a link or a raid signal")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
+    if len(sys.argv) < 2 or sys.argv[1] == "messages":
+        _benchmark()
+    if len(sys.argv) < 2 or sys.argv[1] == "joins":
+        asyncio.run(_benchmark_join_burst())
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image  # Optional, only used for thumbnails
+except ImportError:
+    Image = None
+
+# Attachment mirror settings
+MIRROR_DIR = os.getenv('ATTACHMENT_MIRROR_DIR', 'attachment_mirror')  # Content-addressed file store
+MIRROR_BASE_URL = os.getenv('ATTACHMENT_BASE_URL', '').rstrip('/')  # Public URL of the keep-alive server
+MIRROR_WORKERS = 4  # Concurrent downloads (and pooled HTTP connections)
+MIRROR_MAX_BYTES = 25 * 1024 * 1024  # Larger attachments keep their CDN link
+MIRROR_TIMEOUT = 20  # Seconds per download
+MIRROR_TOTAL_TIMEOUT = 30  # Seconds a ticket close waits for all its downloads, the rest keep their CDN link
+MIRROR_CACHE_SIZE = 10000  # Source URLs remembered across transcripts
+THUMBNAIL_SIZE = (320, 320)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+logger = logging.getLogger(__name__)
+
+# Stored names look like "ab/<sha256>.png" or "ab/<sha256>_thumb.png"
+STORED_NAME_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}(_thumb)?\.[a-z0-9]{1,8}$')
+
+class MirroredFile:
+    __slots__ = ('name', 'size', 'url', 'thumbnail_url')
+
+    def __init__(self, name, size, url, thumbnail_url=None):
+        self.name = name
+        self.size = size
+        self.url = url
+        self.thumbnail_url = thumbnail_url
+
+def source_key(url):
+    """Attachment URL without the expiring signature query"""
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+def file_extension(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if re.fullmatch(r'\.[a-z0-9]{1,8}', ext) else '.bin'
+
+class AttachmentMirror:
+    """Copies ticket attachments to a content-addressed store before CDN links expire
+
+    Downloads run on a bounded thread pool sharing one pooled HTTP session;
+    thumbnails are generated in the same worker threads, off the event loop.
+    Identical files are stored once.
+    """
+
+    def __init__(self, directory=MIRROR_DIR, base_url=MIRROR_BASE_URL, workers=MIRROR_WORKERS):
+        self.directory = directory
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='attachment-mirror')
+        self.mirrored = OrderedDict()  # source key -> MirroredFile
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.deduplicated = 0
+        self.failures = 0
+
+    @property
+    def enabled(self):
+        # Without a public URL the copies could not be linked from a transcript
+        return bool(self.base_url)
+
+    def path(self, name):
+        return os.path.join(self.directory, *name.split('/'))
+
+    def has_copy(self, url):
+        return source_key(url) in self.mirrored
+
+    def _public_url(self, name):
+        return f"{self.base_url}/attachments/{name}"
+
+    def _write(self, name, data):
+        """Write a file once; concurrent writers of the same content are harmless"""
+        path = self.path(name)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def _thumbnail(self, data, digest):
+        if Image is None:
+            return None
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                out = io.BytesIO()
+                image.convert('RGB').save(out, 'JPEG', quality=80)
+        except Exception:
+            return None
+        name = f"{digest[:2]}/{digest}_thumb.jpg"
+        self._write(name, out.getvalue())
+        return name
+
+    def _download(self, url, filename):
+        """Worker thread: download, store and thumbnail one attachment"""
+        with self.session.get(url, stream=True, timeout=MIRROR_TIMEOUT) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > MIRROR_MAX_BYTES:
+                    raise ValueError(f"{filename} is larger than {MIRROR_MAX_BYTES} bytes")
+                chunks.append(chunk)
+        data = b''.join(chunks)
+
+        digest = hashlib.sha256(data).hexdigest()
+        ext = file_extension(filename)
+        name = f"{digest[:2]}/{digest}{ext}"
+        written = self._write(name, data)
+
+        thumbnail = self._thumbnail(data, digest) if ext in IMAGE_EXTENSIONS else None
+        with self.lock:
+            self.downloads += 1
+            if not written:
+                self.deduplicated += 1
+        return MirroredFile(
+            name,
+            len(data),
+            self._public_url(name),
+            self._public_url(thumbnail) if thumbnail else None
+        )
+
+    async def mirror_all(self, attachments, timeout=MIRROR_TOTAL_TIMEOUT):
+        """Mirror attachments, returns {attachment url: MirroredFile}
+
+        Attachments that fail to download, or are not done after timeout
+        seconds in total, are left out and keep their CDN link.
+        """
+        if not self.enabled:
+            return {}
+
+        loop = asyncio.get_running_loop()
+        results = {}
+        pending = {}  # source key -> (future, urls)
+        for attachment in attachments:
+            key = source_key(attachment.url)
+            cached = self.mirrored.get(key)
+            if cached is not None:
+                results[attachment.url] = cached
+                continue
+            if key in pending:
+                pending[key][1].append(attachment.url)
+                continue
+            future = loop.run_in_executor(self.executor, self._download, attachment.url, attachment.filename)
+            pending[key] = (future, [attachment.url])
+
+        if pending:
+            _, late = await asyncio.wait([future for future, _ in pending.values()], timeout=timeout)
+            if late:
+                logger.warning(f"Attachment mirror: {len(late)} download(s) not done after {timeout}s, keeping their CDN links")
+                for future in late:
+                    future.cancel()  # Queued downloads are dropped, running ones finish in the background
+
+        for key, (future, urls) in pending.items():
+            if future.cancelled():
+                self.failures += 1
+                continue
+            try:
+                mirrored = future.result()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Attachment mirror: download of {key} failed: {e}")
+                continue
+            self.mirrored[key] = mirrored
+            while len(self.mirrored) > MIRROR_CACHE_SIZE:
+                self.mirrored.popitem(last=False)
+            for url in urls:
+                results[url] = mirrored
+        return results
+
+def _selftest(files=40, duplicates=3, delay=0.05):
+    """Mirror attachments from a local HTTP stand-in of the CDN"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from types import SimpleNamespace
+
+    active = 0
+    peak = 0
+    counter_lock = threading.Lock()
+
+    class CDNHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            nonlocal active, peak
+            with counter_lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(delay * 20 if 'slow=1' in self.path else delay)
+            # /<n>/file.png?ex=... : every `duplicates` paths share the same bytes
+            number = int(self.path.split('/')[1])
+            body = f"attachment payload {number // duplicates}".encode() * 100
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with counter_lock:
+                active -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CDNHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        mirror = AttachmentMirror(directory, 'https://bot.example', workers=MIRROR_WORKERS)
+        attachments = [SimpleNamespace(filename=f"file{i}.png", url=f"{base}/{i}/file{i}.png?ex=1&hm=abc")
+                       for i in range(files)]
+        # The same attachment twice in one ticket is downloaded once
+        attachments.append(attachments[0])
+
+        start = time.perf_counter()
+        results = asyncio.run(mirror.mirror_all(attachments))
+        elapsed = time.perf_counter() - start
+
+        stored = sum(len(names) for _, _, names in os.walk(directory))
+        print(f"Mirrored {len(results)} attachment URLs in {elapsed:.2f}s: {mirror.downloads} downloads, "
+              f"{stored} files stored ({mirror.deduplicated} duplicates), {mirror.failures} failures")
+        print(f"Peak concurrent downloads {peak} (limit {MIRROR_WORKERS})")
+        assert mirror.downloads == files
+        assert stored == -(-files // duplicates)
+        assert peak <= MIRROR_WORKERS
+
+        # Slow downloads past the total timeout keep their CDN link instead of holding up the close
+        slow = [SimpleNamespace(filename=f"slow{i}.png", url=f"{base}/{files + i}/slow{i}.png?slow=1")
+                for i in range(MIRROR_WORKERS * 2)]
+        logging.disable(logging.WARNING)
+        start = time.perf_counter()
+        results = asyncio.run(mirror.mirror_all(attachments[:1] + slow, timeout=delay * 4))
+        elapsed = time.perf_counter() - start
+        logging.disable(logging.NOTSET)
+        print(f"{len(slow)} slow downloads cut off after {elapsed:.2f}s, {len(results)} mirrored URL(s) kept")
+        assert list(results) == [attachments[0].url] and elapsed < delay * 10
+        assert mirror.failures == len(slow)
+    server.shutdown()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
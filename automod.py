@@ -0,0 +1,278 @@
+import re
+import sys
+from collections import deque
+
+# Automod settings
+AUTOMOD_MAX_RULES = 5000  # Blocked terms plus patterns per guild
+AUTOMOD_MAX_PATTERN = 200  # Characters per regex pattern
+AUTOMOD_DELTA_MIN = 32  # Terms added since the last full build before it is redone...
+AUTOMOD_DELTA_RATIO = 8  # ...or 1/8 of the built terms, whichever is larger
+
+RULE_KINDS = ('term', 'pattern')
+
+class AhoCorasick:
+    """Automaton matching any number of terms in one pass over the text
+
+    Cost depends on the text length, not on how many terms are blocked.
+    """
+    __slots__ = ('goto', 'fail', 'output')
+
+    def __init__(self, terms):
+        self.goto = [{}]  # node -> {char: node}
+        self.output = [None]  # node -> a term ending here (directly or through fail links)
+        for term in terms:
+            node = 0
+            for char in term:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.output.append(None)
+                node = next_node
+            self.output[node] = term
+
+        # Breadth-first failure links
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if self.goto[fallback].get(char, 0) != child else 0
+                if self.output[child] is None:
+                    self.output[child] = self.output[self.fail[child]]
+
+    def search(self, text, ignore=()):
+        """First blocked term found in text (already casefolded), or None"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            term = output[node]
+            if term is not None:
+                if term not in ignore:
+                    return term
+                # A removed term: look for another one ending here
+                fallback = fail[node]
+                while fallback:
+                    term = output[fallback]
+                    if term is None:
+                        break
+                    if term not in ignore:
+                        return term
+                    fallback = fail[fallback]
+        return None
+
+class GuildFilter:
+    """Blocked terms and patterns of one guild
+
+    Terms live in a built automaton plus a small delta automaton of terms
+    added since; removed terms are ignored until the next full build. The
+    full build only runs once the delta or the removals grow large, so
+    editing the list of a guild with thousands of terms stays cheap.
+    Patterns are combined into one regex.
+    """
+
+    def __init__(self, rules=()):
+        self.terms = set()
+        self.patterns = set()
+        self.built_terms = set()
+        self.automaton = AhoCorasick(())
+        self.delta_terms = set()
+        self.delta = AhoCorasick(())
+        self.removed = set()  # Built terms that were removed since
+        self.regex = None
+        self.full_builds = 0
+        for kind, value in rules:
+            (self.terms if kind == 'term' else self.patterns).add(value)
+        self._rebuild_terms()
+        self._rebuild_patterns()
+
+    def __len__(self):
+        return len(self.terms) + len(self.patterns)
+
+    def _rebuild_terms(self):
+        self.built_terms = set(self.terms)
+        self.automaton = AhoCorasick(sorted(self.built_terms))
+        self.delta_terms = set()
+        self.delta = AhoCorasick(())
+        self.removed = set()
+        self.full_builds += 1
+
+    @staticmethod
+    def _compile_patterns(patterns):
+        return re.compile("|".join(f"(?:{pattern})" for pattern in sorted(patterns)), re.IGNORECASE) if patterns else None
+
+    def _rebuild_patterns(self):
+        self.regex = self._compile_patterns(self.patterns)
+
+    def _compact(self):
+        limit = max(AUTOMOD_DELTA_MIN, len(self.built_terms) // AUTOMOD_DELTA_RATIO)
+        if len(self.delta_terms) > limit or len(self.removed) > limit:
+            self._rebuild_terms()
+
+    def add(self, kind, value):
+        """Add a rule, raises ValueError if a pattern does not combine with the others"""
+        if kind == 'pattern':
+            try:
+                regex = self._compile_patterns(self.patterns | {value})
+            except re.error as e:
+                raise ValueError(f"Invalid pattern: {e}")
+            self.patterns.add(value)
+            self.regex = regex
+            return
+        if value in self.terms:
+            return
+        self.terms.add(value)
+        if value in self.removed:
+            self.removed.discard(value)
+        else:
+            self.delta_terms.add(value)
+            self.delta = AhoCorasick(sorted(self.delta_terms))
+        self._compact()
+
+    def remove(self, kind, value):
+        if kind == 'pattern':
+            self.patterns.discard(value)
+            self._rebuild_patterns()
+            return
+        if value not in self.terms:
+            return
+        self.terms.discard(value)
+        if value in self.delta_terms:
+            self.delta_terms.discard(value)
+            self.delta = AhoCorasick(sorted(self.delta_terms))
+        else:
+            self.removed.add(value)
+        self._compact()
+
+    def match(self, content):
+        """('term' or 'pattern', what matched) for the first rule the content breaks, else None"""
+        if not content:
+            return None
+        text = content.casefold()
+        term = self.automaton.search(text, self.removed)
+        if term is None and self.delta_terms:
+            term = self.delta.search(text)
+        if term is not None:
+            return ('term', term)
+        if self.regex is not None:
+            found = self.regex.search(content)
+            if found:
+                return ('pattern', found.group(0))
+        return None
+
+def normalize_rule(kind, value):
+    """Validated rule value, raises ValueError with a message for the user"""
+    if kind not in RULE_KINDS:
+        raise ValueError(f"Unknown rule type {kind}")
+    value = value.strip()
+    if not value:
+        raise ValueError("The rule is empty")
+    if kind == 'term':
+        return value.casefold()
+    if len(value) > AUTOMOD_MAX_PATTERN:
+        raise ValueError(f"Patterns are limited to {AUTOMOD_MAX_PATTERN} characters")
+    # Checked the way it is matched: wrapped in a group and joined with the other patterns
+    try:
+        compiled = re.compile(f"(?:{value})", re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern: {e}")
+    if compiled.groupindex:
+        raise ValueError("Named groups are not supported, use (?:...) instead")
+    return value
+
+class Automod:
+    """Compiled filters of every guild"""
+
+    def __init__(self):
+        self.filters = {}  # guild_id -> GuildFilter
+
+    def load(self, guild_id, rules):
+        self.filters[guild_id] = GuildFilter(rules)
+
+    def add(self, guild_id, kind, value):
+        guild_filter = self.filters.get(guild_id)
+        if guild_filter is None:
+            guild_filter = self.filters[guild_id] = GuildFilter()
+        guild_filter.add(kind, value)
+
+    def remove(self, guild_id, kind, value):
+        guild_filter = self.filters.get(guild_id)
+        if guild_filter is not None:
+            guild_filter.remove(kind, value)
+
+    def drop_guild(self, guild_id):
+        self.filters.pop(guild_id, None)
+
+    def match(self, guild_id, content):
+        guild_filter = self.filters.get(guild_id)
+        if guild_filter is None:
+            return None
+        return guild_filter.match(content)
+
+def _benchmark(messages=2000):
+    """Automaton versus a loop of `in` checks, as the term list grows"""
+    import random
+    import time
+
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 9))) for _ in range(3000)]
+    texts = [" ".join(rng.choice(words) for _ in range(rng.randint(5, 40))) for _ in range(messages)]
+
+    print(f"{'terms':>6}{'naive':>12}{'automaton':>12}  per message")
+    for count in (10, 100, 1000, 5000):
+        terms = sorted({"".join(rng.choice(alphabet) for _ in range(rng.randint(6, 12))) for _ in range(count)})
+        guild_filter = GuildFilter(('term', term) for term in terms)
+
+        start = time.perf_counter()
+        naive = [next((term for term in terms if term in text.casefold()), None) for text in texts]
+        naive_time = (time.perf_counter() - start) / messages
+
+        start = time.perf_counter()
+        matched = [guild_filter.match(text) for text in texts]
+        automaton_time = (time.perf_counter() - start) / messages
+
+        assert [m is not None for m in matched] == [n is not None for n in naive]
+        print(f"{len(terms):>6}{naive_time * 1e6:>10.1f}us{automaton_time * 1e6:>10.1f}us")
+
+    # Incremental edits: adding 100 terms to 5000 rebuilds only the delta
+    start = time.perf_counter()
+    for i in range(100):
+        guild_filter.add('term', f"newterm{i}")
+    elapsed = time.perf_counter() - start
+    print(f"100 additions to {len(terms)} terms in {elapsed * 1000:.1f}ms ({guild_filter.full_builds - 1} full rebuilds)")
+    assert guild_filter.match("buy NEWTERM99 now") == ('term', 'newterm9')  # Shortest blocked term ends first
+    guild_filter.remove('term', terms[0])
+    assert guild_filter.match(f"x {terms[0]} x") is None
+    guild_filter.add('term', terms[0])
+    assert guild_filter.match(f"x {terms[0]} x") == ('term', terms[0])
+
+    # Patterns that only fail once combined are rejected before they are stored
+    for pattern in ("(?i)free nitro", "(?P<x>gift)"):
+        try:
+            normalize_rule('pattern', pattern)
+        except ValueError:
+            continue
+        raise AssertionError(f"{pattern} should be rejected")
+    guild_filter.add('pattern', normalize_rule('pattern', r"free\s+nitro"))
+    try:
+        guild_filter.add('pattern', "(?i)steam gift")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a pattern breaking the combined regex should be rejected")
+    assert guild_filter.patterns == {r"free\s+nitro"} and guild_filter.match("FREE  nitro here") == ('pattern', "FREE  nitro")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "benchmark":
+        _benchmark()
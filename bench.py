@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+# Benchmarks never touch the shared state tables
+os.environ['STATE_BACKEND'] = 'memory'
+
+# vouch_db writes rows: it only runs against a scratch database, never the bot's DATABASE_URL
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL', '')
+if BENCH_DATABASE_URL:
+    os.environ['DATABASE_URL'] = BENCH_DATABASE_URL
+else:
+    os.environ.pop('DATABASE_URL', None)
+
+# Micro-benchmark settings
+BENCH_RESULTS_FILE = 'bench_results.json'  # Last recorded run, compared against on the next run
+BENCH_REPEAT = 5  # Best of this many repeats is reported
+DEFAULT_THRESHOLD = 0.20  # Slowdown versus the last run that counts as a regression
+BENCH_GUILD_ID = -1  # Vouch rows written by the DB benchmark, removed afterwards
+
+BENCHMARKS = []
+
+def benchmark(name, number, threshold=DEFAULT_THRESHOLD):
+    """Register a benchmark; the function runs `number` operations per call"""
+    def decorator(func):
+        BENCHMARKS.append(SimpleNamespace(name=name, func=func, number=number, threshold=threshold))
+        return func
+    return decorator
+
+def fake_transcript_messages(count, seed=0):
+    """Ticket history as seen by generate_html_transcript"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2026, 1, 1)
+    customer = SimpleNamespace(id=1, display_name="customer", bot=False)
+    staff = SimpleNamespace(id=2, display_name="staff", bot=False)
+    bot_user = SimpleNamespace(id=3, display_name="Voralith", bot=True)
+    messages = []
+    for i in range(count):
+        author = rng.choice((customer, customer, staff, bot_user))
+        attachments = []
+        if rng.random() < 0.05:
+            attachments.append(SimpleNamespace(filename=f"proof{i}.png", url=f"https://cdn.example/proof{i}.png"))
+        messages.append(SimpleNamespace(
+            author=author,
+            content=f"message {i}\n" + "lorem ipsum " * rng.randint(1, 30),
+            embeds=[],
+            attachments=attachments,
+            created_at=start + datetime.timedelta(seconds=30 * i)
+        ))
+    return messages
+
+def register_benchmarks(main):
+    """Benchmarks of the bot's CPU hot paths"""
+    channel = SimpleNamespace(name="ticket-customer", id=10)
+    closed_by = SimpleNamespace(display_name="staff", mention="<@2>")
+
+    from transcript import render_transcript, transcript_rows
+
+    generated_at = datetime.datetime(2026, 1, 1)
+    for count, number in ((100, 20), (1000, 5), (10000, 1)):
+        messages = fake_transcript_messages(count)
+
+        # End to end: from 1000 messages this goes through the render process pool
+        @benchmark(f"generate_html_transcript[{count}]", number)
+        async def transcript(messages=messages, number=number):
+            for _ in range(number):
+                await main.TicketCloseConfirmView.generate_html_transcript(None, channel, closed_by, messages)
+
+        # The rendering alone, in this process
+        rows = transcript_rows(messages)
+
+        @benchmark(f"render_transcript[{count}]", number)
+        async def render(rows=rows, number=number):
+            for _ in range(number):
+                render_transcript(channel.name, closed_by.display_name, generated_at, rows)
+
+    from simulator import FakeREST, FakeGateway, FakeMessage
+
+    gateway = FakeGateway(main, FakeREST(latency=0, jitter=0), guilds=1, channels=5, members=2000, sticky_channels=0)
+    members = list(gateway.members.values())
+    rng = random.Random(0)
+    words = "boost rank season reward tournament price order ticket help thanks legit fast carry grind".split()
+    spam_messages = [
+        # Varied text so the raid detector sees ordinary chat, not copies
+        FakeMessage(members[i], members[i].guild.text_channels[i % 5], " ".join(rng.choice(words) for _ in range(10)))
+        for i in range(2000)
+    ]
+
+    @benchmark("check_spam", len(spam_messages))
+    async def check_spam():
+        # Fresh state so no author reaches the spam limit
+        from antiraid import RaidDetector
+        main.bot_state.guilds.clear()
+        main.raid_detector = RaidDetector()
+        for message in spam_messages:
+            await main.check_spam(message)
+
+    from automod import GuildFilter
+
+    # 5000 blocked terms that never match, so every message is scanned to the end
+    term_rng = random.Random(1)
+    blocked = {"".join(term_rng.choice("qxzjkv") for _ in range(8)) for _ in range(5000)}
+    guild_filter = GuildFilter(('term', term) for term in blocked)
+    contents = [message.content for message in spam_messages]
+
+    @benchmark("automod_match[5000 terms]", len(contents))
+    async def automod_match():
+        for content in contents:
+            guild_filter.match(content)
+
+    from linkscan import LinkScanner
+
+    async def resolve_invite(code):
+        return None
+
+    link_scanner = LinkScanner(resolve_invite)
+    link_contents = [f"check https://example.com/item/{i % 50} and bit.ly/x{i % 10}" for i in range(1000)]
+
+    @benchmark("link_scan[cached]", len(link_contents))
+    async def link_scan():
+        for content in link_contents:
+            await link_scanner.scan(content, BENCH_GUILD_ID)
+
+    durations = ['30s', '15m', '2h', '7d', '1w', 'bad', '10x'] * 1000
+
+    @benchmark("parse_duration", len(durations))
+    async def parse_duration():
+        for duration in durations:
+            main.parse_duration(duration)
+
+    participants = list(range(100_000))
+
+    @benchmark("giveaway_join[100k]", 1000)
+    async def giveaway_join():
+        giveaway = {'id': 1, 'guild_id': 1, 'participants': participants.copy(), 'end_time': datetime.datetime(2026, 1, 1)}
+        main.bot_state.guild(1).add_giveaway(giveaway)
+        for user_id in range(200_000, 201_000):
+            if user_id not in giveaway['participants']:
+                main.state_backend.add_giveaway_participant(1, 1, user_id)
+        main.bot_state.guild(1).remove_giveaway(1)
+
+    from giveaway_draw import draw_winners
+
+    # One winner among 100k entrants without bonus entries, as end_giveaway draws it
+    @benchmark("giveaway_draw_single[100k]", 10)
+    async def giveaway_draw():
+        for seed in range(10):
+            draw_winners(participants, {}, 1, seed)
+
+    # 10% of entrants with 2 bonus entries, as with booster_entries=2
+    weights = {user_id: 3 for user_id in range(0, len(participants), 10)}
+
+    @benchmark("giveaway_draw_weighted[100k]", 1)
+    async def giveaway_draw_weighted():
+        draw_winners(participants, weights, 10, 0)
+
+    member = members[0]
+
+    @benchmark("embed_sticky", 1000)
+    async def embed_sticky():
+        for _ in range(1000):
+            await main.create_sticky_review_embed()
+
+    @benchmark("embed_welcome", 1000)
+    async def embed_welcome():
+        for _ in range(1000):
+            main.create_welcome_embed(member)
+
+    @benchmark("embed_rules", 1000)
+    async def embed_rules():
+        for _ in range(1000):
+            main.create_rules_embeds()
+
+    if main.DATABASE_URL:
+        main.init_database()
+
+        @benchmark("vouch_db", 50, threshold=0.50)
+        async def vouch_db():
+            for i in range(50):
+                main.get_next_vouch_number(BENCH_GUILD_ID)
+                main.save_vouch(BENCH_GUILD_ID, 1, "bench", f"benchmark vouch {i}", 5)
+            cleanup_vouches(main)
+
+def cleanup_vouches(main):
+    conn = main.get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM vouches WHERE guild_id = %s", (BENCH_GUILD_ID,))
+                cursor.execute("DELETE FROM vouch_counter WHERE guild_id = %s", (BENCH_GUILD_ID,))
+                conn.commit()
+        finally:
+            conn.close()
+
+async def run_benchmark(bench, repeat=BENCH_REPEAT):
+    """Best time per operation in microseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await bench.func()
+        best = min(best, time.perf_counter() - start)
+    return best / bench.number * 1e6
+
+def load_results(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def format_us(value):
+    if value is None:
+        return "-"
+    if value >= 1000:
+        return f"{value / 1000:.2f}ms"
+    return f"{value:.2f}us"
+
+async def _main(args):
+    import main
+
+    # Per-message info logs would dominate check_spam
+    main.logger.setLevel(logging.WARNING)
+    register_benchmarks(main)
+
+    previous = load_results(args.results)
+    previous_times = previous['results'] if previous else {}
+    if previous:
+        print(f"Comparing against run of {previous['recorded_at']}")
+    if not main.DATABASE_URL:
+        print("BENCH_DATABASE_URL not set, skipping vouch_db")
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<32}{'last':>12}{'now':>12}{'change':>10}  status")
+    for bench in BENCHMARKS:
+        if args.only and not any(name in bench.name for name in args.only):
+            continue
+        now = await run_benchmark(bench, args.repeat)
+        results[bench.name] = now
+        last = previous_times.get(bench.name)
+        if last:
+            change = now / last - 1
+            status = "REGRESSION" if change > bench.threshold else ("faster" if change < -bench.threshold else "ok")
+            if status == "REGRESSION":
+                regressions.append(bench.name)
+            change_text = f"{change:+.1%}"
+        else:
+            status, change_text = "new", "-"
+        print(f"{bench.name:<32}{format_us(last):>12}{format_us(now):>12}{change_text:>10}  {status}")
+
+    if not args.no_save:
+        # Keep results of benchmarks that were not run this time
+        with open(args.results, 'w', encoding='utf-8') as f:
+            json.dump({'recorded_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'python': sys.version.split()[0],
+                       'results': {**previous_times, **results}}, f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the bot's hot paths, compared with the last run")
+    parser.add_argument('only', nargs='*', help="Only run benchmarks whose name contains one of these")
+    parser.add_argument('--results', default=BENCH_RESULTS_FILE, help="Results file of the last run")
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT)
+    parser.add_argument('--no-save', action='store_true', help="Don't record this run")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Live embed settings
+EMBED_EDIT_INTERVAL = 15  # Seconds between edits of the same message
+EMBED_EDITS_PER_SECOND = 1  # Edit budget shared by every live message
+EMBED_TICK = 1  # Seconds between passes over the dirty set
+
+class EmbedUpdater:
+    """Coalesces frequent changes into rate-limited message edits
+
+    Callers only mark a key dirty. Every tick, dirty keys whose message was
+    not edited in the last `interval` seconds are edited with their latest
+    value, oldest change first, within a token bucket shared by all keys.
+    A key whose value equals what the message already shows is not edited.
+    """
+
+    def __init__(self, value, edit, interval=EMBED_EDIT_INTERVAL, edits_per_second=EMBED_EDITS_PER_SECOND, permanent_errors=()):
+        self.value = value  # value(key) -> current value, None once the key is gone
+        self.edit = edit  # async edit(key, value) -> writes the value to the message
+        self.permanent_errors = permanent_errors  # Edit errors not worth retrying (message deleted, no access)
+        self.interval = interval
+        self.edits_per_second = edits_per_second
+        self.tokens = edits_per_second
+        self.dirty = OrderedDict()  # key -> None, in the order keys first changed
+        self.shown = {}  # key -> value the message currently shows
+        self.last_edit = {}  # key -> monotonic time of the last edit
+        self.broken = set()  # Keys whose message can't be edited any more, ignored until forgotten
+        self.edits = 0
+        self.skipped = 0
+
+    def mark(self, key):
+        if key not in self.dirty and key not in self.broken:
+            self.dirty[key] = None
+
+    def forget(self, key):
+        self.dirty.pop(key, None)
+        self.shown.pop(key, None)
+        self.last_edit.pop(key, None)
+        self.broken.discard(key)
+
+    async def flush(self, now=None):
+        """Edit every due key the budget allows, returns the number of edits"""
+        now = time.monotonic() if now is None else now
+        edited = 0
+        for key in list(self.dirty):
+            if self.tokens < 1:
+                break
+            if now - self.last_edit.get(key, float('-inf')) < self.interval:
+                continue
+            del self.dirty[key]
+            value = self.value(key)
+            if value is None:
+                self.forget(key)
+                continue
+            if self.shown.get(key) == value:
+                self.skipped += 1
+                continue
+            self.tokens -= 1
+            self.last_edit[key] = now
+            try:
+                await self.edit(key, value)
+            except self.permanent_errors as e:
+                logger.warning(f"Live embed edit for {key} failed, no longer updating it: {e}")
+                self.forget(key)
+                self.broken.add(key)
+                continue
+            except Exception as e:
+                logger.warning(f"Live embed edit for {key} failed: {e}")
+                self.mark(key)  # Retried after the interval, the message still shows the old value
+                continue
+            self.shown[key] = value
+            self.edits += 1
+            edited += 1
+        return edited
+
+    async def run(self, tick=EMBED_TICK):
+        while True:
+            await asyncio.sleep(tick)
+            self.tokens = min(self.edits_per_second, self.tokens + self.edits_per_second * tick)
+            await self.flush()
+
+def _simulate(giveaways=5, joins_per_second=200, seconds=60):
+    """Simulated clock: bursty joins on several giveaways, count the edits"""
+    import random
+
+    counts = {key: 0 for key in range(giveaways)}
+    edits = []
+
+    async def edit(key, value):
+        edits.append((key, value))
+
+    async def simulate():
+        updater = EmbedUpdater(counts.get, edit)
+        rng = random.Random(0)
+        joins = 0
+        for second in range(seconds):
+            # Joins arrive in the first half of the run, mostly on giveaway 0
+            if second < seconds // 2:
+                for _ in range(joins_per_second):
+                    key = 0 if rng.random() < 0.6 else rng.randrange(giveaways)
+                    counts[key] += 1
+                    updater.mark(key)
+                    joins += 1
+            updater.tokens = min(updater.edits_per_second, updater.tokens + updater.edits_per_second)
+            await updater.flush(now=second)
+        return updater, joins
+
+    updater, joins = asyncio.run(simulate())
+    print(f"{joins} joins on {giveaways} giveaways over {seconds}s -> {updater.edits} edits "
+          f"({updater.skipped} skipped as unchanged), limit {EMBED_EDITS_PER_SECOND}/s and 1 per {EMBED_EDIT_INTERVAL}s per message")
+    assert updater.edits <= seconds * EMBED_EDITS_PER_SECOND
+    last_shown = {}
+    for key, value in edits:
+        last_shown[key] = value
+    assert last_shown == counts, "every message ends on its final count"
+
+    # A failed edit is retried once the interval has passed
+    attempts = []
+
+    async def flaky_edit(key, value):
+        attempts.append(value)
+        if len(attempts) == 1:
+            raise ConnectionError("simulated outage")
+
+    async def retry():
+        updater = EmbedUpdater({'a': 1}.get, flaky_edit)
+        updater.mark('a')
+        await updater.flush(now=0)
+        updater.tokens = 1
+        await updater.flush(now=EMBED_EDIT_INTERVAL)
+        return updater
+
+    logging.disable(logging.WARNING)
+    updater = asyncio.run(retry())
+    logging.disable(logging.NOTSET)
+    assert attempts == [1, 1] and updater.shown == {'a': 1} and not updater.dirty
+
+    # A deleted message is not retried, even when its value changes again
+    attempts.clear()
+
+    async def deleted_edit(key, value):
+        attempts.append(value)
+        raise LookupError("unknown message")
+
+    async def deleted():
+        updater = EmbedUpdater({'a': 1}.get, deleted_edit, permanent_errors=(LookupError,))
+        updater.mark('a')
+        await updater.flush(now=0)
+        updater.mark('a')
+        updater.tokens = 1
+        await updater.flush(now=EMBED_EDIT_INTERVAL)
+        return updater
+
+    logging.disable(logging.WARNING)
+    updater = asyncio.run(deleted())
+    logging.disable(logging.NOTSET)
+    assert attempts == [1] and not updater.dirty and updater.broken == {'a'}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "simulate":
+        _simulate()
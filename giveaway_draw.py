@@ -0,0 +1,198 @@
+import heapq
+import random
+import secrets
+import sys
+from array import array
+
+# Bonus entry kinds a giveaway can configure, on top of the 1 entry everyone gets
+BONUS_KINDS = ('booster', 'verified', 'customer')
+MAX_BONUS_ENTRIES = 10  # Per kind
+MAX_ENTRY_WEIGHT = 65535  # Entries per entrant that fit a snapshot's uint16 weights
+
+def new_seed():
+    """Cryptographically random draw seed, recorded so a draw can be replayed"""
+    return secrets.randbits(64)
+
+def entry_weight(bonus_entries, is_booster=False, is_verified=False, is_customer=False):
+    """Entries of one entrant: 1 plus every configured bonus they qualify for"""
+    weight = 1
+    if is_booster:
+        weight += bonus_entries.get('booster', 0)
+    if is_verified:
+        weight += bonus_entries.get('verified', 0)
+    if is_customer:
+        weight += bonus_entries.get('customer', 0)
+    return weight
+
+class AliasTable:
+    """Walker's alias table over integer weights
+
+    Built in O(n), each weighted draw is O(1): one uniform column, one
+    biased coin. Thresholds are exact integers so a seed replays identically.
+    """
+    __slots__ = ('items', 'total', 'threshold', 'alias')
+
+    def __init__(self, items, weights):
+        count = len(items)
+        self.items = items
+        self.total = sum(weights)
+        # Column i keeps item i with probability threshold[i] / total, else its alias
+        scaled = [weight * count for weight in weights]
+        self.threshold = [self.total] * count
+        self.alias = list(range(count))
+        small = [i for i, value in enumerate(scaled) if value < self.total]
+        large = [i for i, value in enumerate(scaled) if value >= self.total]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            self.threshold[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= self.total - scaled[s]
+            if scaled[l] < self.total:
+                small.append(large.pop())
+
+    def sample(self, rng):
+        column = rng.randrange(len(self.items))
+        if rng.randrange(self.total) < self.threshold[column]:
+            return self.items[column]
+        return self.items[self.alias[column]]
+
+class EntrantSnapshot:
+    """Frozen entrants of an ended giveaway, for the draw and later rerolls
+
+    Entrants are a sorted int64 array (8 bytes per entrant) with an aligned
+    uint16 weights array only when some entrant has bonus entries. Every draw
+    excludes the winners of earlier draws; each new winner costs O(1) expected
+    (the alias table is built once per snapshot and kept).
+    """
+    __slots__ = ('entrants', 'weights', 'winners', '_table')
+
+    def __init__(self, entrants, weights=None, winners=()):
+        self.entrants = entrants  # array('q'), sorted user ids
+        self.weights = weights  # array('H') aligned with entrants, None if everyone has 1 entry
+        self.winners = list(winners)  # Every user drawn so far, in draw order
+        self._table = None
+
+    @classmethod
+    def freeze(cls, participants, weights=None):
+        entrants = array('q', sorted(participants))
+        if not weights:
+            return cls(entrants)
+        return cls(entrants, array('H', (min(weights.get(user_id, 1), MAX_ENTRY_WEIGHT) for user_id in entrants)))
+
+    @classmethod
+    def from_bytes(cls, entrants, weights=None, winners=()):
+        return cls(_unpack('q', entrants), _unpack('H', weights) if weights else None, winners)
+
+    def entrants_bytes(self):
+        return _pack(self.entrants)
+
+    def weights_bytes(self):
+        return _pack(self.weights) if self.weights is not None else None
+
+    def draw(self, count, seed):
+        """Draw up to `count` winners not drawn before, same seed -> same winners"""
+        rng = random.Random(seed)
+        drawn = set(self.winners)
+        count = min(count, len(self.entrants) - len(drawn))
+        if count <= 0:
+            return []
+
+        if count * 2 > len(self.entrants) - len(drawn):
+            # Most remaining entrants win: sample the remaining ones directly
+            remaining = [i for i, user_id in enumerate(self.entrants) if user_id not in drawn]
+            if self.weights is None:
+                picks = rng.sample(remaining, count)
+            else:
+                # Weighted sampling without replacement (Efraimidis-Spirakis)
+                keys = {i: rng.random() ** (1 / self.weights[i]) for i in remaining}
+                picks = heapq.nlargest(count, remaining, key=keys.__getitem__)
+            new_winners = [self.entrants[i] for i in picks]
+        elif self.weights is None and not drawn:
+            new_winners = rng.sample(self.entrants, count)
+        else:
+            # Few winners: redraw the rare duplicate or earlier winner
+            if self.weights is None:
+                sample = lambda: self.entrants[rng.randrange(len(self.entrants))]
+            else:
+                if self._table is None:
+                    self._table = AliasTable(self.entrants, self.weights)
+                sample = lambda: self._table.sample(rng)
+            new_winners = []
+            while len(new_winners) < count:
+                user_id = sample()
+                if user_id not in drawn:
+                    drawn.add(user_id)
+                    new_winners.append(user_id)
+
+        self.winners.extend(new_winners)
+        return new_winners
+
+def _pack(values):
+    """Little-endian bytes of an array, whatever the machine"""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def draw_winners(participants, weights, count, seed):
+    """Draw up to `count` distinct winners
+
+    weights maps user_id -> entries for entrants with more than one entry.
+    Entrants are ordered by user id first, so (entrants, weights, seed)
+    always gives the same winners whatever order they were stored in.
+    """
+    return EntrantSnapshot.freeze(participants, weights).draw(count, seed)
+
+def _benchmark(entrants=100_000, winners=10, draws=2000):
+    """Draw speed and fairness for a large weighted giveaway"""
+    import time
+
+    participants = list(range(entrants))
+    weights = {user_id: 3 for user_id in range(0, entrants, 10)}  # 10% boosters with 2 bonus entries
+
+    start = time.perf_counter()
+    draw_winners(participants, weights, winners, new_seed())
+    elapsed = time.perf_counter() - start
+    print(f"{entrants} entrants, {len(weights)} weighted: {winners} winners in {elapsed * 1000:.1f}ms (sort + alias table + draws)")
+
+    start = time.perf_counter()
+    draw_winners(participants, {}, winners, new_seed())
+    print(f"Unweighted: {winners} winners in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    table = AliasTable(participants, [weights.get(user_id, 1) for user_id in participants])
+    rng = random.Random(new_seed())
+    start = time.perf_counter()
+    boosted = sum(1 for _ in range(draws * 100) if table.sample(rng) % 10 == 0)
+    elapsed = time.perf_counter() - start
+    expected = 3 * (entrants // 10) / (entrants + 2 * (entrants // 10))
+    print(f"{draws * 100} single draws in {elapsed * 1000:.0f}ms ({elapsed / (draws * 100) * 1e9:.0f}ns each)")
+    print(f"Boosters won {boosted / (draws * 100):.3f} of draws (expected {expected:.3f})")
+    assert abs(boosted / (draws * 100) - expected) < 0.01
+
+    # The recorded seed replays the same winners
+    seed = new_seed()
+    assert draw_winners(participants, weights, winners, seed) == draw_winners(list(reversed(participants)), weights, winners, seed)
+    assert len(set(draw_winners(participants[:20], weights, 15, seed))) == 15
+
+    # Rerolls from a stored snapshot never repeat a winner
+    snapshot = EntrantSnapshot.freeze(participants, weights)
+    first = snapshot.draw(winners, seed)
+    stored = EntrantSnapshot.from_bytes(snapshot.entrants_bytes(), snapshot.weights_bytes(), snapshot.winners)
+    start = time.perf_counter()
+    rerolled = [user_id for _ in range(100) for user_id in stored.draw(1, new_seed())]
+    elapsed = time.perf_counter() - start
+    assert len(set(first + rerolled)) == winners + 100
+    print(f"Snapshot {len(snapshot.entrants_bytes()) + len(snapshot.weights_bytes())} bytes, "
+          f"100 rerolls in {elapsed * 1000:.1f}ms (including the alias table build)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "benchmark":
+        _benchmark()
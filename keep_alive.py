@@ -1,4 +1,4 @@
-from flask import Flask, request, redirect, render_template_string
+from flask import Flask, request, redirect, render_template_string, jsonify, Response, send_from_directory
 from threading import Thread
 import logging
 import requests
@@ -7,12 +7,29 @@ import asyncio
 import json
 import discord
 import time
+from attachment_mirror import MIRROR_DIR, STORED_NAME_RE
 
 # Configure logging for keep-alive
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
 app = Flask('')
 
+# Status provider registered by main.py (importing main from here would build a second bot)
+status_provider = None
+
+def register_status_provider(provider):
+    """Register the function that returns the bot status for /status"""
+    global status_provider
+    status_provider = provider
+
+# Shared state backend registered by main.py, used to redeem each OAuth code only once
+state_backend = None
+
+def register_state_backend(backend):
+    """Register the shared state backend used to deduplicate OAuth callbacks"""
+    global state_backend
+    state_backend = backend
+
 @app.route('/')
 def home():
     return '''
@@ -244,6 +261,123 @@ def home():
     </html>
     '''
 
+@app.route('/status')
+def status():
+    """Bot status with per-shard latency, as HTML or JSON (?format=json)"""
+    if status_provider is None:
+        return jsonify({'ready': False, 'error': 'Bot not started'}), 503
+    
+    try:
+        data = status_provider()
+    except Exception as e:
+        return jsonify({'ready': False, 'error': str(e)}), 500
+    
+    if request.args.get('format') == 'json':
+        return jsonify(data)
+    
+    return render_template_string('''
+    <html>
+        <head>
+            <title>Voralith - Status</title>
+            <meta http-equiv="refresh" content="15">
+            <style>
+                body { font-family: Arial, sans-serif; text-align: center; padding: 50px; background-color: #2c2f33; color: #ffffff; }
+                .container { max-width: 800px; margin: 0 auto; background-color: #36393f; padding: 40px; border-radius: 10px; }
+                table { width: 100%; border-collapse: collapse; margin-top: 20px; }
+                th, td { padding: 10px; border-bottom: 1px solid #5B2C6F; }
+                th { color: #c9a9dd; }
+                .ok { color: #57f287; }
+                .down { color: #ff4444; }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>Voralith Status</h1>
+                <p class="{{ 'ok' if data.ready else 'down' }}">{{ '✅ Ready' if data.ready else '❌ Not ready' }}
+                    {% if data.sharded %}&middot; {{ data.shard_count }} shard(s){% endif %}</p>
+                {% if data.load %}
+                <p class="{{ 'down' if data.load.state == 'degraded' else 'ok' }}">Load: {{ data.load.state }}
+                    &middot; loop lag {{ data.load.lag_ms }} ms (p99 {{ data.load.lag_p99_ms }} ms)
+                    &middot; {{ data.load.queue_depth }} pending tasks</p>
+                {% endif %}
+                <table>
+                    <tr><th>Shard</th><th>Latency</th><th>Guilds</th><th>State partitions</th><th>Connection</th></tr>
+                    {% for shard in data.shards %}
+                    <tr>
+                        <td>{{ shard.shard_id }}</td>
+                        <td>{{ '%.1f ms' % shard.latency_ms if shard.latency_ms is not none else 'n/a' }}</td>
+                        <td>{{ shard.guilds }}</td>
+                        <td>{{ shard.state_partitions }}</td>
+                        <td class="{{ 'down' if shard.closed else 'ok' }}">{{ 'closed' if shard.closed else 'open' }}</td>
+                    </tr>
+                    {% endfor %}
+                </table>
+                {% if data.load and data.load.transitions %}
+                <table>
+                    <tr><th>Load transition</th><th>Reason</th></tr>
+                    {% for transition in data.load.transitions|reverse %}
+                    <tr>
+                        <td>{{ transition.from }} &rarr; {{ transition.to }}</td>
+                        <td>{{ transition.reason }}</td>
+                    </tr>
+                    {% endfor %}
+                </table>
+                {% endif %}
+            </div>
+        </body>
+    </html>
+    ''', data=data)
+
+@app.route('/metrics')
+def metrics():
+    """Bot metrics in Prometheus text format"""
+    if status_provider is None:
+        return Response("# bot not started\n", status=503, mimetype='text/plain')
+    
+    data = status_provider()
+    lines = [f"voralith_ready {int(data['ready'])}"]
+    for shard in data['shards']:
+        if shard['latency_ms'] is not None:
+            lines.append(f"voralith_gateway_latency_ms{{shard=\"{shard['shard_id']}\"}} {shard['latency_ms']}")
+        lines.append(f"voralith_guilds{{shard=\"{shard['shard_id']}\"}} {shard['guilds']}")
+    
+    load = data.get('load')
+    if load:
+        lines.append(f"voralith_degraded {int(load['state'] == 'degraded')}")
+        lines.append(f"voralith_loop_lag_ms {load['lag_ms']}")
+        lines.append(f"voralith_loop_lag_ms_p50 {load['lag_p50_ms']}")
+        lines.append(f"voralith_loop_lag_ms_p99 {load['lag_p99_ms']}")
+        lines.append(f"voralith_loop_lag_ms_max {load['lag_max_ms']}")
+        lines.append(f"voralith_pending_tasks {load['queue_depth']}")
+        lines.append(f"voralith_load_transitions_total {load['transition_count']}")
+        for kind, count in load['shed'].items():
+            lines.append(f"voralith_shed_total{{kind=\"{kind}\"}} {count}")
+    
+    for handler, stats in data.get('interactions', {}).items():
+        label = f"handler=\"{handler}\""
+        lines.append(f"voralith_interactions_total{{{label}}} {stats['count']}")
+        lines.append(f"voralith_interaction_errors_total{{{label}}} {stats['errors']}")
+        lines.append(f"voralith_interaction_denied_total{{{label}}} {stats['denied']}")
+        lines.append(f"voralith_interaction_late_acks_total{{{label}}} {stats['late_acks']}")
+        lines.append(f"voralith_interaction_auto_defers_total{{{label}}} {stats['auto_defers']}")
+        lines.append(f"voralith_interaction_ack_ms{{{label},quantile=\"0.5\"}} {stats['ack_p50_ms']}")
+        lines.append(f"voralith_interaction_ack_ms{{{label},quantile=\"0.99\"}} {stats['ack_p99_ms']}")
+        lines.append(f"voralith_interaction_reply_ms{{{label},quantile=\"0.5\"}} {stats['reply_p50_ms']}")
+        lines.append(f"voralith_interaction_reply_ms{{{label},quantile=\"0.99\"}} {stats['reply_p99_ms']}")
+        lines.append(f"voralith_interaction_total_ms{{{label},quantile=\"0.5\"}} {stats['total_p50_ms']}")
+        lines.append(f"voralith_interaction_total_ms{{{label},quantile=\"0.99\"}} {stats['total_p99_ms']}")
+        lines.append(f"voralith_interaction_db_ms_avg{{{label}}} {stats['db_avg_ms']}")
+        lines.append(f"voralith_interaction_rest_ms_avg{{{label}}} {stats['rest_avg_ms']}")
+    
+    return Response("\n".join(lines) + "\n", mimetype='text/plain')
+
+@app.route('/attachments/<path:name>')
+def mirrored_attachment(name):
+    """Serve ticket attachments mirrored for transcripts"""
+    if not STORED_NAME_RE.match(name):
+        return "Not found", 404
+    return send_from_directory(os.path.abspath(MIRROR_DIR), name, max_age=31536000)
+
 # OAuth2 callback route for Discord authorization
 @app.route('/oauth/callback')
 def oauth_callback():
@@ -285,8 +419,12 @@ def oauth_callback():
         
         print(f"Parsed user_id: {user_id}, guild_id: {guild_id}")
         
-        # Exchange code for access token
-        token_data = exchange_code_for_token(code)
+        # Exchange code for access token (once, even if several processes get the redirect)
+        if state_backend is not None and not state_backend.claim('oauth_code', code):
+            print(f"OAuth code {code[:10]}... already claimed by another process")
+            token_data = None
+        else:
+            token_data = exchange_code_for_token(code)
         print(f"Token exchange result: {token_data is not None}")
         
         if token_data:
@@ -416,8 +554,12 @@ def oauth2_authorized():
         
         print(f"Parsed user_id: {user_id}, guild_id: {guild_id}")
         
-        # Exchange code for access token
-        token_data = exchange_code_for_token(code)
+        # Exchange code for access token (once, even if several processes get the redirect)
+        if state_backend is not None and not state_backend.claim('oauth_code', code):
+            print(f"OAuth code {code[:10]}... already claimed by another process")
+            token_data = None
+        else:
+            token_data = exchange_code_for_token(code)
         print(f"Token exchange result: {token_data is not None}")
         
         if token_data:
@@ -549,7 +691,7 @@ def assign_verified_role(user_id, guild_id, token_data):
 async def _assign_role_async(user_id, guild_id, token_data):
     """Async function to assign the verified role"""
     try:
-        from main import bot, logger
+        from main import bot, logger, member_lookup
         
         # Get the guild
         if guild_id and guild_id != 'dm':
@@ -562,8 +704,8 @@ async def _assign_role_async(user_id, guild_id, token_data):
             print("Guild not found")
             return False
         
-        # Get the user
-        user = guild.get_member(int(user_id))
+        # Get the user (members are not necessarily cached, see MEMBER_CACHE)
+        user = await member_lookup.get(guild, int(user_id))
         if not user:
             print(f"User {user_id} not found in guild {guild.name}")
             return False
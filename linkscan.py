@@ -0,0 +1,278 @@
+import asyncio
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+# Link scanner settings
+LINK_CACHE_SIZE = 20000  # Verdicts remembered (raw links and invite codes)
+LINK_CACHE_TTL = 3600  # Seconds a domain verdict is trusted
+INVITE_CACHE_TTL = 600  # Seconds a resolved invite is trusted (invites get deleted or moved)
+LINK_MAX_PER_MESSAGE = 20  # Links checked in one message, the rest are ignored
+
+# Discord invite links: discord.gg/<code>, discord.com/invite/<code>, discordapp.com/invite/<code>
+INVITE_HOSTS = {'discord.gg': '/', 'discord.com': '/invite/', 'discordapp.com': '/invite/'}
+INVITE_CODE_RE = re.compile(r'^[A-Za-z0-9-]{2,32}$')
+
+ALLOWED_DOMAINS = {
+    'discord.com', 'discordapp.com', 'discordapp.net', 'discord.media', 'discord.gg',
+    'discord.gift', 'discord.new', 'discord.dev', 'discordstatus.com',
+    'tenor.com', 'giphy.com', 'imgur.com', 'youtube.com', 'youtu.be', 'twitch.tv',
+    'rocketleague.com', 'epicgames.com', 'steampowered.com', 'steamcommunity.com'
+}
+SHORTENER_DOMAINS = {
+    'bit.ly', 'tinyurl.com', 't.co', 'goo.gl', 'is.gd', 'v.gd', 'cutt.ly', 'rb.gy',
+    'shorturl.at', 'ow.ly', 'tiny.cc', 'rebrand.ly', 'shorte.st', 'adf.ly', 'bl.ink', 'lnkd.in'
+}
+BLOCKED_DOMAINS = {domain.strip().lower() for domain in os.getenv('LINK_BLOCKLIST', '').split(',') if domain.strip()}
+# Not allowlisted but named after what scammers impersonate (free nitro, Steam trades).
+# Only checked on links with a scheme: bare matches are often file names or typos (discord.py, nitro.Thanks)
+LOOKALIKE_WORDS = ('discord', 'nitro', 'steam')
+
+# Links with a scheme, or bare domains like bit.ly/abc; <...> (embed suppressed) is cut off too
+URL_RE = re.compile(r'https?://[^\s<>]+|(?:[a-z0-9-]+\.)+[a-z][a-z0-9-]+(?:/[^\s<>]*)?', re.IGNORECASE)
+TRAILING_PUNCTUATION = '.,;:!?)]}\'"*_~|'
+
+class LinkVerdict:
+    """Classification of one link
+
+    kind is 'allowed', 'invite', 'shortener', 'blocked' or 'unknown'. For
+    invites guild_id is the server the invite leads to (0 for a group DM),
+    None while unresolved or when the invite doesn't exist.
+    """
+    __slots__ = ('kind', 'host', 'code', 'guild_id')
+
+    def __init__(self, kind, host, code=None, guild_id=None):
+        self.kind = kind
+        self.host = host
+        self.code = code
+        self.guild_id = guild_id
+
+    def violation(self, guild_id):
+        """Why the link isn't allowed in this guild, None if it is"""
+        if self.kind == 'blocked':
+            return "blocked link"
+        if self.kind == 'shortener':
+            return "shortened link"
+        if self.kind == 'invite' and self.guild_id is not None and self.guild_id != guild_id:
+            return "invite to another server"
+        return None
+
+    def __repr__(self):
+        return f"LinkVerdict({self.kind!r}, {self.host!r}, code={self.code!r}, guild_id={self.guild_id!r})"
+
+class VerdictCache:
+    """Bounded LRU of verdicts, each with its own expiry"""
+
+    def __init__(self, maxsize=LINK_CACHE_SIZE, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires, verdict)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, verdict, ttl):
+        self.entries[key] = (self.clock() + ttl, verdict)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+def extract_links(content):
+    """Distinct links of a message, in order, trailing punctuation removed"""
+    # Every link has a dot, most messages don't need the regex
+    if not content or '.' not in content:
+        return []
+    links = []
+    for found in URL_RE.finditer(content):
+        link = found.group(0).rstrip(TRAILING_PUNCTUATION)
+        if link and link not in links:
+            links.append(link)
+            if len(links) >= LINK_MAX_PER_MESSAGE:
+                break
+    return links
+
+def normalize_link(link):
+    """(host, path) of a link: lowercase IDNA host without www., port or credentials"""
+    parts = urlsplit(link if '://' in link else f"http://{link}")
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    if host.startswith('www.'):
+        host = host[4:]
+    return host, parts.path
+
+def _matching_domain(host, domains):
+    """host or one of its parent domains if listed in domains"""
+    while host:
+        if host in domains:
+            return host
+        _, _, host = host.partition('.')
+    return None
+
+def classify_link(link):
+    """Verdict from the link alone, invites are left unresolved"""
+    host, path = normalize_link(link)
+    prefix = INVITE_HOSTS.get(host)
+    if prefix is not None and path.startswith(prefix):
+        code = path[len(prefix):].split('/', 1)[0]
+        if INVITE_CODE_RE.match(code):
+            return LinkVerdict('invite', host, code)
+    if _matching_domain(host, ALLOWED_DOMAINS):
+        return LinkVerdict('allowed', host)
+    if _matching_domain(host, BLOCKED_DOMAINS):
+        return LinkVerdict('blocked', host)
+    if '://' in link and any(word in host for word in LOOKALIKE_WORDS):
+        return LinkVerdict('blocked', host)
+    if _matching_domain(host, SHORTENER_DOMAINS):
+        return LinkVerdict('shortener', host)
+    return LinkVerdict('unknown', host)
+
+class LinkScanner:
+    """Classifies the links of messages, invites resolved to their server
+
+    A link seen before costs one dict lookup: verdicts are cached under the
+    link exactly as it was written. Invite codes are cached too, so other
+    spellings of the same invite don't trigger a lookup, and concurrent
+    lookups of one code share a single request (a raid pasting the same
+    invite 100 times resolves it once).
+    """
+
+    def __init__(self, resolve_invite, clock=time.monotonic):
+        self.resolve_invite = resolve_invite  # async resolve_invite(code) -> guild id, 0 for a group DM, None if invalid
+        self.cache = VerdictCache(clock=clock)
+        self.inflight = {}  # invite code -> task resolving it
+        self.lookups = 0
+        self.coalesced = 0
+
+    async def _lookup(self, code):
+        self.lookups += 1
+        return await self.resolve_invite(code)
+
+    async def _resolve(self, verdict):
+        """Verdict with the invite's server, None if the lookup failed"""
+        key = ('invite', verdict.code)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self.inflight.get(verdict.code)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(verdict.code))
+            self.inflight[verdict.code] = task
+            task.add_done_callback(lambda _, code=verdict.code: self.inflight.pop(code, None))
+        else:
+            self.coalesced += 1
+        try:
+            # Shielded: one impatient caller must not cancel the lookup of the others
+            guild_id = await asyncio.shield(task)
+        except Exception:
+            return None
+
+        resolved = LinkVerdict('invite', verdict.host, verdict.code, guild_id)
+        self.cache.put(key, resolved, INVITE_CACHE_TTL)
+        return resolved
+
+    async def verdict(self, link):
+        cached = self.cache.get(link)
+        if cached is not None:
+            return cached
+
+        verdict = classify_link(link)
+        ttl = LINK_CACHE_TTL
+        if verdict.kind == 'invite':
+            resolved = await self._resolve(verdict)
+            if resolved is None:
+                # Lookup failed (rate limit, outage): let it through, retry next time
+                return verdict
+            verdict = resolved
+            ttl = INVITE_CACHE_TTL
+        self.cache.put(link, verdict, ttl)
+        return verdict
+
+    async def scan(self, content, guild_id):
+        """(link, reason) for the first link not allowed in the guild, else None"""
+        for link in extract_links(content):
+            verdict = await self.verdict(link)
+            reason = verdict.violation(guild_id)
+            if reason is not None:
+                return link, reason
+        return None
+
+def _selftest(copies=100, messages=20000):
+    """Invite coalescing, cache behaviour and the cost of repeated links"""
+    now = [0.0]
+    resolved = []
+
+    async def resolve_invite(code):
+        resolved.append(code)
+        await asyncio.sleep(0.05)
+        return {'home': 1, 'rival': 2}.get(code)
+
+    async def selftest():
+        scanner = LinkScanner(resolve_invite, clock=lambda: now[0])
+
+        # A raid pasting the same invite at once: one lookup
+        results = await asyncio.gather(*(scanner.scan(f"join discord.gg/rival now {i}", 1) for i in range(copies)))
+        print(f"{copies} concurrent copies of one invite -> {scanner.lookups} lookup(s), {scanner.coalesced} coalesced")
+        assert scanner.lookups == 1 and all(result == ('discord.gg/rival', "invite to another server") for result in results)
+
+        # Other spellings reuse the cached code, our own invites are fine
+        assert await scanner.scan("https://discord.com/invite/rival", 1) == ('https://discord.com/invite/rival', "invite to another server")
+        assert await scanner.scan("<https://discord.gg/home>", 1) is None
+        assert await scanner.scan("discord.gg/gone", 1) is None
+        assert scanner.lookups == 3
+
+        assert classify_link("HTTPS://WWW.Bit.ly/abc").kind == 'shortener'
+        assert classify_link("https://free-discord-nitro.gift/claim").kind == 'blocked'
+        # File names, missing spaces and Discord's own domains are not lookalikes
+        for text in ("pip install discord.py", "run steam.exe", "got nitro.Thanks", "discord.gg",
+                     "https://discord.gift/abc", "https://discordstatus.com", "https://discord.dev/docs"):
+            assert await scanner.scan(text, 1) is None, text
+        assert classify_link("https://cdn.discordapp.com/attachments/1/2/a.png").kind == 'allowed'
+        assert classify_link("user:pw@example.org:8080/x").host == 'example.org'
+        assert extract_links("see (example.com/a), example.com/a.") == ['example.com/a']
+
+        # Invite verdicts expire sooner than domain verdicts
+        now[0] += INVITE_CACHE_TTL + 1
+        await scanner.scan("discord.gg/rival", 1)
+        assert scanner.lookups == 4
+
+        # Repeated links: one hash lookup each
+        contents = [f"check https://example.com/item/{i % 50} and bit.ly/x{i % 10}" for i in range(messages)]
+        start = time.perf_counter()
+        for content in contents:
+            await scanner.scan(content, 1)
+        elapsed = time.perf_counter() - start
+        print(f"{messages} messages with repeated links in {elapsed * 1000:.0f}ms "
+              f"({elapsed / messages * 1e6:.1f}us each), cache hit rate {scanner.cache.hits / (scanner.cache.hits + scanner.cache.misses):.3f}")
+
+        cache = VerdictCache(maxsize=3, clock=lambda: now[0])
+        for key in 'abcd':
+            cache.put(key, key, 10)
+        assert cache.get('a') is None and cache.get('d') == 'd'
+        now[0] += 11
+        assert cache.get('d') is None
+
+    asyncio.run(selftest())
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+# Load monitor settings (thresholds can be overridden with environment variables)
+LOOP_LAG_INTERVAL = 0.5  # Seconds between two event loop lag samples
+LOOP_LAG_WINDOW = 120  # Samples kept for percentiles (one minute)
+LOOP_LAG_SUSTAIN = 5  # Samples whose median has to cross a threshold, ignores single GC pauses
+LAG_DEGRADED_MS = float(os.getenv('LAG_DEGRADED_MS', '250'))  # Loop lag that switches to degraded mode
+LAG_RECOVER_MS = float(os.getenv('LAG_RECOVER_MS', '50'))  # Loop lag considered healthy again
+QUEUE_DEGRADED = int(os.getenv('QUEUE_DEGRADED', '1000'))  # Pending tasks that switch to degraded mode
+QUEUE_RECOVER = int(os.getenv('QUEUE_RECOVER', '300'))  # Pending tasks considered healthy again
+LOAD_RECOVERY_SECONDS = 30  # Healthy time needed before leaving degraded mode
+LOAD_MAX_TRANSITIONS = 20  # Transitions kept for the status page
+
+NORMAL = 'normal'
+DEGRADED = 'degraded'
+
+# Work that is dropped or postponed in degraded mode. Interaction acks and
+# moderation are never shed.
+SHEDDABLE = ('sticky', 'welcome_dm', 'verbose_log')
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+class LoadMonitor:
+    """Event loop lag sampler with a normal/degraded load state
+
+    queue_depth is a callable returning the current outbound backlog, e.g. the
+    number of pending asyncio tasks.
+    on_transition(old_state, new_state, reason) is called on every state change.
+    """
+
+    def __init__(self, queue_depth=lambda: 0, on_transition=None):
+        self.queue_depth = queue_depth
+        self.on_transition = on_transition
+        self.samples = deque(maxlen=LOOP_LAG_WINDOW)  # lag in seconds
+        self.depth = 0
+        self.state = NORMAL
+        self.state_since = time.time()
+        self.healthy_since = None
+        self.transitions = deque(maxlen=LOAD_MAX_TRANSITIONS)
+        self.transition_count = 0
+        self.shed_counts = dict.fromkeys(SHEDDABLE, 0)
+
+    @property
+    def degraded(self):
+        return self.state == DEGRADED
+
+    def should_shed(self, kind):
+        """True if this kind of non-essential work should be skipped right now"""
+        if self.state != DEGRADED:
+            return False
+        self.shed_counts[kind] += 1
+        return True
+
+    def recent_lag(self):
+        """Median of the last few samples, in seconds"""
+        recent = sorted(list(self.samples)[-LOOP_LAG_SUSTAIN:])
+        return recent[len(recent) // 2] if recent else 0.0
+
+    def record(self, lag, depth, now=None):
+        """Add a lag sample and update the load state"""
+        now = now if now is not None else time.time()
+        self.samples.append(lag)
+        self.depth = depth
+        lag_ms = self.recent_lag() * 1000
+
+        if self.state == NORMAL:
+            if lag_ms >= LAG_DEGRADED_MS:
+                self._transition(DEGRADED, f"loop lag {lag_ms:.0f}ms >= {LAG_DEGRADED_MS:.0f}ms", now)
+            elif depth >= QUEUE_DEGRADED:
+                self._transition(DEGRADED, f"queue depth {depth} >= {QUEUE_DEGRADED}", now)
+            return
+
+        if lag_ms < LAG_RECOVER_MS and depth < QUEUE_RECOVER:
+            if self.healthy_since is None:
+                self.healthy_since = now
+            elif now - self.healthy_since >= LOAD_RECOVERY_SECONDS:
+                self._transition(NORMAL, f"healthy for {LOAD_RECOVERY_SECONDS}s", now)
+        else:
+            self.healthy_since = None
+
+    def _transition(self, state, reason, now):
+        old_state = self.state
+        self.state = state
+        self.state_since = now
+        self.healthy_since = None
+        self.transition_count += 1
+        self.transitions.append({'time': now, 'from': old_state, 'to': state, 'reason': reason})
+        if self.on_transition:
+            self.on_transition(old_state, state, reason)
+
+    async def run(self):
+        """Sample event loop lag forever: how late a short sleep wakes up"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(loop.time() - start - LOOP_LAG_INTERVAL, 0.0)
+            try:
+                depth = self.queue_depth()
+            except Exception:
+                depth = 0
+            self.record(lag, depth)
+
+    def snapshot(self):
+        """Load state for the status page and metrics"""
+        lags = sorted(self.samples)
+        return {
+            'state': self.state,
+            'state_since': self.state_since,
+            'lag_ms': round(self.recent_lag() * 1000, 1),
+            'lag_p50_ms': round(percentile(lags, 0.5) * 1000, 1),
+            'lag_p99_ms': round(percentile(lags, 0.99) * 1000, 1),
+            'lag_max_ms': round(lags[-1] * 1000, 1) if lags else 0.0,
+            'queue_depth': self.depth,
+            'transition_count': self.transition_count,
+            'transitions': list(self.transitions),
+            'shed': dict(self.shed_counts)
+        }
+
+async def _simulate(block_ms=400, blocks=20):
+    """Block the loop for a while and watch the monitor degrade and recover"""
+    global LOAD_RECOVERY_SECONDS
+    LOAD_RECOVERY_SECONDS = 2
+
+    def report(old_state, new_state, reason):
+        print(f"  {old_state} -> {new_state}: {reason}")
+
+    monitor = LoadMonitor(queue_depth=lambda: len(asyncio.all_tasks()), on_transition=report)
+    task = asyncio.create_task(monitor.run())
+    print(f"Blocking the loop {blocks}x for {block_ms}ms")
+    for _ in range(blocks):
+        time.sleep(block_ms / 1000)  # Simulated CPU-bound handler
+        await asyncio.sleep(0)
+    print(f"  lag p99 {monitor.snapshot()['lag_p99_ms']}ms, state {monitor.state}")
+    await asyncio.sleep(LOAD_RECOVERY_SECONDS + LOOP_LAG_SUSTAIN * LOOP_LAG_INTERVAL + 1)
+    task.cancel()
+    print(f"  final state {monitor.state}, {monitor.transition_count} transitions")
+
+if __name__ == "__main__":
+    asyncio.run(_simulate())
@@ -1,16 +1,34 @@
 import discord
 from discord.ext import commands, tasks
 import asyncio
-import random
 import datetime
 import os
 import logging
+import math
 import secrets
 import urllib.parse
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from keep_alive import keep_alive
-from collections import defaultdict, deque
+from keep_alive import keep_alive, register_status_provider, register_state_backend
+from antiraid import RaidDetector, JoinRateTracker, WelcomeQueue, RAID_NEW_ACCOUNT_AGE, WELCOME_DM_INTERVAL
+from state import BotState, parse_shard_ids
+from state_backend import create_state_backend
+from member_cache import MemberLookup, member_cache_options, admin_roles
+from loadmon import LoadMonitor, DEGRADED
+from singleflight import SingleFlight
+from ticketlog import LoggedAttachment, LoggedMessage, TicketLogStore, TICKET_LOG_SAVE_INTERVAL, is_ticket_channel
+from attachment_mirror import AttachmentMirror, MIRROR_TOTAL_TIMEOUT
+from transcript import TranscriptRenderer, transcript_rows, describe_files
+from giveaway_draw import MAX_BONUS_ENTRIES, EntrantSnapshot, entry_weight, new_seed
+from embed_updater import EmbedUpdater
+from modlog import ModLog
+from automod import Automod, AUTOMOD_MAX_RULES, normalize_rule
+from linkscan import LinkScanner
+from vouch_fraud import VouchImageIndex, VouchTextIndex, signed64, text_fingerprint
+from tracing import InteractionTracer, instrument, instrument_ack, traced
+from middleware import InteractionMiddleware
+from response_cache import ResponseCache
+import io
 import time
 
 # Configure logging
@@ -20,9 +38,10 @@ logger = logging.getLogger(__name__)
 # Admin user ID (only this user can use commands in DM)
 ADMIN_USER_ID = 1156246022104825916  # Your user ID based on logs
 
-# Anti-spam moderation system
-user_message_times = defaultdict(deque)  # Track message timestamps per user
-user_warnings = defaultdict(int)  # Track warnings per user
+# Roles that can earn bonus giveaway entries
+CUSTOMER_ROLE_ID = 1388936739917398106
+VERIFIED_ROLE_NAME = "| Voralith | Verified"
+MAX_GIVEAWAY_WINNERS = 20
 
 # Moderation settings - raisonnable limits
 SPAM_LIMIT = 5  # Maximum messages
@@ -30,11 +49,59 @@ SPAM_WINDOW = 10  # In 10 seconds
 WARNING_THRESHOLD = 3  # 3 warnings before timeout
 TIMEOUT_DURATION = 300  # 5 minutes timeout
 
-# Dictionary to store active giveaways
-active_giveaways = {}
+# Cross-user duplicate content detection (same link/text posted by many accounts)
+raid_detector = RaidDetector()
+
+# Blocked terms and patterns per guild, compiled into one automaton and one regex
+automod = Automod()
+
+# Join-rate raid guard and welcome DM pipeline
+join_guard = JoinRateTracker()
+welcome_queue = WelcomeQueue()
+WELCOME_DIGEST_INTERVAL = 60  # Seconds between verification-channel digests
+welcome_worker_task = None
+
+# All giveaway, sticky, anti-spam and verification state, partitioned by guild_id
+bot_state = BotState()
+GIVEAWAY_PAGE_SIZE = 25  # Discord limit for select options and embed fields
+GIVEAWAY_SNAPSHOT_RETENTION = datetime.timedelta(days=int(os.getenv('GIVEAWAY_SNAPSHOT_RETENTION_DAYS', '7')))  # Rerolls possible for this long
+last_snapshot_prune = None
+
+def giveaway_entries(giveaway, member):
+    """Entries a member gets in a giveaway, from its bonus entry settings"""
+    bonus_entries = giveaway.get('bonus_entries')
+    if not bonus_entries:
+        return 1
+    roles = getattr(member, 'roles', [])
+    return entry_weight(
+        bonus_entries,
+        is_booster=getattr(member, 'premium_since', None) is not None,
+        is_verified=any(role.name == VERIFIED_ROLE_NAME for role in roles),
+        is_customer=any(role.id == CUSTOMER_ROLE_ID for role in roles)
+    )
 
-# Dictionary to store sticky channels (channel_id -> message_id)
-sticky_channels = {}
+def giveaway_participant_count(key):
+    """Live counter value of a giveaway embed, None once it ended"""
+    guild_id, giveaway_id = key
+    giveaway = bot_state.guild(guild_id).giveaways.get(giveaway_id)
+    return len(giveaway['participants']) if giveaway else None
+
+async def edit_giveaway_message(key, count):
+    guild_id, giveaway_id = key
+    giveaway = bot_state.guild(guild_id).giveaways.get(giveaway_id)
+    if giveaway is None:
+        return  # Ended between the count and the edit
+    channel = bot.get_channel(giveaway['channel_id'])
+    if giveaway['message_id'] and channel:
+        await channel.get_partial_message(giveaway['message_id']).edit(embed=create_giveaway_embed(giveaway))
+
+# Participant counters on giveaway embeds: joins mark a giveaway dirty and the
+# updater edits each message at most every 15s, within one shared edit budget
+giveaway_embeds = EmbedUpdater(giveaway_participant_count, edit_giveaway_message, permanent_errors=(discord.NotFound, discord.Forbidden))
+giveaway_embeds_task = None
+
+# Shared state backend (STATE_BACKEND=memory|postgres) so several processes can split the shards
+state_backend = create_state_backend(bot_state)
 
 def check_dm_permissions(interaction: discord.Interaction) -> bool:
     """Check if user can use commands in DM"""
@@ -45,6 +112,10 @@ def check_dm_permissions(interaction: discord.Interaction) -> bool:
 # Database configuration
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Moderation cases, written in batches (in memory without DATABASE_URL)
+mod_log = ModLog(DATABASE_URL)
+mod_log_task = None
+
 def get_db_connection():
     """Get a database connection"""
     try:
@@ -81,6 +152,9 @@ def init_database():
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 """)
+                # Vouch number as posted and SimHash of the text, for the duplicate check
+                cursor.execute("ALTER TABLE vouches ADD COLUMN IF NOT EXISTS vouch_number INTEGER")
+                cursor.execute("ALTER TABLE vouches ADD COLUMN IF NOT EXISTS simhash BIGINT")
                 
                 # Create sticky_channels table to persist sticky message channels
                 cursor.execute("""
@@ -100,6 +174,7 @@ def init_database():
         finally:
             conn.close()
 
+@traced('db')
 def get_next_vouch_number(guild_id):
     """Get the next vouch number for a guild"""
     conn = get_db_connection()
@@ -125,71 +200,85 @@ def get_next_vouch_number(guild_id):
             conn.close()
     return 1
 
-def save_vouch(guild_id, user_id, username, message, stars, image_url=None):
-    """Save a vouch to the database"""
+@traced('db')
+def save_vouch(guild_id, user_id, username, message, stars, image_url=None, vouch_number=None):
+    """Save a vouch to the database, returns the SimHash of its text (None for short texts)"""
+    fingerprint = text_fingerprint(message)
     conn = get_db_connection()
     if conn:
         try:
             with conn.cursor() as cursor:
                 cursor.execute("""
-                    INSERT INTO vouches (guild_id, user_id, username, message, stars, image_url)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (guild_id, user_id, username, message, stars, image_url))
+                    INSERT INTO vouches (guild_id, user_id, username, message, stars, image_url, vouch_number, simhash)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, (guild_id, user_id, username, message, stars, image_url, vouch_number,
+                      signed64(fingerprint) if fingerprint is not None else None))
                 conn.commit()
                 logger.info(f"Vouch saved for user {username} in guild {guild_id}")
         except Exception as e:
             logger.error(f"Error saving vouch: {e}")
         finally:
             conn.close()
+    return fingerprint
+
+def find_staff_channel(guild):
+    """Find the channel for staff alerts of a guild by name"""
+    for ch in guild.text_channels:
+        name = ch.name.lower()
+        if "staff" in name or "mod-log" in name or "modlog" in name:
+            return ch
+    return None
 
-def load_sticky_channels():
-    """Load sticky channels from database into memory"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT channel_id, message_id FROM sticky_channels")
-                rows = cursor.fetchall()
-                for row in rows:
-                    sticky_channels[row[0]] = row[1]
-                logger.info(f"Loaded {len(rows)} sticky channels from database")
-        except Exception as e:
-            logger.error(f"Error loading sticky channels: {e}")
-        finally:
-            conn.close()
-
-def save_sticky_channel(guild_id, channel_id, message_id):
-    """Save sticky channel to database"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO sticky_channels (guild_id, channel_id, message_id)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (channel_id)
-                    DO UPDATE SET message_id = EXCLUDED.message_id
-                """, (guild_id, channel_id, message_id))
-                conn.commit()
-                logger.info(f"Sticky channel saved: {channel_id} -> {message_id}")
-        except Exception as e:
-            logger.error(f"Error saving sticky channel: {e}")
-        finally:
-            conn.close()
+async def flag_recycled_vouch_image(job, matches):
+    """Tell staff that a vouch reuses the image of earlier vouches"""
+    guild = bot.get_guild(job.guild_id)
+    channel = find_staff_channel(guild) if guild else None
+    if channel is None:
+        logger.warning(f"Vouch #{job.vouch_number} in guild {job.guild_id} reuses an earlier image, no staff channel to report it")
+        return
+    
+    earlier = "\n".join(f"• Vouch #{vouch_number} by <@{user_id}> ({distance}/64 bits differ)"
+                        for distance, (vouch_number, user_id) in matches[:10])
+    embed = discord.Embed(
+        title="🖼️ Recycled Vouch Image",
+        description=f"Vouch #{job.vouch_number} by <@{job.user_id}> in <#{job.channel_id}> uses the same image as:\n{earlier}",
+        color=0xff9900,
+        timestamp=datetime.datetime.utcnow()
+    )
+    embed.set_thumbnail(url=job.url)
+    embed.set_footer(text="Voralith Reviews • Image check")
+    await channel.send(embed=embed)
+    logger.info(f"Vouch #{job.vouch_number} flagged for a recycled image ({time.monotonic() - job.submitted:.2f}s after posting)")
+
+# Perceptual hashes of vouch images, checked by a background task
+vouch_images = VouchImageIndex(DATABASE_URL, on_match=flag_recycled_vouch_image)
+vouch_images_task = None
+
+async def flag_duplicate_vouch_text(guild_id, channel_id, vouch_number, user_id, matches):
+    """Tell staff that a vouch copies the text of earlier vouches"""
+    guild = bot.get_guild(guild_id)
+    channel = find_staff_channel(guild) if guild else None
+    if channel is None:
+        logger.warning(f"Vouch #{vouch_number} in guild {guild_id} copies an earlier vouch, no staff channel to report it")
+        return
+    
+    earlier = "\n".join(f"• {f'Vouch #{number}' if number is not None else 'An older vouch'} by <@{author_id}> ({distance}/64 bits differ)"
+                        for distance, (number, author_id) in matches[:10])
+    embed = discord.Embed(
+        title="📋 Duplicate Vouch Text",
+        description=f"Vouch #{vouch_number} by <@{user_id}> in <#{channel_id}> has nearly the same text as:\n{earlier}",
+        color=0xff9900,
+        timestamp=datetime.datetime.utcnow()
+    )
+    embed.set_footer(text="Voralith Reviews • Text check")
+    try:
+        await channel.send(embed=embed)
+    except Exception as e:
+        logger.error(f"Error reporting duplicate vouch #{vouch_number}: {e}")
 
-def remove_sticky_channel(channel_id):
-    """Remove sticky channel from database"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM sticky_channels WHERE channel_id = %s", (channel_id,))
-                conn.commit()
-                logger.info(f"Sticky channel removed: {channel_id}")
-        except Exception as e:
-            logger.error(f"Error removing sticky channel: {e}")
-        finally:
-            conn.close()
+# SimHash fingerprints of vouch texts, filled from the vouches table at startup
+vouch_texts = VouchTextIndex(DATABASE_URL)
+vouch_texts_loaded = False
 
 # Bot configuration
 intents = discord.Intents.default()
@@ -197,15 +286,85 @@ intents.message_content = True  # Enable message content intent for on_message
 intents.guilds = True
 intents.members = True  # Needed for role management and verification
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Member cache (MEMBER_CACHE=full|on_demand|lazy): lazy keeps no members in RAM and
+# looks them up through a small LRU when a ticket, verification or giveaway needs one
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'lazy').lower()
+member_lookup = MemberLookup()
+
+# Sharding (opt-in): SHARD_MODE=auto lets Discord pick the shard count,
+# SHARD_COUNT + SHARD_IDS (e.g. "0-3") run an explicit shard range in this process
+SHARD_MODE = os.getenv('SHARD_MODE', 'off').lower()
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+
+if SHARD_MODE == 'auto' or SHARD_COUNT:
+    if SHARD_IDS and not SHARD_COUNT:
+        raise RuntimeError("SHARD_IDS requires SHARD_COUNT to be set")
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **member_cache_options(MEMBER_CACHE))
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents, **member_cache_options(MEMBER_CACHE))
+
+# Load shedding: when the event loop lags or too many tasks are pending, sticky
+# reposts, welcome DMs and info logging pause; interactions and moderation don't
+deferred_sticky_channels = set()  # channel ids whose sticky repost was postponed
+load_monitor_task = None
+
+def on_load_state_change(old_state, new_state, reason):
+    """Apply degraded mode side effects"""
+    if new_state == DEGRADED:
+        logger.warning(f"Entering degraded mode ({reason}) - pausing sticky reposts, welcome DMs and info logs")
+    else:
+        logger.warning(f"Leaving degraded mode ({reason}) - reposting {len(deferred_sticky_channels)} deferred sticky messages")
+        bot.loop.create_task(repost_deferred_stickies())
+
+load_monitor = LoadMonitor(queue_depth=lambda: len(asyncio.all_tasks(bot.loop)), on_transition=on_load_state_change)
+
+class VerboseLogShedder(logging.Filter):
+    """Drop info logs in degraded mode, counted as shed 'verbose_log' work"""
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or not load_monitor.should_shed('verbose_log')
+
+logger.addFilter(VerboseLogShedder())
 
-# In-memory storage for giveaways and verification
-active_giveaways = {}
-giveaway_counter = 0
-verification_pending = {}  # Store users pending verification
-verified_users = set()  # Store verified user IDs
-oauth_states = {}  # Store OAuth2 states for security
-sticky_channels = {}  # Store channels with sticky review messages {channel_id: message_id}
+async def repost_deferred_stickies():
+    """Repost sticky messages that were skipped while degraded"""
+    while deferred_sticky_channels and not load_monitor.degraded:
+        channel = bot.get_channel(deferred_sticky_channels.pop())
+        if channel:
+            await update_sticky_message(channel)
+
+def get_bot_status():
+    """Bot status for the keep-alive status page, including per-shard latency"""
+    shard_count = bot.shard_count or 1
+    guild_counts = {}
+    for guild in bot.guilds:
+        guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+    
+    if isinstance(bot, commands.AutoShardedBot):
+        latencies = bot.latencies
+    else:
+        latencies = [(bot.shard_id or 0, bot.latency)]
+    
+    shards = []
+    for shard_id, latency in latencies:
+        shard = bot.get_shard(shard_id) if isinstance(bot, commands.AutoShardedBot) else None
+        shards.append({
+            'shard_id': shard_id,
+            'latency_ms': round(latency * 1000, 1) if math.isfinite(latency) else None,
+            'guilds': guild_counts.get(shard_id, 0),
+            'state_partitions': len(bot_state.for_shard(shard_id, shard_count)),
+            'closed': shard.is_closed() if shard else bot.is_closed()
+        })
+    
+    return {
+        'ready': bot.is_ready(),
+        'sharded': isinstance(bot, commands.AutoShardedBot),
+        'shard_count': shard_count,
+        'shards': shards,
+        'load': load_monitor.snapshot(),
+        'interactions': interaction_tracer.snapshot()
+    }
 
 async def create_sticky_review_embed():
     """Create the sticky review format embed"""
@@ -228,6 +387,7 @@ async def create_sticky_review_embed():
 async def update_sticky_message(channel):
     """Update the sticky message in a channel"""
     try:
+        sticky_channels = bot_state.guild(channel.guild.id).sticky_channels
         if channel.id in sticky_channels:
             # Delete the old sticky message
             try:
@@ -239,17 +399,94 @@ async def update_sticky_message(channel):
         # Send new sticky message
         embed = await create_sticky_review_embed()
         new_message = await channel.send(embed=embed)
-        sticky_channels[channel.id] = new_message.id
         
-        # Update database
-        save_sticky_channel(channel.guild.id, channel.id, new_message.id)
+        # Update shared state and database
+        await asyncio.to_thread(state_backend.save_sticky_channel, channel.guild.id, channel.id, new_message.id)
         
         logger.info(f"Updated sticky message in {channel.name}")
         
     except Exception as e:
         logger.error(f"Error updating sticky message in {channel.name}: {e}")
 
+register_status_provider(get_bot_status)
+register_state_backend(state_backend)
+
 # Anti-spam moderation functions
+async def check_automod(message):
+    """Remove messages containing a blocked term or pattern of the guild"""
+    if not message.guild:
+        return False
+    
+    # Skip admins, like the anti-spam
+    if isinstance(message.author, discord.Member) and message.author.guild_permissions.administrator:
+        return False
+    
+    found = automod.match(message.guild.id, message.content)
+    if found is None:
+        return False
+    
+    kind, matched = found
+    logger.info(f"AUTOMOD: removed message from {message.author.name} in {getattr(message.channel, 'name', message.channel.id)} (blocked {kind})")
+    mod_log.record(message.guild.id, message.author.id, None, 'filter', f"Blocked {kind}: {matched[:100]}")
+    
+    try:
+        await message.delete()
+        embed = discord.Embed(
+            title="🚫 Message Removed",
+            description=f"{message.author.mention} your message contained a blocked word or link.",
+            color=0xff9900
+        )
+        embed.set_footer(text="Voralith Automatic Moderation")
+        await message.channel.send(embed=embed, delete_after=5)
+    except discord.NotFound:
+        pass
+    except Exception as e:
+        logger.error(f"Error removing blocked message: {e}")
+    return True
+
+async def resolve_invite(code):
+    """Server an invite code leads to: its id, 0 for a group DM, None if the invite doesn't exist"""
+    try:
+        invite = await bot.fetch_invite(code, with_counts=False, with_expiration=False)
+    except discord.NotFound:
+        return None
+    return invite.guild.id if invite.guild else 0
+
+# Link and invite scanner, verdicts cached across messages and guilds
+link_scanner = LinkScanner(resolve_invite)
+
+async def check_links(message):
+    """Remove blocked links, shortened links and invites to other servers"""
+    if not message.guild:
+        return False
+    
+    # Skip admins, like the anti-spam
+    if isinstance(message.author, discord.Member) and message.author.guild_permissions.administrator:
+        return False
+    
+    found = await link_scanner.scan(message.content, message.guild.id)
+    if found is None:
+        return False
+    
+    link, reason = found
+    logger.info(f"LINK SCAN: removed message from {message.author.name} in {getattr(message.channel, 'name', message.channel.id)} ({reason})")
+    mod_log.record(message.guild.id, message.author.id, None, 'link', f"{reason.capitalize()}: {link[:100]}")
+    
+    try:
+        await message.delete()
+        embed = discord.Embed(
+            title="🔗 Link Removed",
+            description=f"{message.author.mention} your message contained a {reason}, which isn't allowed here.",
+            color=0xff9900
+        )
+        embed.set_footer(text="Voralith Automatic Moderation")
+        await message.channel.send(embed=embed, delete_after=5)
+    except discord.NotFound:
+        pass
+    except Exception as e:
+        logger.error(f"Error removing message with a link: {e}")
+    return True
+
 async def check_spam(message):
     """Check if user is spamming and take action"""
     user_id = message.author.id
@@ -270,6 +507,54 @@ async def check_spam(message):
         if message.channel.name and (message.channel.name.startswith("ticket-") or "custom-order" in message.channel.name.lower()):
             return False
     
+    # Check for many accounts posting the same content; across channels only
+    # with a raid signal (links are checked by the detector)
+    account_age = (discord.utils.utcnow() - message.author.created_at).total_seconds()
+    raid_signal = account_age < RAID_NEW_ACCOUNT_AGE or (message.guild is not None and join_guard.in_raid_mode(message.guild.id))
+    raid_messages = raid_detector.observe(
+        message.guild.id if message.guild else None,
+        message.channel.id,
+        user_id,
+        message.content,
+        message,
+        current_time,
+        raid_signal
+    )
+    if raid_messages:
+        logger.info(f"RAID DETECTED: {len(raid_messages)} duplicate message(s) in {getattr(message.channel, 'name', message.channel.id)}")
+        
+        # One violation per author, their other copies are only deleted
+        first_per_author = {}
+        duplicates = []
+        for raid_message in raid_messages:
+            if raid_message.author.id in first_per_author:
+                duplicates.append(raid_message)
+            else:
+                first_per_author[raid_message.author.id] = raid_message
+        
+        await asyncio.gather(
+            *(handle_spam_violation(m, raid=True) for m in first_per_author.values()),
+            *(m.delete() for m in duplicates),
+            return_exceptions=True
+        )
+        
+        # Single summary for the initial sweep instead of one embed per raider
+        if len(first_per_author) > 1:
+            embed = discord.Embed(
+                title="🚨 Raid Detected",
+                description=f"Removed **{len(raid_messages)}** duplicate message(s) and timed out **{len(first_per_author)}** account(s).",
+                color=0xff4444
+            )
+            embed.set_footer(text="Voralith Automatic Moderation")
+            try:
+                await message.channel.send(embed=embed, delete_after=15)
+            except Exception as e:
+                logger.error(f"Error sending raid summary: {e}")
+        return True
+    
+    # Anti-spam counters live in the guild's state partition
+    user_message_times = bot_state.guild(message.guild.id if message.guild else None).user_message_times
+    
     # Add current message timestamp
     user_message_times[user_id].append(current_time)
     
@@ -289,38 +574,48 @@ async def check_spam(message):
     
     return False
 
-async def handle_spam_violation(message):
-    """Handle spam violation with warnings and timeouts"""
+async def handle_spam_violation(message, raid=False):
+    """Handle spam violation with warnings and timeouts
+    
+    Raid messages skip the warning stage and time the author out directly.
+    """
     user = message.author
     user_id = user.id
+    guild_id = message.guild.id if message.guild else None
     
     try:
         # Delete the spam message
-        await message.delete()
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass  # Already removed, e.g. by an earlier raid sweep
         
-        # Increment warning count
-        user_warnings[user_id] += 1
+        # Increment warning count (shared between processes)
+        warnings = await asyncio.to_thread(state_backend.add_spam_warning, guild_id, user_id, WARNING_THRESHOLD if raid else 0)
         
-        if user_warnings[user_id] >= WARNING_THRESHOLD:
+        if warnings >= WARNING_THRESHOLD:
             # Timeout user for 5 minutes
             try:
                 timeout_until = discord.utils.utcnow() + datetime.timedelta(seconds=TIMEOUT_DURATION)
-                await user.timeout(timeout_until, reason="Automatic spam detection")
+                await user.timeout(timeout_until, reason="Automatic raid detection" if raid else "Automatic spam detection")
+                
+                mod_log.record(guild_id, user_id, None, 'timeout', "Automatic raid detection" if raid else "Automatic spam detection", timeout_until.replace(tzinfo=None))
                 
                 # Reset warnings after timeout
-                user_warnings[user_id] = 0
-                user_message_times[user_id].clear()
+                await asyncio.to_thread(state_backend.reset_spam_warnings, guild_id, user_id)
+                bot_state.guild(guild_id).user_message_times[user_id].clear()
                 
-                # Send timeout notification
-                embed = discord.Embed(
-                    title="🔇 User Timed Out",
-                    description=f"{user.mention} has been timed out for **{TIMEOUT_DURATION//60} minutes** for spamming.",
-                    color=0xff4444
-                )
-                embed.set_footer(text="Voralith Automatic Moderation")
-                await message.channel.send(embed=embed, delete_after=10)
+                # Send timeout notification (raids get one summary from check_spam)
+                if not raid:
+                    embed = discord.Embed(
+                        title="🔇 User Timed Out",
+                        description=f"{user.mention} has been timed out for **{TIMEOUT_DURATION//60} minutes** for spamming.",
+                        color=0xff4444
+                    )
+                    embed.set_footer(text="Voralith Automatic Moderation")
+                    await message.channel.send(embed=embed, delete_after=10)
                 
-                logger.info(f"User {user.name} timed out for spam")
+                logger.info(f"User {user.name} timed out for {'raid' if raid else 'spam'}")
                 
             except discord.Forbidden:
                 # If can't timeout, just send warning
@@ -333,7 +628,7 @@ async def handle_spam_violation(message):
                 await message.channel.send(embed=embed, delete_after=5)
         else:
             # Send warning
-            warnings_left = WARNING_THRESHOLD - user_warnings[user_id]
+            warnings_left = WARNING_THRESHOLD - warnings
             embed = discord.Embed(
                 title="⚠️ Anti-Spam Warning",
                 description=f"{user.mention} please slow down your messages! **{warnings_left} warning(s)** remaining before timeout.",
@@ -347,11 +642,65 @@ async def handle_spam_violation(message):
             embed.set_footer(text="Voralith Automatic Moderation")
             await message.channel.send(embed=embed, delete_after=8)
             
-            logger.info(f"Spam warning {user_warnings[user_id]}/{WARNING_THRESHOLD} for {user.name}")
+            mod_log.record(guild_id, user_id, None, 'warn', f"Automatic spam warning {warnings}/{WARNING_THRESHOLD}")
+            logger.info(f"Spam warning {warnings}/{WARNING_THRESHOLD} for {user.name}")
             
     except Exception as e:
         logger.error(f"Error handling spam violation: {e}")
 
+# Stable copies of ticket attachments for transcripts (needs ATTACHMENT_BASE_URL)
+attachment_mirror = AttachmentMirror()
+
+async def refresh_attachment_links(channel, messages):
+    """Fresh signed links for logged attachments without a copy, e.g. logged before a restart"""
+    for message in messages:
+        if not isinstance(message, LoggedMessage) or all(attachment_mirror.has_copy(a.url) for a in message.attachments):
+            continue
+        try:
+            fresh = await channel.fetch_message(message.id)
+        except discord.NotFound:
+            continue
+        message.attachments = [LoggedAttachment(a.filename, a.url) for a in fresh.attachments]
+
+def mirror_ticket_attachments(attachments):
+    """Copy attachments as they are logged: signed CDN links expire after about a day"""
+    if attachment_mirror.enabled:
+        bot.loop.create_task(attachment_mirror.mirror_all(attachments))
+
+# Message logs of open tickets, appended as messages arrive so closing needs no history fetch
+ticket_logs = TicketLogStore(on_attachments=mirror_ticket_attachments)
+
+# Large transcripts render in worker processes
+transcript_renderer = TranscriptRenderer()
+
+# Double-click protection: one run per (user or channel, action) at a time
+interaction_flights = SingleFlight()
+
+# Per-command latency (ack, database, REST) for /metrics and the trace file
+interaction_tracer = InteractionTracer()
+interaction_tracer_task = None
+instrument(discord.http.HTTPClient, 'request', 'rest')
+instrument(discord.webhook.async_.AsyncWebhookAdapter, 'request', 'rest')  # Interaction responses and followups
+for response_method in ('send_message', 'defer', 'edit_message', 'send_modal'):
+    instrument_ack(discord.InteractionResponse, response_method)
+
+# Permission checks, error replies and tracing shared by every command and component
+middleware = InteractionMiddleware(interaction_tracer, ADMIN_USER_ID, error_replies=[
+    (discord.Forbidden, "❌ I don't have permission to do that here."),
+    (discord.NotFound, "❌ This no longer exists.")
+])
+
+# Admin stats panels (/verify_stats, /giveaway_info, /reconnect), invalidated by the code changing their data
+stats_cache = ResponseCache()
+
+def user_action(action):
+    """Single-flight key of an action per user"""
+    return lambda component, interaction: (interaction.user.id, action)
+
+def channel_action(action):
+    """Single-flight key of an action per channel"""
+    return lambda component, interaction: (interaction.channel.id, action)
+
 # Bot configuration for OAuth2 (legacy - kept for compatibility)
 CLIENT_ID = os.getenv('DISCORD_CLIENT_ID') or '1388879919412543659'
 REDIRECT_URI = 'https://voralith.mantallo.repl.co/oauth/callback'
@@ -362,14 +711,16 @@ class GiveawayView(discord.ui.View):
         self.giveaway_id = giveaway_id
     
     @discord.ui.button(label='🎉 Join Giveaway', style=discord.ButtonStyle.primary, custom_id='join_giveaway')
+    @middleware.component()
     async def join_giveaway(self, interaction: discord.Interaction, button: discord.ui.Button):
         giveaway_id = self.giveaway_id
+        giveaways = bot_state.guild(interaction.guild.id if interaction.guild else None).giveaways
         
-        if giveaway_id not in active_giveaways:
+        if giveaway_id not in giveaways:
             await interaction.response.send_message("❌ This giveaway no longer exists!", ephemeral=True)
             return
         
-        giveaway = active_giveaways[giveaway_id]
+        giveaway = giveaways[giveaway_id]
         
         if datetime.datetime.utcnow() > giveaway['end_time']:
             await interaction.response.send_message("❌ This giveaway has already ended!", ephemeral=True)
@@ -381,8 +732,17 @@ class GiveawayView(discord.ui.View):
             await interaction.response.send_message("❌ You're already participating in this giveaway!", ephemeral=True)
             return
         
-        giveaway['participants'].append(user_id)
-        await interaction.response.send_message("✅ You've joined the giveaway! Good luck! 🎉", ephemeral=True)
+        entries = giveaway_entries(giveaway, interaction.user)
+        if not await asyncio.to_thread(state_backend.add_giveaway_participant, giveaway['guild_id'], giveaway_id, user_id, entries):
+            await interaction.response.send_message("❌ You're already participating in this giveaway!", ephemeral=True)
+            return
+        
+        giveaway_embeds.mark((giveaway['guild_id'], giveaway_id))
+        
+        if entries > 1:
+            await interaction.response.send_message(f"✅ You've joined the giveaway with **{entries} entries**! Good luck! 🎉", ephemeral=True)
+        else:
+            await interaction.response.send_message("✅ You've joined the giveaway! Good luck! 🎉", ephemeral=True)
         
         logger.info(f"User {interaction.user.name} joined giveaway {giveaway_id}")
 
@@ -422,6 +782,8 @@ class LegacyTicketSelectMenu(discord.ui.Select):
         ]
         super().__init__(placeholder="Select a support category...", options=options)
     
+    @middleware.component(auto_defer=True)
+    @interaction_flights.guard(user_action('ticket_create'), "⏳ Your ticket is already being created.")
     async def callback(self, interaction: discord.Interaction):
         # Same logic as TicketSelectMenu
         category_info = {
@@ -488,16 +850,15 @@ class LegacyTicketSelectMenu(discord.ui.Select):
         }
         
         # Add admin permissions
-        for member in guild.members:
-            if member.guild_permissions.administrator:
-                overwrites[member] = discord.PermissionOverwrite(
-                    view_channel=True,
-                    send_messages=True,
-                    manage_messages=True,
-                    attach_files=True,
-                    embed_links=True,
-                    manage_channels=True
-                )
+        for role in admin_roles(guild):
+            overwrites[role] = discord.PermissionOverwrite(
+                view_channel=True,
+                send_messages=True,
+                manage_messages=True,
+                attach_files=True,
+                embed_links=True,
+                manage_channels=True
+            )
         
         # Add support role permissions
         for role in guild.roles:
@@ -517,6 +878,7 @@ class LegacyTicketSelectMenu(discord.ui.Select):
             category=support_category,
             overwrites=overwrites
         )
+        ticket_logs.track(ticket_channel.id, new_channel=True)
         
         # Create welcome embed
         embed = discord.Embed(
@@ -549,22 +911,25 @@ class LegacyVerificationView(discord.ui.View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='🔒 Verify Identity', style=discord.ButtonStyle.primary, emoji='🔒')
+    @middleware.component()
     async def legacy_verify_identity(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Same logic as PermanentVerificationView
         user_id = interaction.user.id
         guild_id = interaction.guild.id if interaction.guild else None
+        guild_state = bot_state.guild(guild_id)
         
-        if user_id in verified_users:
+        if await asyncio.to_thread(state_backend.is_verified, guild_id, user_id):
             await interaction.response.send_message("✅ You are already verified!", ephemeral=True)
             return
         
         # Generate secure state for OAuth2
         state = secrets.token_urlsafe(32)
-        oauth_states[user_id] = {
+        guild_state.oauth_states[user_id] = {
             'state': state,
             'guild_id': guild_id,
             'timestamp': datetime.datetime.utcnow()
         }
+        stats_cache.invalidate(guild_id, 'verification')
         
         # Create OAuth2 URL with proper permissions
         oauth_url = f"https://discord.com/oauth2/authorize?client_id={CLIENT_ID}&permissions=0&scope=identify%20guilds.join&response_type=code&redirect_uri={urllib.parse.quote(REDIRECT_URI)}&state={state}"
@@ -607,6 +972,8 @@ class LegacyCustomOrderView(discord.ui.View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="📝 Create Custom Order Ticket", style=discord.ButtonStyle.primary, emoji="🎨")
+    @middleware.component()
+    @interaction_flights.guard(user_action('custom_order_create'), "⏳ Your custom order ticket is already being created.")
     async def legacy_create_custom_order_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Same logic as CustomOrderView
         try:
@@ -648,16 +1015,15 @@ class LegacyCustomOrderView(discord.ui.View):
             }
             
             # Add permissions for admin and support roles
-            for member in guild.members:
-                if member.guild_permissions.administrator:
-                    overwrites[member] = discord.PermissionOverwrite(
-                        view_channel=True,
-                        send_messages=True,
-                        manage_messages=True,
-                        attach_files=True,
-                        embed_links=True,
-                        manage_channels=True
-                    )
+            for role in admin_roles(guild):
+                overwrites[role] = discord.PermissionOverwrite(
+                    view_channel=True,
+                    send_messages=True,
+                    manage_messages=True,
+                    attach_files=True,
+                    embed_links=True,
+                    manage_channels=True
+                )
             
             for role in guild.roles:
                 if "support" in role.name.lower():
@@ -676,6 +1042,7 @@ class LegacyCustomOrderView(discord.ui.View):
                 category=support_category,
                 overwrites=overwrites
             )
+            ticket_logs.track(ticket_channel.id, new_channel=True)
             
             # Create custom order ticket embed (same as CustomOrderView)
             embed = discord.Embed(
@@ -755,8 +1122,14 @@ async def heartbeat_system():
     
     while not bot.is_closed():
         try:
+            # Only one process runs the heartbeat when the bot is split across processes
+            if not await asyncio.to_thread(state_backend.is_leader, 'heartbeat_system'):
+                await asyncio.sleep(300)
+                continue
+            
             if bot.is_ready():
-                logger.info(f"Heartbeat: Bot active in {len(bot.guilds)} guilds")
+                load = load_monitor.snapshot()
+                logger.info(f"Heartbeat: Bot active in {len(bot.guilds)} guilds - loop lag p50 {load['lag_p50_ms']}ms, p99 {load['lag_p99_ms']}ms, {load['queue_depth']} pending tasks, {load['state']}")
                 
                 # Perform a light activity to maintain connection
                 if bot.guilds:
@@ -781,9 +1154,19 @@ async def on_ready():
     
     # Initialize database
     init_database()
-    
-    # Load sticky channels from database
-    load_sticky_channels()
+    await asyncio.to_thread(state_backend.init_schema)
+    mod_log.init_schema()
+    
+    # Load sticky channels and giveaways of our shards from the shared state
+    await asyncio.to_thread(state_backend.load_sticky_channels, SHARD_IDS, SHARD_COUNT)
+    await asyncio.to_thread(state_backend.load_giveaways, SHARD_IDS, SHARD_COUNT)
+    await asyncio.to_thread(state_backend.load_automod_rules, SHARD_IDS, SHARD_COUNT)
+    for guild_id, guild_state in list(bot_state.guilds.items()):
+        if guild_state.automod_rules:
+            try:
+                automod.load(guild_id, guild_state.automod_rules)
+            except Exception as e:
+                logger.error(f"Automod rules of guild {guild_id} could not be loaded: {e}")
     
     # Add persistent views for ticket systems and other interactions
     bot.add_view(TicketView())
@@ -804,6 +1187,59 @@ async def on_ready():
     # Start heartbeat system to maintain connection
     bot.loop.create_task(heartbeat_system())
     
+    # Catch up ticket logs (on_ready also fires after reconnects that may have missed events)
+    bot.loop.create_task(reconcile_ticket_logs())
+    if not save_ticket_logs.is_running():
+        save_ticket_logs.start()
+    
+    # Start the loop lag monitor (once, on_ready fires again after reconnects)
+    global load_monitor_task
+    if load_monitor_task is None or load_monitor_task.done():
+        load_monitor_task = bot.loop.create_task(load_monitor.run())
+    
+    # Load the vouch text fingerprints (once)
+    global vouch_texts_loaded
+    if not vouch_texts_loaded:
+        try:
+            loaded = await asyncio.to_thread(vouch_texts.load)
+            logger.info(f"Loaded {loaded} vouch text fingerprints")
+        except Exception as e:
+            logger.error(f"Error loading vouch text fingerprints: {e}")
+        vouch_texts_loaded = True
+    
+    # Load the vouch image hashes, then start checking new vouch images (once)
+    global vouch_images_task
+    if vouch_images.enabled and (vouch_images_task is None or vouch_images_task.done()):
+        try:
+            vouch_images.init_schema()
+            loaded = await asyncio.to_thread(vouch_images.load)
+            logger.info(f"Loaded {loaded} vouch image hashes")
+        except Exception as e:
+            logger.error(f"Error loading vouch image hashes: {e}")
+        vouch_images_task = bot.loop.create_task(vouch_images.run())
+    
+    # Start writing interaction traces (once)
+    global interaction_tracer_task
+    if interaction_tracer.path and (interaction_tracer_task is None or interaction_tracer_task.done()):
+        interaction_tracer_task = bot.loop.create_task(interaction_tracer.run())
+    
+    # Start the batched moderation case writer (once)
+    global mod_log_task
+    if mod_log_task is None or mod_log_task.done():
+        mod_log_task = bot.loop.create_task(mod_log.run())
+    
+    # Start the giveaway participant counters (once)
+    global giveaway_embeds_task
+    if giveaway_embeds_task is None or giveaway_embeds_task.done():
+        giveaway_embeds_task = bot.loop.create_task(giveaway_embeds.run())
+    
+    # Start the welcome DM pipeline (once, on_ready fires again after reconnects)
+    global welcome_worker_task
+    if welcome_worker_task is None or welcome_worker_task.done():
+        welcome_worker_task = bot.loop.create_task(welcome_dm_worker())
+    if not post_welcome_digests.is_running():
+        post_welcome_digests.start()
+    
     # Simple command synchronization
     logger.info("Starting command synchronization...")
     try:
@@ -826,57 +1262,59 @@ async def on_ready():
         logger.error(f"Failed to sync commands: {e}")
 
 @bot.tree.command(name="giveaway", description="Create a new giveaway (Admin only)")
-async def giveaway_command(interaction: discord.Interaction, prize: str, duration: str):
+@middleware.command('admin')
+async def giveaway_command(interaction: discord.Interaction, prize: str, duration: str, winners: int = 1,
+                           booster_entries: int = 0, verified_entries: int = 0, customer_entries: int = 0):
     """
     Create a new giveaway
     
     Parameters:
     prize: The prize for the giveaway
     duration: Duration in format like '1h', '30m', '2d', '1w'
+    winners: Number of winners
+    booster_entries: Extra entries for server boosters
+    verified_entries: Extra entries for verified members
+    customer_entries: Extra entries for customers
     """
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     # Parse duration
     duration_seconds = parse_duration(duration)
     if duration_seconds is None:
         await interaction.response.send_message("❌ Invalid duration format! Use formats like: 1h, 30m, 2d, 1w", ephemeral=True)
         return
     
-    global giveaway_counter
-    giveaway_counter += 1
-    giveaway_id = giveaway_counter
+    if not 1 <= winners <= MAX_GIVEAWAY_WINNERS:
+        await interaction.response.send_message(f"❌ Number of winners must be between 1 and {MAX_GIVEAWAY_WINNERS}!", ephemeral=True)
+        return
+    
+    bonus_entries = {'booster': booster_entries, 'verified': verified_entries, 'customer': customer_entries}
+    if not all(0 <= entries <= MAX_BONUS_ENTRIES for entries in bonus_entries.values()):
+        await interaction.response.send_message(f"❌ Bonus entries must be between 0 and {MAX_BONUS_ENTRIES}!", ephemeral=True)
+        return
+    bonus_entries = {kind: entries for kind, entries in bonus_entries.items() if entries}
+    
+    guild_id = interaction.guild.id if interaction.guild else None
+    giveaway_id = await asyncio.to_thread(state_backend.next_giveaway_id)
     
     end_time = datetime.datetime.utcnow() + datetime.timedelta(seconds=duration_seconds)
     
     # Create giveaway data
     giveaway = {
         'id': giveaway_id,
+        'guild_id': guild_id,
         'prize': prize,
         'end_time': end_time,
+        'winners': winners,
+        'bonus_entries': bonus_entries,
         'participants': [],
+        'weights': {},  # user_id -> entries, only for members with bonus entries
         'channel_id': interaction.channel.id,
         'message_id': None,
         'host_id': interaction.user.id
     }
     
     # Create embed
-    embed = discord.Embed(
-        title="🎉 GIVEAWAY 🎉",
-        description=f"**Prize:** {prize}\n**Ends:** <t:{int(end_time.timestamp())}:R>\n**Hosted by:** {interaction.user.mention}",
-        color=0x5B2C6F
-    )
-    embed.add_field(name="How to join:", value="Click the button below to join!", inline=False)
-    embed.set_footer(text=f"Giveaway ID: {giveaway_id}")
+    embed = create_giveaway_embed(giveaway)
     
     # Create view with button
     view = GiveawayView(giveaway_id)
@@ -889,10 +1327,32 @@ async def giveaway_command(interaction: discord.Interaction, prize: str, duratio
     giveaway['message_id'] = message.id
     
     # Store the giveaway
-    active_giveaways[giveaway_id] = giveaway
+    await asyncio.to_thread(state_backend.add_giveaway, giveaway)
+    stats_cache.invalidate(giveaway['guild_id'], 'giveaways')
     
     logger.info(f"Created giveaway {giveaway_id} for {prize} ending at {end_time}")
 
+def create_giveaway_embed(giveaway):
+    """Giveaway announcement, also used to refresh the participant counter"""
+    embed = discord.Embed(
+        title="🎉 GIVEAWAY 🎉",
+        description=f"**Prize:** {giveaway['prize']}\n**Ends:** <t:{int(giveaway['end_time'].timestamp())}:R>\n**Hosted by:** <@{giveaway['host_id']}>"
+                    + (f"\n**Winners:** {giveaway['winners']}" if giveaway.get('winners', 1) > 1 else "")
+                    + f"\n**Participants:** {len(giveaway['participants'])}",
+        color=0x5B2C6F
+    )
+    embed.add_field(name="How to join:", value="Click the button below to join!", inline=False)
+    bonus_entries = giveaway.get('bonus_entries')
+    if bonus_entries:
+        labels = {'booster': "Server boosters", 'verified': "Verified members", 'customer': "Customers"}
+        embed.add_field(
+            name="Bonus entries:",
+            value="\n".join(f"{labels[kind]}: +{entries}" for kind, entries in bonus_entries.items()),
+            inline=False
+        )
+    embed.set_footer(text=f"Giveaway ID: {giveaway['id']}")
+    return embed
+
 def parse_duration(duration_str):
     """Parse duration string into seconds"""
     duration_str = duration_str.lower().strip()
@@ -921,27 +1381,43 @@ def parse_duration(duration_str):
 async def check_giveaways():
     """Check for ended giveaways and announce winners"""
     current_time = datetime.datetime.utcnow()
-    ended_giveaways = []
     
-    for giveaway_id, giveaway in active_giveaways.items():
-        if current_time >= giveaway['end_time']:
-            ended_giveaways.append(giveaway_id)
+    # Only the leader process announces winners, the others just drop ended giveaways
+    if not await asyncio.to_thread(state_backend.is_leader, 'check_giveaways'):
+        await asyncio.to_thread(state_backend.prune_giveaways, current_time)
+        return
+    
+    for giveaway in await asyncio.to_thread(state_backend.due_giveaways, current_time):
+        await end_giveaway(giveaway['guild_id'], giveaway['id'])
     
-    for giveaway_id in ended_giveaways:
-        await end_giveaway(giveaway_id)
+    # Drop expired entrant snapshots, once an hour
+    global last_snapshot_prune
+    if last_snapshot_prune is None or current_time - last_snapshot_prune >= datetime.timedelta(hours=1):
+        last_snapshot_prune = current_time
+        await asyncio.to_thread(state_backend.prune_ended_giveaways, current_time - GIVEAWAY_SNAPSHOT_RETENTION)
 
-async def end_giveaway(giveaway_id):
+async def winner_mentions(channel, winner_ids):
+    """Mentions of drawn winners, 'Unknown User' for members that left"""
+    mentions = []
+    for winner_id in winner_ids:
+        winner = await member_lookup.get(channel.guild, winner_id) if getattr(channel, 'guild', None) else bot.get_user(winner_id)
+        mentions.append(winner.mention if winner else 'Unknown User')
+    return mentions
+
+async def end_giveaway(guild_id, giveaway_id):
     """End a giveaway and announce the winner"""
-    if giveaway_id not in active_giveaways:
+    # Claim the giveaway first so no other process announces it as well
+    giveaway = await asyncio.to_thread(state_backend.finish_giveaway, guild_id, giveaway_id)
+    giveaway_embeds.forget((guild_id, giveaway_id))
+    stats_cache.invalidate(guild_id, 'giveaways')
+    if giveaway is None:
         return
     
-    giveaway = active_giveaways[giveaway_id]
-    
     try:
         channel = bot.get_channel(giveaway['channel_id'])
         if not channel:
-            logger.error(f"Could not find channel for giveaway {giveaway_id}")
-            return
+            # The guild may belong to a shard hosted by another process
+            channel = await bot.fetch_channel(giveaway['channel_id'])
         
         participants = giveaway['participants']
         
@@ -955,43 +1431,100 @@ async def end_giveaway(giveaway_id):
             embed.set_footer(text=f"Giveaway ID: {giveaway_id}")
             await channel.send(embed=embed)
         else:
-            # Select winner
-            winner_id = random.choice(participants)
-            winner = bot.get_user(winner_id)
+            # Select winners, weighted by entries; the seed is published so the draw can be checked
+            snapshot = EntrantSnapshot.freeze(participants, giveaway.get('weights'))
+            seed = new_seed()
+            winner_ids = snapshot.draw(giveaway.get('winners', 1), seed)
+            
+            # Keep the frozen entrants so /reroll can draw replacements
+            await asyncio.to_thread(state_backend.save_ended_giveaway, {
+                'id': giveaway_id,
+                'guild_id': guild_id,
+                'channel_id': giveaway['channel_id'],
+                'prize': giveaway['prize'],
+                'ended_at': datetime.datetime.utcnow(),
+                'snapshot': snapshot,
+                'draws': [[f"{seed:016x}", winner_ids]]
+            })
+            
+            winners = await winner_mentions(channel, winner_ids)
             
             embed = discord.Embed(
                 title="🎉 Giveaway Ended 🎉",
-                description=f"**Prize:** {giveaway['prize']}\n**Winner:** {winner.mention if winner else 'Unknown User'}\n**Participants:** {len(participants)}",
+                description=f"**Prize:** {giveaway['prize']}\n**{'Winner' if len(winners) == 1 else 'Winners'}:** {', '.join(winners)}\n**Participants:** {len(participants)}",
                 color=0x5B2C6F
             )
-            embed.set_footer(text=f"Giveaway ID: {giveaway_id}")
-            await channel.send(f"🎉 Congratulations {winner.mention if winner else 'Unknown User'}! You won **{giveaway['prize']}**!", embed=embed)
+            embed.set_footer(text=f"Giveaway ID: {giveaway_id} • Draw seed: {seed:016x}")
+            await channel.send(f"🎉 Congratulations {', '.join(winners)}! You won **{giveaway['prize']}**!", embed=embed)
             
-            logger.info(f"Giveaway {giveaway_id} ended. Winner: {winner.name if winner else 'Unknown'}")
-        
-        # Remove from active giveaways
-        del active_giveaways[giveaway_id]
+            logger.info(f"Giveaway {giveaway_id} ended. Winners: {winner_ids} (seed {seed:016x}, {len(participants)} entrants)")
         
     except Exception as e:
         logger.error(f"Error ending giveaway {giveaway_id}: {e}")
 
-@bot.tree.command(name="giveaway_info", description="Display information about active giveaways in this server (Admin only)")
-async def giveaway_info(interaction: discord.Interaction):
-    """Display information about active giveaways in this server"""
+@bot.tree.command(name="reroll", description="Draw new winners for an ended giveaway (Admin only)")
+@middleware.command('admin')
+async def reroll_command(interaction: discord.Interaction, giveaway_id: int, winners: int = 1):
+    """
+    Draw replacement winners from the entrants frozen when the giveaway ended
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
+    Parameters:
+    giveaway_id: ID shown in the giveaway footer
+    winners: Number of new winners
+    """
     
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
+    if not 1 <= winners <= MAX_GIVEAWAY_WINNERS:
+        await interaction.response.send_message(f"❌ Number of winners must be between 1 and {MAX_GIVEAWAY_WINNERS}!", ephemeral=True)
         return
     
-    # Get active giveaways for this server
-    server_giveaways = [g for g in active_giveaways.values() if g['channel_id'] in [c.id for c in interaction.guild.channels]]
+    ended = await asyncio.to_thread(state_backend.get_ended_giveaway, interaction.guild.id if interaction.guild else None, giveaway_id)
+    if ended is None:
+        await interaction.response.send_message(f"❌ No ended giveaway #{giveaway_id} found (rerolls are possible for {GIVEAWAY_SNAPSHOT_RETENTION.days} days after the end).", ephemeral=True)
+        return
+    
+    # One reroll of a giveaway at a time in this process (the backend locks the snapshot across processes)
+    flight_key = (giveaway_id, 'reroll')
+    if not interaction_flights.acquire(flight_key):
+        await interaction.response.send_message("⏳ This giveaway is already being rerolled.", ephemeral=True)
+        return
+    
+    try:
+        seed = new_seed()
+        winner_ids = await asyncio.to_thread(state_backend.reroll_giveaway, ended, winners, seed)
+        if not winner_ids:
+            await interaction.response.send_message("❌ Every entrant of this giveaway has already won!", ephemeral=True)
+            return
+        
+        await interaction.response.defer()
+        mentions = await winner_mentions(interaction.channel, winner_ids)
+        
+        embed = discord.Embed(
+            title="🔄 Giveaway Rerolled",
+            description=f"**Prize:** {ended['prize']}\n**New {'Winner' if len(mentions) == 1 else 'Winners'}:** {', '.join(mentions)}\n**Participants:** {len(ended['snapshot'].entrants)}",
+            color=0x5B2C6F
+        )
+        embed.set_footer(text=f"Giveaway ID: {giveaway_id} • Draw seed: {seed:016x}")
+        await interaction.followup.send(f"🎉 Congratulations {', '.join(mentions)}! You won **{ended['prize']}**!", embed=embed)
+        
+        logger.info(f"Giveaway {giveaway_id} rerolled by {interaction.user.name}. Winners: {winner_ids} (seed {seed:016x})")
+    finally:
+        interaction_flights.release(flight_key)
+
+@bot.tree.command(name="giveaway_info", description="Display information about active giveaways in this server (Admin only)")
+@middleware.command('admin')
+async def giveaway_info(interaction: discord.Interaction):
+    """Display information about active giveaways in this server"""
+    
+    guild_id = interaction.guild.id if interaction.guild else None
+    embed = await stats_cache.get(guild_id, 'giveaway_info', (), ('giveaways',), lambda: giveaway_info_embed(guild_id))
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def giveaway_info_embed(guild_id):
+    """Active giveaways panel of /giveaway_info"""
+    # Get active giveaways for this server, soonest ending first (threads included)
+    guild_state = bot_state.guild(guild_id)
+    total = len(guild_state.giveaways)
+    server_giveaways = guild_state.giveaways_by_end(limit=GIVEAWAY_PAGE_SIZE)  # Embeds hold at most 25 fields
     
     if not server_giveaways:
         embed = discord.Embed(
@@ -1000,9 +1533,12 @@ async def giveaway_info(interaction: discord.Interaction):
             color=0x5B2C6F
         )
     else:
+        description = f"Found {total} active giveaway(s):"
+        if total > len(server_giveaways):
+            description = f"Found {total} active giveaway(s), showing the {len(server_giveaways)} ending soonest (use /end_giveaway to browse all):"
         embed = discord.Embed(
             title="📊 Active Giveaways",
-            description=f"Found {len(server_giveaways)} active giveaway(s):",
+            description=description,
             color=0x5B2C6F
         )
         
@@ -1013,23 +1549,13 @@ async def giveaway_info(interaction: discord.Interaction):
                 inline=True
             )
     
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return embed
 
 @bot.tree.command(name="purchase_info", description="Display purchase information with payment options (Admin only)")
+@middleware.command('admin')
 async def purchase_info(interaction: discord.Interaction):
     """Display purchase information with payment options"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     embed = discord.Embed(
         title="💳 Purchase Information",
         description="Available payment methods and purchase options:",
@@ -1063,6 +1589,7 @@ class TicketCloseView(discord.ui.View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="🔒 Close Ticket", style=discord.ButtonStyle.danger, custom_id="close_ticket_button")
+    @middleware.component()
     async def close_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Close the ticket channel"""
         try:
@@ -1117,6 +1644,8 @@ class TicketCloseConfirmView(discord.ui.View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="✅ Confirm Close", style=discord.ButtonStyle.danger, custom_id="confirm_close_button")
+    @middleware.component(auto_defer=True)
+    @interaction_flights.guard(channel_action('ticket_close'), "⏳ This ticket is already being closed.")
     async def confirm_close(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Confirm ticket closure"""
         try:
@@ -1140,6 +1669,7 @@ class TicketCloseConfirmView(discord.ui.View):
             # Wait 5 seconds then delete
             await asyncio.sleep(5)
             await channel.delete(reason=f"Ticket closed by {user.name}")
+            ticket_logs.drop(channel.id)
             
         except Exception as e:
             print(f"Error confirming ticket close: {e}")
@@ -1159,330 +1689,58 @@ class TicketCloseConfirmView(discord.ui.View):
                 print("No #transcript channel found")
                 return
             
-            # Get all messages from the ticket
-            messages = []
-            async for message in channel.history(limit=None, oldest_first=True):
-                messages.append(message)
+            # Get all messages from the ticket log (history is only read to fill gaps)
+            messages = await ticket_logs.messages(channel)
             
             # Create HTML transcript
-            html_content = await self.generate_html_transcript(channel, closed_by, messages)
-            
-            # Save HTML to a file
-            import tempfile
-            import os
+            # Attachments were copied as they were logged, this picks up the copies and fills gaps
+            if attachment_mirror.enabled:
+                try:
+                    await asyncio.wait_for(refresh_attachment_links(channel, messages), MIRROR_TOTAL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Refreshing attachment links of {channel.name} timed out, older links may have expired")
+            mirrored = await attachment_mirror.mirror_all(
+                [attachment for message in messages for attachment in message.attachments]
+            )
             
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-                f.write(html_content)
-                html_file_path = f.name
+            # HTML file, zip, or numbered zips, whichever fits the guild's upload limit
+            files = await transcript_renderer.package(
+                channel.name, closed_by.display_name, discord.utils.utcnow(),
+                transcript_rows(messages, mirrored), guild.filesize_limit
+            )
             
             # Send transcript to transcript channel
             embed = discord.Embed(
                 title="🎫 New Ticket Transcript",
-                description=f"**Ticket:** {channel.name}\n**Closed by:** {closed_by.mention}\n**Date:** <t:{int(discord.utils.utcnow().timestamp())}:F>\n**Messages:** {len(messages)}",
+                description=f"**Ticket:** {channel.name}\n**Closed by:** {closed_by.mention}\n**Date:** <t:{int(discord.utils.utcnow().timestamp())}:F>\n**Messages:** {len(messages)}\n**Transcript:** {describe_files(files)}",
                 color=0x5B2C6F
             )
             embed.set_footer(text="Voralith Support System")
             
-            # Send the HTML file
-            with open(html_file_path, 'rb') as f:
-                discord_file = discord.File(f, filename=f"transcript-{channel.name}.html")
-                await transcript_channel.send(embed=embed, file=discord_file)
-            
-            # Clean up the temporary file
-            os.unlink(html_file_path)
+            # One file per message, each part is within the upload limit on its own
+            for number, transcript_file in enumerate(files, 1):
+                discord_file = discord.File(io.BytesIO(transcript_file.data), filename=transcript_file.filename)
+                if number == 1:
+                    await transcript_channel.send(embed=embed, file=discord_file)
+                else:
+                    await transcript_channel.send(f"**{channel.name}** part {number}/{len(files)}", file=discord_file)
             
             print(f"HTML transcript created for {channel.name} in #transcript")
             
         except Exception as e:
-            print(f"Error creating transcript: {e}")
+            logger.error(f"Error creating transcript for {channel.name}: {e}")
     
-    async def generate_html_transcript(self, channel, closed_by, messages):
-        """Generate beautiful HTML transcript"""
+    async def generate_html_transcript(self, channel, closed_by, messages, mirrored=None):
+        """Generate beautiful HTML transcript
         
-        # Filter out system messages but keep user content
-        filtered_messages = []
-        for message in messages:
-            # Skip empty bot embeds but keep bot text messages
-            if message.author.bot and not message.content and message.embeds:
-                continue
-            filtered_messages.append(message)
-        
-        html_template = f"""
-<!DOCTYPE html>
-<html lang="fr">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Transcript - {channel.name}</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #2c2f33 0%, #23272a 100%);
-            color: #dcddde;
-            line-height: 1.6;
-        }}
-        
-        .container {{
-            max-width: 900px;
-            margin: 0 auto;
-            padding: 20px;
-        }}
-        
-        .header {{
-            background: linear-gradient(135deg, #5B2C6F 0%, #7c3aed 100%);
-            padding: 30px;
-            border-radius: 15px;
-            margin-bottom: 30px;
-            text-align: center;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-        }}
-        
-        .header h1 {{
-            color: white;
-            font-size: 2.5rem;
-            margin-bottom: 10px;
-            text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-        }}
-        
-        .header-info {{
-            background: rgba(255,255,255,0.1);
-            padding: 15px;
-            border-radius: 10px;
-            margin-top: 20px;
-        }}
-        
-        .header-info p {{
-            margin: 5px 0;
-            font-size: 1.1rem;
-        }}
-        
-        .messages {{
-            background: #36393f;
-            border-radius: 15px;
-            padding: 20px;
-            box-shadow: 0 5px 20px rgba(0,0,0,0.2);
-        }}
-        
-        .message {{
-            margin-bottom: 20px;
-            padding: 15px;
-            background: #40444b;
-            border-radius: 10px;
-            border-left: 4px solid #5B2C6F;
-            transition: transform 0.2s ease;
-        }}
-        
-        .message:hover {{
-            transform: translateX(5px);
-        }}
-        
-        .message-header {{
-            display: flex;
-            align-items: center;
-            margin-bottom: 10px;
-        }}
-        
-        .avatar {{
-            width: 40px;
-            height: 40px;
-            border-radius: 50%;
-            background: linear-gradient(45deg, #5B2C6F, #7c3aed);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            margin-right: 15px;
-            font-weight: bold;
-            color: white;
-            text-transform: uppercase;
-        }}
-        
-        .message-info {{
-            flex: 1;
-        }}
-        
-        .username {{
-            font-weight: bold;
-            color: #ffffff;
-            font-size: 1.1rem;
-        }}
-        
-        .timestamp {{
-            color: #72767d;
-            font-size: 0.9rem;
-            margin-left: 10px;
-        }}
-        
-        .message-content {{
-            margin-left: 55px;
-            line-height: 1.6;
-            word-wrap: break-word;
-        }}
-        
-        .attachment {{
-            background: #2f3136;
-            border: 1px solid #5B2C6F;
-            border-radius: 8px;
-            padding: 10px;
-            margin: 10px 0;
-            display: inline-block;
-        }}
-        
-        .attachment a {{
-            color: #7c3aed;
-            text-decoration: none;
-            font-weight: bold;
-        }}
-        
-        .attachment a:hover {{
-            text-decoration: underline;
-        }}
-        
-        .image-preview {{
-            max-width: 400px;
-            max-height: 300px;
-            border-radius: 8px;
-            margin: 10px 0;
-        }}
-        
-        .bot-message {{
-            border-left-color: #7289da;
-        }}
-        
-        .bot-message .avatar {{
-            background: linear-gradient(45deg, #7289da, #5865f2);
-        }}
-        
-        .footer {{
-            text-align: center;
-            margin-top: 30px;
-            padding: 20px;
-            color: #72767d;
-            font-size: 0.9rem;
-        }}
-        
-        .stats {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 15px;
-            margin: 20px 0;
-        }}
-        
-        .stat {{
-            background: rgba(255,255,255,0.1);
-            padding: 15px;
-            border-radius: 10px;
-            text-align: center;
-        }}
-        
-        .stat-number {{
-            font-size: 2rem;
-            font-weight: bold;
-            color: #7c3aed;
-        }}
-        
-        .stat-label {{
-            color: #dcddde;
-            margin-top: 5px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🎫 Transcript Voralith</h1>
-            <div class="header-info">
-                <p><strong>Salon:</strong> {channel.name}</p>
-                <p><strong>Fermé par:</strong> {closed_by.display_name}</p>
-                <p><strong>Date:</strong> {discord.utils.utcnow().strftime('%d/%m/%Y à %H:%M')}</p>
-            </div>
-            <div class="stats">
-                <div class="stat">
-                    <div class="stat-number">{len(filtered_messages)}</div>
-                    <div class="stat-label">Messages</div>
-                </div>
-                <div class="stat">
-                    <div class="stat-number">{len(set(msg.author.id for msg in filtered_messages))}</div>
-                    <div class="stat-label">Participants</div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="messages">
-"""
-
-        # Add messages
-        for message in filtered_messages:
-            # Get first letter for avatar
-            avatar_letter = message.author.display_name[0] if message.author.display_name else "?"
-            
-            # Format timestamp
-            timestamp = message.created_at.strftime('%d/%m/%Y %H:%M:%S')
-            
-            # Bot or user styling
-            message_class = "message bot-message" if message.author.bot else "message"
-            
-            # Format content
-            content = message.content if message.content else "<em>Aucun contenu texte</em>"
-            content = content.replace('\n', '<br>')
-            
-            html_template += f"""
-            <div class="{message_class}">
-                <div class="message-header">
-                    <div class="avatar">{avatar_letter}</div>
-                    <div class="message-info">
-                        <span class="username">{message.author.display_name}</span>
-                        <span class="timestamp">{timestamp}</span>
-                    </div>
-                </div>
-                <div class="message-content">
-                    {content}
-"""
-            
-            # Add attachments
-            if message.attachments:
-                for attachment in message.attachments:
-                    # Check if it's an image
-                    if any(attachment.filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp']):
-                        html_template += f"""
-                    <div class="attachment">
-                        <p>📷 <strong>Image:</strong> {attachment.filename}</p>
-                        <img src="{attachment.url}" alt="{attachment.filename}" class="image-preview">
-                    </div>
-"""
-                    else:
-                        html_template += f"""
-                    <div class="attachment">
-                        📎 <strong>Fichier:</strong> <a href="{attachment.url}" target="_blank">{attachment.filename}</a>
-                    </div>
-"""
-            
-            html_template += """
-                </div>
-            </div>
-"""
-
-        # Close HTML
-        html_template += """
-        </div>
-        
-        <div class="footer">
-            <p>Transcript généré automatiquement par <strong>Voralith Support System</strong></p>
-            <p>© 2025 Voralith - Système de support professionnel</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        
-        return html_template
+        mirrored maps attachment URLs to their stable copies (see attachment_mirror.py).
+        Large tickets render in a process pool so the event loop is not blocked.
+        """
+        rows = transcript_rows(messages, mirrored)
+        return await transcript_renderer.render(channel.name, closed_by.display_name, discord.utils.utcnow(), rows)
     
     @discord.ui.button(label="❌ Cancel", style=discord.ButtonStyle.secondary, custom_id="cancel_close_button")
+    @middleware.component()
     async def cancel_close(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Cancel ticket closure"""
         embed = discord.Embed(
@@ -1526,6 +1784,8 @@ class TicketSelectMenu(discord.ui.Select):
         ]
         super().__init__(placeholder="Select a support category...", options=options, custom_id="ticket_select_menu")
 
+    @middleware.component(auto_defer=True)
+    @interaction_flights.guard(user_action('ticket_create'), "⏳ Your ticket is already being created.")
     async def callback(self, interaction: discord.Interaction):
         category_info = {
             "purchase": {
@@ -1605,16 +1865,15 @@ class TicketSelectMenu(discord.ui.Select):
             }
             
             # Add admin permissions
-            for member in guild.members:
-                if member.guild_permissions.administrator:
-                    overwrites[member] = discord.PermissionOverwrite(
-                        read_messages=True, 
-                        send_messages=True,
-                        attach_files=True,
-                        embed_links=True,
-                        manage_messages=True,
-                        use_application_commands=True  # Admins can use commands
-                    )
+            for role in admin_roles(guild):
+                overwrites[role] = discord.PermissionOverwrite(
+                    read_messages=True, 
+                    send_messages=True,
+                    attach_files=True,
+                    embed_links=True,
+                    manage_messages=True,
+                    use_application_commands=True  # Admins can use commands
+                )
             
             # Add support/staff role permissions
             for role in guild.roles:
@@ -1634,6 +1893,7 @@ class TicketSelectMenu(discord.ui.Select):
                 category=ticket_category,
                 overwrites=overwrites
             )
+            ticket_logs.track(ticket_channel.id, new_channel=True)
             
             # Create initial ticket embed
             embed = discord.Embed(
@@ -1666,20 +1926,10 @@ class TicketSelectMenu(discord.ui.Select):
             await interaction.response.send_message("❌ An error occurred while creating your ticket. Please try again.", ephemeral=True)
 
 @bot.tree.command(name="setup-tickets", description="Create a support ticket system (Admin only)")
+@middleware.command('admin')
 async def setup_tickets_command(interaction: discord.Interaction):
     """Create a support ticket system"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     embed = discord.Embed(
         title="🎫 Support Ticket System",
         description="Select a category below to open a support ticket. Our team will assist you as soon as possible.",
@@ -1698,20 +1948,10 @@ async def setup_tickets_command(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, view=view)
 
 @bot.tree.command(name="announcement", description="Create a professional announcement embed (Admin only)")
+@middleware.command('admin')
 async def announcement(interaction: discord.Interaction, title: str, description: str, image_url: str = ""):
     """Create a professional announcement embed"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     embed = discord.Embed(
         title=f"📢 {title}",
         description=description,
@@ -1728,20 +1968,10 @@ async def announcement(interaction: discord.Interaction, title: str, description
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="update_log", description="Create an update log with changelog (Admin only)")
+@middleware.command('admin')
 async def update_log(interaction: discord.Interaction, version: str, updates: str, download_link: str = "", image_url: str = ""):
     """Create an update log with changelog"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     embed = discord.Embed(
         title=f"🔄 Update {version}",
         description="New update available!",
@@ -1774,19 +2004,19 @@ async def update_log(interaction: discord.Interaction, version: str, updates: st
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="reconnect", description="Reconnect verified members to the server (Admin only)")
+@middleware.command('admin')
 async def reconnect_command(interaction: discord.Interaction):
     """Allow admins to use the reconnection system to bring back verified members"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
+    guild_id = interaction.guild.id if interaction.guild else None
+    embed = await stats_cache.get(guild_id, 'reconnect', (), ('verification',), lambda: reconnect_embed(guild_id))
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def reconnect_embed(guild_id):
+    """Reconnection panel of /reconnect"""
+    guild_state = bot_state.guild(guild_id)
+    verified_count = await asyncio.to_thread(state_backend.verified_count, guild_state.guild_id)
+    verification_pending = guild_state.verification_pending
     
     embed = discord.Embed(
         title="🔄 Member Reconnection System",
@@ -1796,7 +2026,7 @@ async def reconnect_command(interaction: discord.Interaction):
     
     embed.add_field(
         name="📊 Statistics",
-        value=f"• **Verified Members:** {len(verified_users)}\n• **Pending Verifications:** {len(verification_pending)}\n• **Total Processed:** {len(verified_users) + len(verification_pending)}",
+        value=f"• **Verified Members:** {verified_count}\n• **Pending Verifications:** {len(verification_pending)}\n• **Total Processed:** {verified_count + len(verification_pending)}",
         inline=False
     )
     
@@ -1808,30 +2038,33 @@ async def reconnect_command(interaction: discord.Interaction):
     
     embed.set_footer(text="Voralith Reconnection System", icon_url="https://cdn.discordapp.com/attachments/1156246022104825920/1321844863446892574/voralith-logo.png")
     
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return embed
 
 class PermanentVerificationView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='🔒 Verify Identity', style=discord.ButtonStyle.primary, custom_id='permanent_verify_identity')
+    @middleware.component()
     async def permanent_verify_identity(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Handle permanent verification button click with automatic role assignment"""
         
         user_id = interaction.user.id
         guild_id = interaction.guild.id if interaction.guild else None
+        guild_state = bot_state.guild(guild_id)
         
-        if user_id in verified_users:
+        if await asyncio.to_thread(state_backend.is_verified, guild_id, user_id):
             await interaction.response.send_message("✅ You are already verified!", ephemeral=True)
             return
         
         # Generate secure state for OAuth2
         state = secrets.token_urlsafe(32)
-        oauth_states[user_id] = {
+        guild_state.oauth_states[user_id] = {
             'state': state,
             'guild_id': guild_id,
             'timestamp': datetime.datetime.utcnow()
         }
+        stats_cache.invalidate(guild_id, 'verification')
         
         # Create OAuth2 URL with proper permissions
         oauth_url = f"https://discord.com/oauth2/authorize?client_id={CLIENT_ID}&permissions=0&scope=identify%20guilds.join&response_type=code&redirect_uri={urllib.parse.quote(REDIRECT_URI)}&state={state}"
@@ -1875,18 +2108,23 @@ class VerificationConfirmView(discord.ui.View):
         self.user_id = user_id
     
     @discord.ui.button(label='✅ Complete Verification', style=discord.ButtonStyle.success, custom_id='complete_verification')
+    @middleware.component()
+    @interaction_flights.guard(user_action('verify_complete'), "⏳ Your verification is already being processed.")
     async def complete_verification(self, interaction: discord.Interaction, button: discord.ui.Button):
         
         if interaction.user.id != self.user_id:
             await interaction.response.send_message("❌ This verification is not for you.", ephemeral=True)
             return
         
+        guild_state = bot_state.guild(interaction.guild.id if interaction.guild else None)
+        
         # Add to verified users
-        verified_users.add(self.user_id)
+        await asyncio.to_thread(state_backend.mark_verified, guild_state.guild_id, self.user_id)
+        stats_cache.invalidate(guild_state.guild_id, 'verification')
         
         # Remove from pending if exists
-        if self.user_id in verification_pending:
-            del verification_pending[self.user_id]
+        if self.user_id in guild_state.verification_pending:
+            del guild_state.verification_pending[self.user_id]
         
         # Try to assign role if in guild
         if interaction.guild:
@@ -1901,7 +2139,7 @@ class VerificationConfirmView(discord.ui.View):
                     )
                 
                 # Add role to user
-                member = interaction.guild.get_member(self.user_id)
+                member = await member_lookup.get(interaction.guild, self.user_id)
                 if member and verified_role not in member.roles:
                     await member.add_roles(verified_role, reason="Completed Voralith verification")
                     
@@ -1926,25 +2164,30 @@ class CompleteVerificationView(discord.ui.View):
         self.oauth_state = oauth_state
     
     @discord.ui.button(label='✅ Complete Verification', style=discord.ButtonStyle.success, custom_id='complete_verification_oauth')
+    @middleware.component()
+    @interaction_flights.guard(user_action('verify_complete'), "⏳ Your verification is already being processed.")
     async def complete_verification(self, interaction: discord.Interaction, button: discord.ui.Button):
         
         if interaction.user.id != self.user_id:
             await interaction.response.send_message("❌ This verification is not for you.", ephemeral=True)
             return
         
+        guild_state = bot_state.guild(interaction.guild.id if interaction.guild else None)
+        
         # Check if user completed OAuth2 (simplified check)
-        if self.user_id not in oauth_states:
+        if self.user_id not in guild_state.oauth_states:
             await interaction.response.send_message("❌ Please complete the Discord authorization first by clicking the link above.", ephemeral=True)
             return
         
         # Add to verified users
-        verified_users.add(self.user_id)
+        await asyncio.to_thread(state_backend.mark_verified, guild_state.guild_id, self.user_id)
+        stats_cache.invalidate(guild_state.guild_id, 'verification')
         
         # Remove from pending and oauth states
-        if self.user_id in verification_pending:
-            del verification_pending[self.user_id]
-        if self.user_id in oauth_states:
-            del oauth_states[self.user_id]
+        if self.user_id in guild_state.verification_pending:
+            del guild_state.verification_pending[self.user_id]
+        if self.user_id in guild_state.oauth_states:
+            del guild_state.oauth_states[self.user_id]
         
         # Try to assign role if in guild
         if interaction.guild:
@@ -1959,7 +2202,7 @@ class CompleteVerificationView(discord.ui.View):
                     )
                 
                 # Add role to user
-                member = interaction.guild.get_member(self.user_id)
+                member = await member_lookup.get(interaction.guild, self.user_id)
                 if member and verified_role not in member.roles:
                     await member.add_roles(verified_role, reason="Completed Voralith verification")
                     
@@ -1978,6 +2221,7 @@ class CompleteVerificationView(discord.ui.View):
         logger.info(f"User {interaction.user.name} ({self.user_id}) completed OAuth2 verification")
     
     @discord.ui.button(label='❌ Cancel', style=discord.ButtonStyle.danger, custom_id='cancel_verification')
+    @middleware.component()
     async def cancel_verification(self, interaction: discord.Interaction, button: discord.ui.Button):
         
         if interaction.user.id != self.user_id:
@@ -1985,27 +2229,18 @@ class CompleteVerificationView(discord.ui.View):
             return
         
         # Clean up OAuth state
-        if self.user_id in oauth_states:
-            del oauth_states[self.user_id]
+        guild_id = interaction.guild.id if interaction.guild else None
+        if bot_state.guild(guild_id).oauth_states.pop(self.user_id, None) is not None:
+            stats_cache.invalidate(guild_id, 'verification')
         
         await interaction.response.send_message("❌ Verification cancelled.", ephemeral=True)
         logger.info(f"User {interaction.user.name} ({self.user_id}) cancelled verification")
 
 @bot.tree.command(name="setup_verification", description="Setup verification channel (Admin only)")
+@middleware.command('admin')
 async def setup_verification(interaction: discord.Interaction, channel: discord.TextChannel = None):
     """Setup the verification system in a channel"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     target_channel = channel or interaction.channel
     
     embed = discord.Embed(
@@ -2040,19 +2275,20 @@ async def setup_verification(interaction: discord.Interaction, channel: discord.
     await interaction.response.send_message(f"✅ Verification system setup in {target_channel.mention}!", ephemeral=True)
 
 @bot.tree.command(name="verify_stats", description="View verification statistics (Admin only)")
+@middleware.command('admin')
 async def verify_stats(interaction: discord.Interaction):
     """View verification statistics"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
+    guild_id = interaction.guild.id if interaction.guild else None
+    embed = await stats_cache.get(guild_id, 'verify_stats', (), ('verification',), lambda: verify_stats_embed(guild_id))
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def verify_stats_embed(guild_id):
+    """Statistics panel of /verify_stats"""
+    guild_state = bot_state.guild(guild_id)
+    verified_count = await asyncio.to_thread(state_backend.verified_count, guild_state.guild_id)
+    verification_pending = guild_state.verification_pending
+    oauth_states = guild_state.oauth_states
     
     embed = discord.Embed(
         title="📊 Verification Statistics",
@@ -2062,7 +2298,7 @@ async def verify_stats(interaction: discord.Interaction):
     
     embed.add_field(
         name="✅ Verified Users",
-        value=str(len(verified_users)),
+        value=str(verified_count),
         inline=True
     )
     
@@ -2079,8 +2315,8 @@ async def verify_stats(interaction: discord.Interaction):
     )
     
     # Calculate verification rate
-    total_interactions = len(verified_users) + len(verification_pending)
-    verification_rate = (len(verified_users) / total_interactions * 100) if total_interactions > 0 else 0
+    total_interactions = verified_count + len(verification_pending)
+    verification_rate = (verified_count / total_interactions * 100) if total_interactions > 0 else 0
     
     embed.add_field(
         name="📈 Verification Rate",
@@ -2090,7 +2326,7 @@ async def verify_stats(interaction: discord.Interaction):
     
     embed.set_footer(text="Voralith Verification System", icon_url="https://cdn.discordapp.com/attachments/1156246022104825920/1321844863446892574/voralith-logo.png")
     
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return embed
 
 class VouchView(discord.ui.View):
     def __init__(self, message: str, user: discord.User | discord.Member, image: discord.Attachment | None = None):
@@ -2099,6 +2335,7 @@ class VouchView(discord.ui.View):
         self.user = user
         self.image = image
         self.stars = None
+        self.submitted = False  # Set once the vouch is posted, later selections are refused
         
         # Add star selection dropdown
         self.add_item(VouchStarSelect())
@@ -2107,7 +2344,7 @@ class VouchView(discord.ui.View):
         """Create the vouch embed with selected stars"""
         # Get the next vouch number
         guild_id = self.user.guild.id if hasattr(self.user, 'guild') and self.user.guild else 0
-        vouch_number = get_next_vouch_number(guild_id)
+        vouch_number = await asyncio.to_thread(get_next_vouch_number, guild_id)
         
         embed = discord.Embed(
             title=f"Vouch #{vouch_number}",
@@ -2139,18 +2376,22 @@ class VouchView(discord.ui.View):
         return embed, vouch_number
     
     async def save_vouch_to_db(self, stars: int, vouch_number: int):
-        """Save the vouch to database"""
+        """Save the vouch to database, returns earlier vouches with nearly the same text"""
         guild_id = self.user.guild.id if hasattr(self.user, 'guild') and self.user.guild else 0
         image_url = self.image.url if self.image else None
         
-        save_vouch(
+        fingerprint = await asyncio.to_thread(
+            save_vouch,
             guild_id=guild_id,
             user_id=self.user.id,
             username=self.user.display_name,
             message=self.message,
             stars=stars,
-            image_url=image_url
+            image_url=image_url,
+            vouch_number=vouch_number
         )
+        stats_cache.invalidate(guild_id, 'vouches')
+        return vouch_texts.check(guild_id, vouch_number, self.user.id, fingerprint)
 
 class VouchStarSelect(discord.ui.Select):
     def __init__(self):
@@ -2163,22 +2404,39 @@ class VouchStarSelect(discord.ui.Select):
         ]
         super().__init__(placeholder="Select a star rating...", options=options)
 
+    @middleware.component(auto_defer=True)
+    @interaction_flights.guard(user_action('vouch'), "⏳ Your vouch is already being posted.")
     async def callback(self, interaction: discord.Interaction):
         stars = int(self.values[0])
         view = self.view
         
+        if view.submitted:
+            await interaction.response.send_message("❌ This vouch has already been posted.", ephemeral=True)
+            return
+        
         # Create and send the vouch embed
         embed, vouch_number = await view.create_vouch_embed(stars)
         
         # Save to database
-        await view.save_vouch_to_db(stars, vouch_number)
+        duplicates = await view.save_vouch_to_db(stars, vouch_number)
         
-        # Send the public vouch
+        # Send the public vouch; only then is it final, a failure before this can be retried
+        # (the single-flight guard already stops double clicks)
         await interaction.response.send_message(embed=embed)
+        view.submitted = True
+        
+        # Staff are warned after the user got their answer
+        if duplicates and interaction.guild:
+            bot.loop.create_task(flag_duplicate_vouch_text(interaction.guild.id, interaction.channel_id, vouch_number, view.user.id, duplicates))
+        
+        # Compare the image with earlier vouches in the background
+        if view.image and interaction.guild:
+            vouch_images.submit(interaction.guild.id, interaction.channel_id, vouch_number, view.user.id, view.image.url)
         
         logger.info(f"Vouch created by {view.user.display_name} with {stars} stars")
 
 @bot.tree.command(name="vouch", description="Leave a vouch/review with star rating")
+@middleware.command()
 async def vouch_command(interaction: discord.Interaction, message: str, image: discord.Attachment | None = None):
     """Create a vouch/review with star rating"""
     
@@ -2218,29 +2476,18 @@ async def vouch_command(interaction: discord.Interaction, message: str, image: d
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 @bot.tree.command(name="setup-reviews", description="Setup the review system in this channel (Admin only)")
+@middleware.command('admin')
 async def setup_reviews_command(interaction: discord.Interaction, channel: discord.TextChannel = None):
     """Setup the review system in a channel"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     target_channel = channel or interaction.channel
     
     # Add channel to sticky channels and create initial sticky message
     embed = await create_sticky_review_embed()
     message = await target_channel.send(embed=embed)
-    sticky_channels[target_channel.id] = message.id
     
-    # Save to database
-    save_sticky_channel(interaction.guild.id, target_channel.id, message.id)
+    # Save to shared state and database
+    await asyncio.to_thread(state_backend.save_sticky_channel, interaction.guild.id, target_channel.id, message.id)
     
     logger.info(f"Setup sticky review message in {target_channel.name}")
     
@@ -2248,21 +2495,12 @@ async def setup_reviews_command(interaction: discord.Interaction, channel: disco
     await interaction.response.send_message(f"✅ Sticky review system setup successfully in {target_channel.mention}!\n💡 The review format will automatically stay at the bottom of the channel.", ephemeral=True)
 
 @bot.tree.command(name="remove-sticky", description="Remove sticky review message from this channel (Admin only)")
+@middleware.command('admin')
 async def remove_sticky_command(interaction: discord.Interaction, channel: discord.TextChannel = None):
     """Remove sticky review system from a channel"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     target_channel = channel or interaction.channel
+    sticky_channels = bot_state.guild(target_channel.guild.id).sticky_channels
     
     if target_channel.id in sticky_channels:
         # Delete the sticky message
@@ -2272,11 +2510,8 @@ async def remove_sticky_command(interaction: discord.Interaction, channel: disco
         except:
             pass  # Message might already be deleted
         
-        # Remove from sticky channels
-        del sticky_channels[target_channel.id]
-        
-        # Remove from database
-        remove_sticky_channel(target_channel.id)
+        # Remove from sticky channels and database
+        await asyncio.to_thread(state_backend.remove_sticky_channel, target_channel.guild.id, target_channel.id)
         
         logger.info(f"Removed sticky review message from {target_channel.name}")
         await interaction.response.send_message(f"✅ Sticky review system removed from {target_channel.mention}!", ephemeral=True)
@@ -2284,6 +2519,7 @@ async def remove_sticky_command(interaction: discord.Interaction, channel: disco
         await interaction.response.send_message(f"❌ No sticky review system found in {target_channel.mention}.", ephemeral=True)
 
 @bot.tree.command(name="mute", description="Mute a user for a specified duration (Admin only)")
+@middleware.command('admin')
 @discord.app_commands.describe(
     user="The user to mute",
     duration="Duration in seconds (e.g., 300 for 5 minutes)",
@@ -2292,17 +2528,6 @@ async def remove_sticky_command(interaction: discord.Interaction, channel: disco
 async def mute_command(interaction: discord.Interaction, user: discord.Member, duration: int, reason: str = "No reason provided"):
     """Mute a user for a specified duration"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     try:
         # Check if duration is reasonable (max 24 hours)
         if duration > 86400:  # 24 hours in seconds
@@ -2318,6 +2543,7 @@ async def mute_command(interaction: discord.Interaction, user: discord.Member, d
         
         # Apply timeout
         await user.timeout(timeout_until, reason=f"Muted by {interaction.user.name}: {reason}")
+        mod_log.record(interaction.guild.id, user.id, interaction.user.id, 'mute', reason, timeout_until.replace(tzinfo=None))
         
         # Create success embed
         embed = discord.Embed(
@@ -2344,6 +2570,7 @@ async def mute_command(interaction: discord.Interaction, user: discord.Member, d
         logger.error(f"Error muting user: {e}")
 
 @bot.tree.command(name="unmute", description="Unmute a user immediately (Admin only)")
+@middleware.command('admin')
 @discord.app_commands.describe(
     user="The user to unmute",
     reason="Reason for the unmute (optional)"
@@ -2351,17 +2578,6 @@ async def mute_command(interaction: discord.Interaction, user: discord.Member, d
 async def unmute_command(interaction: discord.Interaction, user: discord.Member, reason: str = "No reason provided"):
     """Unmute a user immediately"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     try:
         # Check if user is actually muted
         if not user.is_timed_out():
@@ -2370,6 +2586,7 @@ async def unmute_command(interaction: discord.Interaction, user: discord.Member,
         
         # Remove timeout
         await user.timeout(None, reason=f"Unmuted by {interaction.user.name}: {reason}")
+        mod_log.record(interaction.guild.id, user.id, interaction.user.id, 'unmute', reason)
         
         # Create success embed
         embed = discord.Embed(
@@ -2393,20 +2610,137 @@ async def unmute_command(interaction: discord.Interaction, user: discord.Member,
         await interaction.response.send_message(f"❌ Erreur lors du démute: {str(e)}", ephemeral=True)
         logger.error(f"Error unmuting user: {e}")
 
-@bot.tree.command(name="setup-rules", description="Setup server rules embed (Admin only)")
-async def setup_rules_command(interaction: discord.Interaction):
-    """Create a professional server rules embed"""
+@bot.tree.command(name="modlog", description="Show the moderation history of a user (Admin only)")
+@middleware.command('guild_admin', defer='ephemeral')
+@discord.app_commands.describe(user="The user whose moderation cases to show")
+async def modlog_command(interaction: discord.Interaction, user: discord.User):
+    """Page through the moderation cases of a user, newest first"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ This command can only be used by admins in DM.", ephemeral=True)
-            return
-    else:  # Guild context
-        if not interaction.user.guild_permissions.administrator:
-            await interaction.response.send_message("❌ This command requires administrator permissions.", ephemeral=True)
-            return
+    cases, has_older = await mod_log.history(interaction.guild.id, user.id)
+    view = ModLogView(interaction.guild.id, user, cases, has_older=has_older, has_newer=False)
+    await interaction.followup.send(embed=view.create_embed(), view=view, ephemeral=True)
+
+class ModLogView(discord.ui.View):
+    """One page of moderation cases; pages are fetched by case id (keyset), not offset"""
+    
+    ACTION_LABELS = {'mute': "🔇 Mute", 'unmute': "🔊 Unmute", 'timeout': "⏱️ Timeout", 'warn': "⚠️ Warning", 'filter': "🚫 Filter", 'link': "🔗 Link"}
+    
+    def __init__(self, guild_id, user, cases, has_older, has_newer):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.user = user
+        self.cases = cases
+        self.newer_page.disabled = not (cases and has_newer)
+        self.older_page.disabled = not (cases and has_older)
     
+    def create_embed(self):
+        embed = discord.Embed(
+            title=f"📋 Moderation History - {self.user.name}",
+            description=f"{self.user.mention} ({self.user.id})" if self.cases else f"No moderation cases for {self.user.mention}.",
+            color=0x5B2C6F
+        )
+        for case in self.cases:
+            lines = [
+                f"**Moderator:** {f'<@{case.moderator_id}>' if case.moderator_id else 'Automatic'}",
+                f"**Reason:** {case.reason or 'No reason provided'}",
+                f"**Date:** <t:{int(case.created_at.replace(tzinfo=datetime.timezone.utc).timestamp())}:f>"
+            ]
+            if case.expires_at:
+                lines.append(f"**Ends:** <t:{int(case.expires_at.replace(tzinfo=datetime.timezone.utc).timestamp())}:R>")
+            embed.add_field(name=f"#{case.id} • {self.ACTION_LABELS.get(case.action, case.action)}", value="\n".join(lines), inline=False)
+        embed.set_footer(text="Modération Voralith")
+        return embed
+    
+    @discord.ui.button(label='◀ Newer', style=discord.ButtonStyle.secondary)
+    @middleware.component()
+    async def newer_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        cases, has_newer = await mod_log.history(self.guild_id, self.user.id, after=self.cases[0].id)
+        view = ModLogView(self.guild_id, self.user, cases, has_older=True, has_newer=has_newer)
+        await interaction.response.edit_message(embed=view.create_embed(), view=view)
+    
+    @discord.ui.button(label='Older ▶', style=discord.ButtonStyle.secondary)
+    @middleware.component()
+    async def older_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        cases, has_older = await mod_log.history(self.guild_id, self.user.id, before=self.cases[-1].id)
+        view = ModLogView(self.guild_id, self.user, cases, has_older=has_older, has_newer=True)
+        await interaction.response.edit_message(embed=view.create_embed(), view=view)
+
+AUTOMOD_RULE_CHOICES = [
+    discord.app_commands.Choice(name="Blocked term", value="term"),
+    discord.app_commands.Choice(name="Regex pattern", value="pattern")
+]
+
+@bot.tree.command(name="automod_add", description="Block a term or regex pattern in this server (Admin only)")
+@middleware.command('guild_admin')
+@discord.app_commands.describe(rule_type="Blocked term (anywhere, any case) or regex pattern", value="The term or pattern")
+@discord.app_commands.choices(rule_type=AUTOMOD_RULE_CHOICES)
+async def automod_add_command(interaction: discord.Interaction, rule_type: str, value: str):
+    """Add a blocked term or pattern"""
+    try:
+        value = normalize_rule(rule_type, value)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+    
+    rules = bot_state.guild(interaction.guild.id).automod_rules
+    if len(rules) >= AUTOMOD_MAX_RULES:
+        await interaction.response.send_message(f"❌ This server already has {AUTOMOD_MAX_RULES} automod rules.", ephemeral=True)
+        return
+    
+    # Compiled first: a pattern that does not combine with the others is never stored
+    try:
+        automod.add(interaction.guild.id, rule_type, value)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+    try:
+        await asyncio.to_thread(state_backend.add_automod_rule, interaction.guild.id, rule_type, value)
+    except Exception:
+        if (rule_type, value) not in rules:
+            automod.remove(interaction.guild.id, rule_type, value)
+        raise
+    
+    await interaction.response.send_message(f"✅ Added {'blocked term' if rule_type == 'term' else 'pattern'} `{value}` ({len(rules)} rule(s) in this server).", ephemeral=True)
+    logger.info(f"Automod {rule_type} added in {interaction.guild.name} by {interaction.user.name}")
+
+@bot.tree.command(name="automod_remove", description="Unblock a term or regex pattern (Admin only)")
+@middleware.command('guild_admin')
+@discord.app_commands.describe(rule_type="Blocked term or regex pattern", value="The term or pattern to remove")
+@discord.app_commands.choices(rule_type=AUTOMOD_RULE_CHOICES)
+async def automod_remove_command(interaction: discord.Interaction, rule_type: str, value: str):
+    """Remove a blocked term or pattern"""
+    value = value.strip().casefold() if rule_type == 'term' else value.strip()
+    if (rule_type, value) not in bot_state.guild(interaction.guild.id).automod_rules:
+        await interaction.response.send_message("❌ This rule doesn't exist.", ephemeral=True)
+        return
+    
+    await asyncio.to_thread(state_backend.remove_automod_rule, interaction.guild.id, rule_type, value)
+    automod.remove(interaction.guild.id, rule_type, value)
+    await interaction.response.send_message(f"✅ Removed `{value}`.", ephemeral=True)
+
+@bot.tree.command(name="automod_list", description="List blocked terms and patterns (Admin only)")
+@middleware.command('guild_admin')
+async def automod_list_command(interaction: discord.Interaction):
+    """Show the automod rules of this server"""
+    rules = bot_state.guild(interaction.guild.id).automod_rules
+    terms = sorted(value for kind, value in rules if kind == 'term')
+    patterns = sorted(value for kind, value in rules if kind == 'pattern')
+    
+    embed = discord.Embed(
+        title="🚫 Automod Rules",
+        description=f"**{len(terms)}** blocked term(s), **{len(patterns)}** pattern(s)",
+        color=0x5B2C6F
+    )
+    # Field values are limited to 1024 characters
+    for name, values in (("Blocked terms", terms), ("Patterns", patterns)):
+        if values:
+            text = ", ".join(f"`{value}`" for value in values)
+            embed.add_field(name=name, value=text if len(text) <= 1024 else text[:1000] + " …", inline=False)
+    embed.set_footer(text="Modération Voralith")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+def create_rules_embeds():
+    """Create the server rules embed and the rule violations embed"""
     # Create rules embed
     rules_embed = discord.Embed(
         title="📋 Server Rules",
@@ -2517,6 +2851,15 @@ async def setup_rules_command(interaction: discord.Interaction):
         icon_url="https://cdn.discordapp.com/attachments/1234567890/voralith-logo.png"
     )
     
+    return rules_embed, consequences_embed
+
+@bot.tree.command(name="setup-rules", description="Setup server rules embed (Admin only)")
+@middleware.command('admin')
+async def setup_rules_command(interaction: discord.Interaction):
+    """Create a professional server rules embed"""
+    
+    rules_embed, consequences_embed = create_rules_embeds()
+    
     # Send both embeds
     await interaction.response.send_message(embed=rules_embed)
     await interaction.followup.send(embed=consequences_embed)
@@ -2524,66 +2867,88 @@ async def setup_rules_command(interaction: discord.Interaction):
 
 
 @bot.tree.command(name="end_giveaway", description="End an active giveaway manually (Admin only)")
+@middleware.command('admin')
 async def end_giveaway_command(interaction: discord.Interaction):
     """Allow admins to manually end giveaways"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     # Get active giveaways for this server
-    server_giveaways = [(gid, g) for gid, g in active_giveaways.items() if g['channel_id'] in [c.id for c in interaction.guild.channels]]
+    guild_state = bot_state.guild(interaction.guild.id if interaction.guild else None)
     
-    if not server_giveaways:
+    if not guild_state.giveaways:
         await interaction.response.send_message("❌ No active giveaways found in this server.", ephemeral=True)
         return
     
-    # Create selection view
-    view = EndGiveawayView(server_giveaways)
-    
-    embed = discord.Embed(
-        title="🎲 End Giveaway",
-        description=f"Select a giveaway to end manually:\n\n**Active Giveaways:** {len(server_giveaways)}",
-        color=0x5B2C6F
-    )
+    # Create selection view, one page of giveaways at a time
+    view = EndGiveawayView(guild_state)
     
-    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+    await interaction.response.send_message(embed=view.create_embed(), view=view, ephemeral=True)
 
 class EndGiveawayView(discord.ui.View):
-    def __init__(self, giveaways):
+    """Giveaways of a guild by end time, 25 per page (Discord select limit)"""
+    
+    def __init__(self, guild_state, page=0):
         super().__init__(timeout=300)
-        self.giveaways = giveaways
+        self.guild_state = guild_state
+        
+        # Giveaways may have ended since the last page was shown
+        total = len(guild_state.giveaways)
+        self.pages = max(1, math.ceil(total / GIVEAWAY_PAGE_SIZE))
+        self.page = min(page, self.pages - 1)
+        giveaways = guild_state.giveaways_by_end(self.page * GIVEAWAY_PAGE_SIZE, GIVEAWAY_PAGE_SIZE)
         
         # Create select options
         options = []
-        for gid, giveaway in giveaways[:25]:  # Discord limit
+        for giveaway in giveaways:
             options.append(discord.SelectOption(
-                label=f"#{gid}: {giveaway['prize'][:50]}",
-                value=str(gid),
+                label=f"#{giveaway['id']}: {giveaway['prize'][:50]}",
+                value=str(giveaway['id']),
                 description=f"Ends: {giveaway['end_time'].strftime('%Y-%m-%d %H:%M')} UTC"
             ))
         
-        self.add_item(GiveawaySelectMenu(options))
+        if options:
+            self.add_item(GiveawaySelectMenu(options))
+        
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+    
+    def create_embed(self):
+        description = f"Select a giveaway to end manually:\n\n**Active Giveaways:** {len(self.guild_state.giveaways)}"
+        if self.pages > 1:
+            description += f"\n**Page:** {self.page + 1}/{self.pages}"
+        return discord.Embed(
+            title="🎲 End Giveaway",
+            description=description,
+            color=0x5B2C6F
+        )
+    
+    async def show_page(self, interaction, page):
+        view = EndGiveawayView(self.guild_state, page)
+        await interaction.response.edit_message(embed=view.create_embed(), view=view)
+    
+    @discord.ui.button(label='◀ Previous', style=discord.ButtonStyle.secondary, row=1)
+    @middleware.component()
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+    
+    @discord.ui.button(label='Next ▶', style=discord.ButtonStyle.secondary, row=1)
+    @middleware.component()
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
 
 class GiveawaySelectMenu(discord.ui.Select):
     def __init__(self, options):
         super().__init__(placeholder="Select a giveaway to end...", options=options)
     
+    @middleware.component()
     async def callback(self, interaction: discord.Interaction):
         giveaway_id = int(self.values[0])
+        giveaways = bot_state.guild(interaction.guild.id if interaction.guild else None).giveaways
         
-        if giveaway_id not in active_giveaways:
+        if giveaway_id not in giveaways:
             await interaction.response.send_message("❌ This giveaway no longer exists!", ephemeral=True)
             return
         
-        giveaway = active_giveaways[giveaway_id]
+        giveaway = giveaways[giveaway_id]
         
         # Create confirmation view
         confirm_view = EndGiveawayConfirmView(giveaway_id, giveaway)
@@ -2603,40 +2968,27 @@ class EndGiveawayConfirmView(discord.ui.View):
         self.giveaway_data = giveaway_data
     
     @discord.ui.button(label='✅ End Giveaway', style=discord.ButtonStyle.danger)
+    @middleware.component()
     async def confirm_end(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(ephemeral=True)
         
         # End the giveaway
-        await end_giveaway(self.giveaway_id)
+        await end_giveaway(self.giveaway_data['guild_id'], self.giveaway_id)
         
         await interaction.followup.send(f"✅ Giveaway **{self.giveaway_data['prize']}** has been ended manually!", ephemeral=True)
     
     @discord.ui.button(label='❌ Cancel', style=discord.ButtonStyle.secondary)
+    @middleware.component()
     async def cancel_end(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message("❌ Giveaway termination cancelled.", ephemeral=True)
 
 
 
 @bot.tree.command(name="clear", description="Clear messages from the channel (Admin only)")
+@middleware.command('guild_admin')
 async def clear_command(interaction: discord.Interaction, amount: int = None):
     """Clear messages from the channel with optional amount"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
-    # Check if command is used in a guild
-    if not interaction.guild:
-        await interaction.response.send_message("❌ This command can only be used in a server!", ephemeral=True)
-        return
-    
     # Check bot permissions
     if not interaction.guild.me.guild_permissions.manage_messages:
         await interaction.response.send_message("❌ I don't have permission to manage messages in this server!", ephemeral=True)
@@ -2702,6 +3054,8 @@ class ClearConfirmView(discord.ui.View):
         self.amount = amount
     
     @discord.ui.button(label='✅ Confirm Clear', style=discord.ButtonStyle.danger)
+    @middleware.component()
+    @interaction_flights.guard(channel_action('clear'), "⏳ Messages are already being cleared in this channel.")
     async def confirm_clear(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
             await interaction.response.defer(ephemeral=True)
@@ -2733,24 +3087,15 @@ class ClearConfirmView(discord.ui.View):
             await interaction.followup.send("❌ An error occurred while clearing messages!", ephemeral=True)
     
     @discord.ui.button(label='❌ Cancel', style=discord.ButtonStyle.secondary)
+    @middleware.component()
     async def cancel_clear(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message("❌ Clear operation cancelled.", ephemeral=True)
 
 @bot.tree.command(name="pricing", description="Display Rocket League boosting pricing grid (Admin only)")
+@middleware.command('admin')
 async def pricing_command(interaction: discord.Interaction):
     """Display the Rocket League boosting pricing grid"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     try:
         # Create embed with title for better visibility
         embed = discord.Embed(
@@ -2778,20 +3123,10 @@ async def pricing_command(interaction: discord.Interaction):
         await interaction.response.send_message("❌ An error occurred while displaying the pricing grid.", ephemeral=True)
 
 @bot.tree.command(name="tournaments", description="Display Rocket League tournament pricing (Admin only)")
+@middleware.command('admin')
 async def tournaments_command(interaction: discord.Interaction):
     """Display the Rocket League tournament pricing grid"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     try:
         # Create embed with title for better visibility
         embed = discord.Embed(
@@ -2819,20 +3154,10 @@ async def tournaments_command(interaction: discord.Interaction):
         await interaction.response.send_message("❌ An error occurred while displaying the tournament pricing.", ephemeral=True)
 
 @bot.tree.command(name="season-rewards", description="Display Rocket League season rewards pricing (Admin only)")
+@middleware.command('admin')
 async def season_rewards_command(interaction: discord.Interaction):
     """Display the Rocket League season rewards pricing grid"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     try:
         # Create embed with title for better visibility
         embed = discord.Embed(
@@ -2860,20 +3185,10 @@ async def season_rewards_command(interaction: discord.Interaction):
         await interaction.response.send_message("❌ An error occurred while displaying the season rewards pricing.", ephemeral=True)
 
 @bot.tree.command(name="rewards", description="Display server rewards system (Admin only)")
+@middleware.command('admin')
 async def rewards_command(interaction: discord.Interaction):
     """Display the server rewards system with bonuses"""
     
-    # Check DM permissions - STRICT
-    if interaction.guild is None:  # DM context
-        if interaction.user.id != ADMIN_USER_ID:
-            await interaction.response.send_message("❌ Only administrators can use bot commands in DM.", ephemeral=True)
-            return
-    
-    # Check if user has admin permissions in server
-    if interaction.guild and not interaction.user.guild_permissions.administrator:
-        await interaction.response.send_message("❌ You need administrator permissions to use this command.", ephemeral=True)
-        return
-    
     try:
         # Create main rewards embed
         embed = discord.Embed(
@@ -2925,17 +3240,34 @@ async def rewards_command(interaction: discord.Interaction):
 @bot.event
 async def on_message(message):
     """Handle messages, anti-spam moderation, and update sticky if needed"""
+    # Log ticket messages (bot messages included) for the transcript
+    ticket_logs.on_message(message)
+    
     # Ignore bot messages to prevent infinite loops
     if message.author.bot:
         return
     
+    # Blocked terms and patterns first, a removed message doesn't count towards spam
+    if await check_automod(message):
+        return
+    
+    # Scam links and invites to other servers
+    if await check_links(message):
+        return
+    
     # Check for spam and take action if needed
     is_spam = await check_spam(message)
     if is_spam:
         return  # Message was deleted for spam, stop processing
     
     # Check if this channel has a sticky review message
-    if message.channel.id in sticky_channels:
+    if message.guild and message.channel.id in bot_state.guild(message.guild.id).sticky_channels:
+        if load_monitor.should_shed('sticky'):
+            # Repost once the bot has recovered
+            deferred_sticky_channels.add(message.channel.id)
+            await bot.process_commands(message)
+            return
+        
         # Wait a moment to avoid spam
         await asyncio.sleep(0.5)
         # Update sticky message to keep it at bottom
@@ -2944,39 +3276,182 @@ async def on_message(message):
     # Process commands normally
     await bot.process_commands(message)
 
-@bot.event
-async def on_member_join(member):
-    """Handle new member joining - Send them verification instructions"""
+def create_welcome_embed(member):
+    """Create the welcome DM embed for a new member"""
+    embed = discord.Embed(
+        title="🎉 Welcome to the Server!",
+        description=f"Hello {member.mention}! Welcome to our community.",
+        color=0x5B2C6F
+    )
+    
+    embed.add_field(
+        name="🔒 Get Verified",
+        value="To access all server features, please verify your identity in the verification channel.",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="📝 How to Verify",
+        value="1. Go to the verification channel\n2. Click the 'Verify Identity' button\n3. Complete the authorization process\n4. Receive your verified role automatically!",
+        inline=False
+    )
+    
+    embed.set_footer(text="Voralith Welcome System", icon_url="https://cdn.discordapp.com/attachments/1156246022104825920/1321844863446892574/voralith-logo.png")
     
-    # Send welcome DM with verification instructions
+    return embed
+
+async def send_welcome_dm(member):
+    """Send the welcome DM with verification instructions"""
     try:
+        await member.send(embed=create_welcome_embed(member))
+        logger.info(f"Sent welcome DM to {member.name}")
+        
+    except discord.Forbidden:
+        logger.warning(f"Could not send welcome DM to {member.name} - DMs disabled")
+    except Exception as e:
+        logger.error(f"Error sending welcome DM to {member.name}: {e}")
+
+async def welcome_dm_worker():
+    """Send queued welcome DMs one at a time so join bursts can't stall the bot"""
+    await bot.wait_until_ready()
+    
+    while not bot.is_closed():
+        try:
+            guild_id, member_id, member = await welcome_queue.get()
+            
+            # Joiners queued before raid mode kicked in go to the digest instead,
+            # as do joiners while the bot sheds load
+            if join_guard.in_raid_mode(guild_id) or load_monitor.should_shed('welcome_dm'):
+                welcome_queue.drop(guild_id, member_id)
+                continue
+            
+            await send_welcome_dm(member)
+            await asyncio.sleep(WELCOME_DM_INTERVAL)
+            
+        except Exception as e:
+            logger.error(f"Welcome DM worker error: {e}")
+            await asyncio.sleep(WELCOME_DM_INTERVAL)
+
+def find_verification_channel(guild):
+    """Find the verification channel of a guild by name"""
+    for ch in guild.text_channels:
+        if "verif" in ch.name.lower():
+            return ch
+    return None
+
+@tasks.loop(seconds=WELCOME_DIGEST_INTERVAL)
+async def post_welcome_digests():
+    """Post members whose welcome DM was skipped to the verification channel"""
+    for guild_id, member_ids in welcome_queue.take_dropped().items():
+        guild = bot.get_guild(guild_id)
+        if not guild:
+            continue
+        
+        channel = find_verification_channel(guild)
+        if not channel:
+            logger.warning(f"No verification channel found in {guild.name} for welcome digest ({len(member_ids)} members)")
+            continue
+        
+        mentions = " ".join(f"<@{member_id}>" for member_id in member_ids[:100])
+        if len(member_ids) > 100:
+            mentions += f" … and {len(member_ids) - 100} more"
+        
         embed = discord.Embed(
-            title="🎉 Welcome to the Server!",
-            description=f"Hello {member.mention}! Welcome to our community.",
+            title="🎉 Welcome New Members!",
+            description=f"{mentions}\n\nWelcome to the server! Click the **Verify Identity** button in this channel to get verified and access all server features.",
             color=0x5B2C6F
         )
         
-        embed.add_field(
-            name="🔒 Get Verified",
-            value="To access all server features, please verify your identity in the verification channel.",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="📝 How to Verify",
-            value="1. Go to the verification channel\n2. Click the 'Verify Identity' button\n3. Complete the authorization process\n4. Receive your verified role automatically!",
-            inline=False
-        )
+        if join_guard.in_raid_mode(guild_id):
+            embed.add_field(
+                name="🛡️ Raid Protection",
+                value=f"High join rate detected ({join_guard.recent_joins(guild_id)}+ joins in the last minute). Welcome DMs are paused.",
+                inline=False
+            )
         
         embed.set_footer(text="Voralith Welcome System", icon_url="https://cdn.discordapp.com/attachments/1156246022104825920/1321844863446892574/voralith-logo.png")
         
-        await member.send(embed=embed)
-        logger.info(f"Sent welcome DM to {member.name}")
-        
-    except discord.Forbidden:
-        logger.warning(f"Could not send welcome DM to {member.name} - DMs disabled")
+        try:
+            await channel.send(embed=embed)
+            logger.info(f"Posted welcome digest for {len(member_ids)} members in {guild.name}")
+        except Exception as e:
+            logger.error(f"Error posting welcome digest in {guild.name}: {e}")
+
+@bot.event
+async def on_member_join(member):
+    """Handle new member joining - Queue their verification instructions"""
+    
+    if join_guard.record(member.guild.id):
+        # Raid mode: no DMs, the member is listed in the next digest
+        welcome_queue.drop(member.guild.id, member.id)
+        logger.warning(f"Raid mode active in {member.guild.name} - skipped welcome DM for {member.name}")
+        return
+    
+    if not welcome_queue.offer(member.guild.id, member.id, member):
+        logger.info(f"Welcome DM for {member.name} not queued (duplicate or queue full)")
+
+@bot.event
+async def on_guild_remove(guild):
+    """Drop the state partition of a guild the bot was removed from"""
+    bot_state.drop_guild(guild.id)
+    member_lookup.drop_guild(guild.id)
+    automod.drop_guild(guild.id)
+    logger.info(f"Removed from guild {guild.name}, dropped its state")
+
+@bot.event
+async def on_raw_message_edit(payload):
+    """Keep ticket logs up to date with edits, cached or not"""
+    ticket_logs.on_raw_edit(payload.channel_id, payload.message_id, payload.data)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    ticket_logs.on_raw_delete(payload.channel_id, [payload.message_id])
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    ticket_logs.on_raw_delete(payload.channel_id, payload.message_ids)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    """Forget the log of a deleted ticket channel"""
+    ticket_logs.drop(channel.id)
+
+async def reconcile_ticket_logs():
+    """Restore saved ticket logs, then fill them with messages missed while the bot was offline"""
+    channels = [channel for guild in bot.guilds for channel in guild.text_channels if is_ticket_channel(channel)]
+    missing = [channel.id for channel in channels if not (ticket_logs.get(channel.id) and ticket_logs.get(channel.id).has_head)]
+    try:
+        for channel_id, has_head, overflow, rows in await asyncio.to_thread(state_backend.load_ticket_logs, missing):
+            ticket_logs.restore(channel_id, has_head, overflow, rows)
     except Exception as e:
-        logger.error(f"Error sending welcome DM to {member.name}: {e}")
+        logger.error(f"Error loading saved ticket logs: {e}")
+    
+    # Only messages after the last logged one are fetched
+    ticket_logs.mark_dirty()
+    for channel in channels:
+        try:
+            fetched = await ticket_logs.reconcile(channel)
+            if fetched:
+                logger.info(f"Reconciled ticket log of {channel.name}: {fetched} message(s)")
+        except Exception as e:
+            logger.error(f"Error reconciling ticket log of {channel.name}: {e}")
+
+@tasks.loop(seconds=TICKET_LOG_SAVE_INTERVAL)
+async def save_ticket_logs():
+    """Write new, edited and deleted ticket messages to the state backend in one batch"""
+    logs, dropped = ticket_logs.take_changes()
+    if not logs and not dropped:
+        return
+    try:
+        await asyncio.to_thread(state_backend.save_ticket_logs, logs, dropped)
+    except Exception as e:
+        ticket_logs.keep_changes(logs, dropped)
+        logger.warning(f"Saving ticket logs failed, retrying in {TICKET_LOG_SAVE_INTERVAL}s: {e}")
+
+@bot.event
+async def on_raw_member_remove(payload):
+    """Forget a member that left, also fires when the member was not cached"""
+    member_lookup.invalidate(payload.guild_id, payload.user.id)
 
 # Error handling
 @bot.event
@@ -0,0 +1,186 @@
+import asyncio
+import sys
+import time
+import tracemalloc
+from array import array
+from collections import OrderedDict
+
+# Member cache settings
+MEMBER_CACHE_MODES = ('full', 'on_demand', 'lazy')
+MEMBER_LRU_SIZE = 1000  # Members kept by the lazy lookup across all guilds
+MEMBER_LRU_TTL = 300  # Seconds before a looked up member is fetched again (roles may have changed)
+
+def member_cache_options(mode):
+    """Bot constructor arguments for a member cache mode
+
+    full: every member of every guild is chunked at startup and kept (discord.py default)
+    on_demand: members are cached as they show up, guilds are never chunked
+    lazy: no member cache at all, members are fetched through MemberLookup
+    """
+    import discord
+
+    if mode not in MEMBER_CACHE_MODES:
+        raise RuntimeError(f"MEMBER_CACHE must be one of {', '.join(MEMBER_CACHE_MODES)}, got {mode!r}")
+    if mode == 'full':
+        return {'member_cache_flags': discord.MemberCacheFlags.all(), 'chunk_guilds_at_startup': True}
+    if mode == 'on_demand':
+        return {'member_cache_flags': discord.MemberCacheFlags.all(), 'chunk_guilds_at_startup': False}
+    return {'member_cache_flags': discord.MemberCacheFlags.none(), 'chunk_guilds_at_startup': False}
+
+def admin_roles(guild):
+    """Roles granting administrator
+
+    Used for ticket overwrites instead of walking guild.members, which is
+    empty unless the whole guild is cached.
+    """
+    return [role for role in guild.roles if role.permissions.administrator and not role.is_default()]
+
+class MemberLookup:
+    """Small LRU of fetched members in front of guild.fetch_member
+
+    Concurrent lookups of the same member share one API request.
+    """
+
+    def __init__(self, maxsize=MEMBER_LRU_SIZE, ttl=MEMBER_LRU_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (guild_id, user_id) -> (expires_at, member)
+        self.pending = {}  # (guild_id, user_id) -> fetch task
+        self.hits = 0
+        self.misses = 0
+
+    def get_cached(self, guild_id, user_id, now=None):
+        """Cached member or None, without any API call"""
+        key = (guild_id, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= (now if now is not None else time.monotonic()):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, guild_id, user_id, member, now=None):
+        key = (guild_id, user_id)
+        self.entries[key] = ((now if now is not None else time.monotonic()) + self.ttl, member)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, guild_id, user_id):
+        self.entries.pop((guild_id, user_id), None)
+
+    def drop_guild(self, guild_id):
+        for key in [key for key in self.entries if key[0] == guild_id]:
+            del self.entries[key]
+
+    async def get(self, guild, user_id):
+        """Member of a guild from the gateway cache, the LRU or the API
+
+        Returns None if the user is not in the guild.
+        """
+        import discord
+
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+
+        member = self.get_cached(guild.id, user_id)
+        if member is not None:
+            self.hits += 1
+            return member
+
+        self.misses += 1
+        key = (guild.id, user_id)
+        task = self.pending.get(key)
+        if task is None:
+            task = self.pending[key] = asyncio.ensure_future(guild.fetch_member(user_id))
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        try:
+            member = await asyncio.shield(task)
+        except discord.NotFound:
+            return None
+        self.put(guild.id, user_id, member)
+        return member
+
+class _SimulatedUser:
+    # Same fields as discord.User
+    __slots__ = ('name', 'id', 'discriminator', 'global_name', '_avatar', '_banner', '_accent_colour',
+                 'bot', 'system', '_public_flags', '_state', '_avatar_decoration_data')
+
+    def __init__(self, user_id):
+        self.name = f"member{user_id}"
+        self.id = user_id
+        self.discriminator = '0'
+        self.global_name = f"Member {user_id}"
+        self._avatar = f"{user_id:032x}"
+        self._banner = None
+        self._accent_colour = None
+        self.bot = False
+        self.system = False
+        self._public_flags = 0
+        self._state = None
+        self._avatar_decoration_data = None
+
+class _SimulatedMember:
+    # Same fields as discord.Member
+    __slots__ = ('_roles', 'joined_at', 'premium_since', '_activities', 'guild', 'pending', 'nick',
+                 'timed_out_until', '_permissions', '_client_status', '_user', '_state', '_avatar',
+                 '_banner', '_flags', '_avatar_decoration_data')
+
+    def __init__(self, user_id, roles):
+        self._roles = array('Q', roles)
+        self.joined_at = time.time()
+        self.premium_since = None
+        self._activities = ()
+        self.guild = None
+        self.pending = False
+        self.nick = None
+        self.timed_out_until = None
+        self._permissions = None
+        self._client_status = {None: 'offline'}
+        self._user = _SimulatedUser(user_id)
+        self._state = None
+        self._avatar = None
+        self._banner = None
+        self._flags = 0
+        self._avatar_decoration_data = None
+
+def _measure(build):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del kept
+    return used
+
+def _benchmark(counts=(10_000, 100_000), lookups=20_000):
+    """Compare full member cache memory with the lazy lookup
+
+    Members are simulated with the same fields as discord.Member, so the
+    numbers are an estimate of the Python object overhead, not of a live bot.
+    """
+    roles = [1_000_000 + i for i in range(3)]
+    for count in counts:
+        def full_cache():
+            return {user_id: _SimulatedMember(user_id, roles) for user_id in range(count)}
+
+        def lazy_cache():
+            lookup = MemberLookup()
+            # Only members that actually open tickets or verify are looked up
+            for i in range(lookups):
+                user_id = (i * 7919) % count
+                if lookup.get_cached(1, user_id) is None:
+                    lookup.put(1, user_id, _SimulatedMember(user_id, roles))
+            return lookup
+
+        full = _measure(full_cache)
+        lazy = _measure(lazy_cache)
+        print(f"{count:>7} members: full cache {full / 1024 / 1024:7.1f} MiB, "
+              f"lazy lookup {lazy / 1024 / 1024:5.2f} MiB ({MEMBER_LRU_SIZE} entries max)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "memory":
+        _benchmark()
@@ -0,0 +1,331 @@
+import asyncio
+import functools
+import logging
+import sys
+import time
+
+from tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+# Replies of the permission check
+DM_DENIED = "❌ Only administrators can use bot commands in DM."
+ADMIN_DENIED = "❌ You need administrator permissions to use this command."
+GUILD_ONLY = "❌ This command can only be used in a server."
+DEFAULT_ERROR = "❌ An error occurred, please try again."
+
+# Auto-defer settings (Discord drops interactions not acknowledged within 3 seconds)
+AUTO_DEFER_AFTER = 2.0  # Seconds into a handler before the middleware acknowledges for it, the rest covers the defer itself
+AUTO_DEFER_ESTIMATE = 1.5  # Handlers answering slower than this (recent p90) are deferred right away
+AUTO_DEFER_QUANTILE = 0.9
+AUTO_DEFER_MIN_SAMPLES = 20  # Recent interactions of a handler needed before trusting its estimate
+
+# Permission levels of a handler
+PERMISSIONS = (
+    None,  # Anyone, anywhere
+    'admin',  # Server administrators, or the bot owner in DM
+    'guild_admin',  # Server administrators, never in DM
+)
+
+class AutoDeferResponse:
+    """interaction.response of a handler the middleware may acknowledge for
+
+    The handler's first response and the middleware's defer are serialized
+    by a lock. Once the middleware has deferred, the handler's responses go
+    out as followups (send_message) or edits of the original message
+    (edit_message), so handlers keep using interaction.response as usual.
+    A modal can't follow a defer: handlers sending one must not auto-defer.
+    """
+
+    def __init__(self, interaction, trace, ephemeral):
+        self.interaction = interaction
+        self.response = interaction.response
+        self.trace = trace
+        self.ephemeral = ephemeral  # Visibility of the "thinking" message of a deferred command
+        self.lock = asyncio.Lock()
+        self.deferred = False  # Acknowledged by the middleware
+        self.answered = False  # The handler responded itself
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def is_done(self):
+        """Whether the handler responded, a defer by the middleware doesn't count"""
+        if self.deferred:
+            return self.answered
+        return self.response.is_done()
+
+    def _answer(self):
+        self.answered = True
+        if self.trace.reply is None:
+            self.trace.reply = time.perf_counter()
+
+    async def auto_defer(self):
+        """Acknowledge for the handler unless it already responded"""
+        async with self.lock:
+            if self.response.is_done():
+                return False
+            await self.response.defer(ephemeral=self.ephemeral)
+            self.deferred = True
+            self.trace.auto_deferred = True
+            return True
+
+    async def send_message(self, *args, **kwargs):
+        async with self.lock:
+            if not self.deferred:
+                result = await self.response.send_message(*args, **kwargs)
+                self._answer()
+                return result
+        self._answer()
+        delete_after = kwargs.pop('delete_after', None)
+        message = await self.interaction.followup.send(*args, wait=delete_after is not None, **kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def edit_message(self, *args, **kwargs):
+        async with self.lock:
+            if not self.deferred:
+                result = await self.response.edit_message(*args, **kwargs)
+                self._answer()
+                return result
+        self._answer()
+        delete_after = kwargs.pop('delete_after', None)
+        message = await self.interaction.edit_original_response(*args, **kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def defer(self, *args, **kwargs):
+        async with self.lock:
+            if not self.deferred:
+                result = await self.response.defer(*args, **kwargs)
+                self._answer()
+                return result
+        self._answer()  # Already acknowledged
+        return None
+
+def _replace_response(interaction, response):
+    try:
+        interaction.response = response
+    except AttributeError:
+        # discord.Interaction.response is a read-only property cached in this slot
+        interaction._cs_response = response
+
+class InteractionMiddleware:
+    """Pipeline shared by slash commands and component callbacks
+
+    Every interaction is traced, then goes through the permission check and
+    the optional defer before its handler runs. An exception in the handler
+    is logged and answered with the reply mapped to its type, so the user
+    never sees "The application did not respond".
+
+    Handlers with auto_defer are acknowledged by the middleware when they
+    haven't answered after defer_after seconds, or right away when their
+    recent answers took longer than defer_estimate (see AutoDeferResponse).
+    """
+
+    def __init__(self, tracer, owner_id, error_replies=(), defer_after=AUTO_DEFER_AFTER, defer_estimate=AUTO_DEFER_ESTIMATE):
+        self.tracer = tracer
+        self.owner_id = owner_id  # Only user allowed to run admin commands in DM
+        self.error_replies = list(error_replies)  # [(exception type, reply)], first match wins
+        self.defer_after = defer_after
+        self.defer_estimate = defer_estimate
+
+    def denied(self, interaction, permission):
+        """Reply for a user not allowed to run the handler, None if allowed"""
+        if permission is None:
+            return None
+        if interaction.guild is None:
+            if permission == 'guild_admin':
+                return GUILD_ONLY
+            return None if interaction.user.id == self.owner_id else DM_DENIED
+        if not interaction.user.guild_permissions.administrator:
+            return ADMIN_DENIED
+        return None
+
+    def error_reply(self, error):
+        for error_type, reply in self.error_replies:
+            if isinstance(error, error_type):
+                return reply
+        return DEFAULT_ERROR
+
+    async def reply(self, interaction, content):
+        """Ephemeral reply, as a followup once the interaction was acknowledged"""
+        if interaction.response.is_done():
+            await interaction.followup.send(content, ephemeral=True)
+        else:
+            await interaction.response.send_message(content, ephemeral=True)
+
+    async def _defer_later(self, name, response):
+        await asyncio.sleep(self.defer_after)
+        try:
+            await response.auto_defer()
+        except Exception as e:
+            logger.warning(f"Could not defer {name}: {e}")
+
+    async def arm_auto_defer(self, name, interaction, trace, ephemeral):
+        """Install the auto-defer response, returns the deadline timer (None if deferred at once)"""
+        response = AutoDeferResponse(interaction, trace, ephemeral)
+        _replace_response(interaction, response)
+        estimate = self.tracer.reply_estimate(name, AUTO_DEFER_QUANTILE, AUTO_DEFER_MIN_SAMPLES)
+        if estimate is not None and estimate > self.defer_estimate:
+            await response.auto_defer()
+            return None
+        return asyncio.ensure_future(self._defer_later(name, response))
+
+    async def run(self, name, kind, interaction, handler, permission=None, defer=None, auto_defer=None):
+        trace = self.tracer.start(name, kind, interaction)
+        token = current_trace.set(trace)
+        outcome = 'ok'
+        timer = None
+        try:
+            message = self.denied(interaction, permission)
+            if message is not None:
+                outcome = 'denied'
+                await self.reply(interaction, message)
+                return None
+
+            if defer is not None and not interaction.response.is_done():
+                await interaction.response.defer(ephemeral=defer == 'ephemeral')
+            elif auto_defer is not None and not interaction.response.is_done():
+                timer = await self.arm_auto_defer(name, interaction, trace, auto_defer == 'ephemeral')
+            return await handler()
+        except Exception as e:
+            outcome = 'error'
+            logger.error(f"Error in {name}: {e}", exc_info=True)
+            try:
+                await self.reply(interaction, self.error_reply(e))
+            except Exception:
+                pass  # The interaction expired, the error is logged
+        finally:
+            if timer is not None:
+                timer.cancel()
+            current_trace.reset(token)
+            self.tracer.finish(trace, outcome)
+
+    def command(self, permission=None, defer=None, auto_defer=None):
+        """Decorator for app command callbacks, placed right under @bot.tree.command
+
+        permission: None, 'admin' or 'guild_admin' (see PERMISSIONS)
+        defer: 'ephemeral' or 'public' to acknowledge before the handler runs
+        auto_defer: 'ephemeral' or 'public' to acknowledge only if the handler is slow
+        """
+        assert permission in PERMISSIONS
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(interaction, *args, **kwargs):
+                command = getattr(interaction, 'command', None)
+                name = f"/{command.qualified_name}" if command is not None else func.__name__
+                return await self.run(name, 'command', interaction, lambda: func(interaction, *args, **kwargs), permission, defer, auto_defer)
+            return wrapper
+        return decorator
+
+    def component(self, permission=None, defer=None, auto_defer=False):
+        """Decorator for button and select callbacks, placed under @discord.ui.button
+
+        auto_defer: acknowledge (as a silent update of the message) only if the handler is slow
+        """
+        assert permission in PERMISSIONS
+        def decorator(func):
+            name = func.__qualname__
+            @functools.wraps(func)
+            async def wrapper(component, interaction, *args):
+                return await self.run(name, 'component', interaction, lambda: func(component, interaction, *args), permission, defer,
+                                      'ephemeral' if auto_defer else None)
+            return wrapper
+        return decorator
+
+def _selftest():
+    """Permission levels, error mapping and tracing with stand-in interactions"""
+    import asyncio
+    from types import SimpleNamespace
+
+    from tracing import InteractionTracer, instrument_ack
+
+    logger.disabled = True  # The failing handler is expected, skip its traceback
+
+    class Response:
+        def __init__(self, sent):
+            self.sent = sent
+            self.done = False
+            self.deferred = False
+
+        def is_done(self):
+            return self.done
+
+        async def send_message(self, content, ephemeral=False):
+            self.done = True
+            self.sent.append(content)
+
+        async def defer(self, ephemeral=False):
+            self.done = True
+            self.deferred = True
+
+    instrument_ack(Response, 'send_message')
+    instrument_ack(Response, 'defer')
+
+    def interaction(guild_admin=None, user_id=2):
+        sent = []
+        guild = SimpleNamespace(id=1) if guild_admin is not None else None
+        user = SimpleNamespace(id=user_id, guild_permissions=SimpleNamespace(administrator=bool(guild_admin)))
+        followup = SimpleNamespace(send=lambda content, **kwargs: asyncio.sleep(0, sent.append(f"followup: {content}")))
+        return SimpleNamespace(guild=guild, user=user, response=Response(sent), followup=followup), sent
+
+    async def selftest():
+        middleware = InteractionMiddleware(InteractionTracer(path=''), owner_id=99, error_replies=[(KeyError, "❌ Not found.")])
+
+        @middleware.command('admin')
+        async def admin_command(interaction, value):
+            await interaction.response.send_message(f"ok {value}")
+
+        @middleware.command('guild_admin', defer='ephemeral')
+        async def guild_command(interaction):
+            raise KeyError('gone')
+
+        cases = [
+            (admin_command, interaction(guild_admin=True), ("x",), "ok x"),
+            (admin_command, interaction(guild_admin=False), ("x",), ADMIN_DENIED),
+            (admin_command, interaction(), ("x",), DM_DENIED),
+            (admin_command, interaction(user_id=99), ("x",), "ok x"),
+            (guild_command, interaction(user_id=99), (), GUILD_ONLY),
+            (guild_command, interaction(guild_admin=True), (), "followup: ❌ Not found."),
+        ]
+        for handler, (inter, sent), args, expected in cases:
+            await handler(inter, *args)
+            assert sent == [expected], (handler.__name__, sent, expected)
+        stats = middleware.tracer.snapshot()
+        print({name: (s['count'], s['denied'], s['errors']) for name, s in stats.items()})
+        assert stats['guild_command']['errors'] == 1 and stats['admin_command']['denied'] == 2
+
+        # Auto-defer: a slow handler is acknowledged at the deadline and answers as a followup
+        middleware = InteractionMiddleware(InteractionTracer(path=''), owner_id=99, defer_after=0.05, defer_estimate=0.04)
+
+        @middleware.command(auto_defer='ephemeral')
+        async def slow_command(interaction, delay):
+            await asyncio.sleep(delay)
+            await interaction.response.send_message("done")
+
+        inter, sent = interaction()
+        await slow_command(inter, 0)
+        assert sent == ["done"] and not inter.response.deferred
+        inter, sent = interaction()
+        await slow_command(inter, 0.1)
+        assert sent == ["followup: done"] and inter.response.deferred
+        trace_stats = middleware.tracer.handlers['slow_command']
+        assert trace_stats.auto_defers == 1 and trace_stats.ack[-1] < trace_stats.reply[-1]
+
+        # Consistently slow: deferred before the handler runs
+        for _ in range(AUTO_DEFER_MIN_SAMPLES):
+            await slow_command(interaction()[0], 0.06)
+        inter, sent = interaction()
+        await slow_command(inter, 0.01)
+        print(f"slow_command: acknowledged in {trace_stats.ack[-1] * 1000:.1f}ms after {AUTO_DEFER_MIN_SAMPLES} slow runs, "
+              f"{trace_stats.auto_defers} auto-defers")
+        assert sent == ["followup: done"] and trace_stats.ack[-1] < 0.01
+
+    asyncio.run(selftest())
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
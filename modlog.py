@@ -0,0 +1,220 @@
+import asyncio
+import datetime
+import logging
+import sys
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Moderation case log settings
+MODLOG_FLUSH_INTERVAL = 2  # Seconds between batched writes
+MODLOG_BATCH_SIZE = 200  # Queued cases that trigger an early write
+MODLOG_PAGE_SIZE = 10  # Cases per /modlog page
+MODLOG_MEMORY_CASES = 5000  # Cases kept per guild without a database
+MODLOG_MAX_PENDING = 20000  # Queued cases kept while the database is down, the oldest are dropped beyond this
+
+CASE_COLUMNS = "id, guild_id, target_id, moderator_id, action, reason, created_at, expires_at"
+
+class ModCase:
+    __slots__ = ('id', 'guild_id', 'target_id', 'moderator_id', 'action', 'reason', 'created_at', 'expires_at')
+
+    def __init__(self, case_id, guild_id, target_id, moderator_id, action, reason, created_at, expires_at=None):
+        self.id = case_id
+        self.guild_id = guild_id
+        self.target_id = target_id
+        self.moderator_id = moderator_id  # None for automatic moderation
+        self.action = action
+        self.reason = reason
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+class ModLog:
+    """Moderation cases (mutes, unmutes, automatic warnings and timeouts)
+
+    record() only queues a case, a background task writes the queue in one
+    multi-row INSERT every few seconds or as soon as a raid fills a batch.
+    History is read newest first with keyset pagination on the case id, using
+    the (guild_id, target_id, id) index. Without DATABASE_URL cases are kept
+    in memory, a bounded number per guild.
+    """
+
+    def __init__(self, dsn=None):
+        self.dsn = dsn
+        self.pending = []
+        self.batch_full = asyncio.Event()
+        self.memory = defaultdict(list)  # guild_id -> ModCase, oldest first (no database)
+        self.memory_id = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0  # Cases lost to a long database outage
+
+    def _connection(self):
+        # Same pool as the state backend
+        from state_backend import shared_pool
+        return shared_pool(self.dsn).connection()
+
+    def init_schema(self):
+        if not self.dsn:
+            return
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS mod_cases (
+                        id BIGSERIAL PRIMARY KEY,
+                        guild_id BIGINT NOT NULL,
+                        target_id BIGINT NOT NULL,
+                        moderator_id BIGINT,
+                        action VARCHAR(20) NOT NULL,
+                        reason TEXT,
+                        created_at TIMESTAMP NOT NULL,
+                        expires_at TIMESTAMP
+                    )
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_mod_cases_target ON mod_cases (guild_id, target_id, id DESC)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_mod_cases_created ON mod_cases (guild_id, created_at)")
+                conn.commit()
+
+    def record(self, guild_id, target_id, moderator_id, action, reason, expires_at=None):
+        """Queue a case; moderator_id None means automatic moderation"""
+        self.pending.append((guild_id, target_id, moderator_id, action, reason, datetime.datetime.utcnow(), expires_at))
+        if len(self.pending) >= MODLOG_BATCH_SIZE:
+            self.batch_full.set()
+
+    def _write(self, batch):
+        from psycopg2.extras import execute_values
+
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, """
+                    INSERT INTO mod_cases (guild_id, target_id, moderator_id, action, reason, created_at, expires_at)
+                    VALUES %s
+                """, batch, page_size=MODLOG_BATCH_SIZE)
+                conn.commit()
+
+    async def flush(self):
+        """Write every queued case"""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, []
+        self.batch_full.clear()
+
+        if not self.dsn:
+            for row in batch:
+                self.memory_id += 1
+                cases = self.memory[row[0]]
+                cases.append(ModCase(self.memory_id, *row))
+                if len(cases) > MODLOG_MEMORY_CASES:
+                    del cases[:len(cases) - MODLOG_MEMORY_CASES]
+        else:
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                # Put the cases back, they are retried with the next batch
+                self.pending[:0] = batch
+                logger.error(f"Error writing {len(batch)} moderation case(s): {e}")
+                if len(self.pending) > MODLOG_MAX_PENDING:
+                    dropped = len(self.pending) - MODLOG_MAX_PENDING
+                    del self.pending[:dropped]
+                    self.dropped += dropped
+                    logger.warning(f"Moderation case queue full, dropped the {dropped} oldest case(s)")
+                return 0
+
+        self.written += len(batch)
+        self.batches += 1
+        return len(batch)
+
+    async def run(self, interval=MODLOG_FLUSH_INTERVAL):
+        while True:
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def _fetch(self, guild_id, target_id, before, after, limit):
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                if after is not None:
+                    cursor.execute(f"""
+                        SELECT {CASE_COLUMNS} FROM mod_cases
+                        WHERE guild_id = %s AND target_id = %s AND id > %s
+                        ORDER BY id ASC LIMIT %s
+                    """, (guild_id, target_id, after, limit))
+                    return [ModCase(*row) for row in reversed(cursor.fetchall())]
+                cursor.execute(f"""
+                    SELECT {CASE_COLUMNS} FROM mod_cases
+                    WHERE guild_id = %s AND target_id = %s AND id < %s
+                    ORDER BY id DESC LIMIT %s
+                """, (guild_id, target_id, before if before is not None else sys.maxsize, limit))
+                return [ModCase(*row) for row in cursor.fetchall()]
+
+    async def history(self, guild_id, target_id, before=None, after=None, limit=MODLOG_PAGE_SIZE):
+        """Cases of a member, newest first
+
+        before: page of cases older than this case id (the next page)
+        after: page of cases newer than this case id (the previous page)
+        Returns (cases, has_more) where has_more tells if a further page
+        exists in the direction asked for.
+        """
+        # Queued cases must be visible right away
+        await self.flush()
+
+        if not self.dsn:
+            cases = [case for case in reversed(self.memory[guild_id]) if case.target_id == target_id]
+            if after is not None:
+                newer = [case for case in cases if case.id > after]
+                return newer[-limit:], len(newer) > limit
+            older = [case for case in cases if before is None or case.id < before]
+            return older[:limit], len(older) > limit
+
+        cases = await asyncio.to_thread(self._fetch, guild_id, target_id, before, after, limit + 1)
+        if after is not None:
+            return cases[-limit:], len(cases) > limit
+        return cases[:limit], len(cases) > limit
+
+def _selftest(raiders=1000):
+    """Batching and paging against the in-memory store"""
+    async def selftest():
+        log = ModLog()
+        for i in range(raiders):
+            log.record(1, 1000 + i, None, 'timeout', "Automatic raid detection")
+        for i in range(25):
+            log.record(1, 42, 7, 'mute' if i % 2 == 0 else 'unmute', f"reason {i}")
+        await log.flush()
+        print(f"{log.written} cases in {log.batches} write(s)")
+
+        pages = []
+        cases, has_more = await log.history(1, 42)
+        pages.append(cases)
+        while has_more:
+            cases, has_more = await log.history(1, 42, before=cases[-1].id)
+            pages.append(cases)
+        print(f"Member history: {[len(page) for page in pages]} cases per page")
+        ids = [case.id for page in pages for case in page]
+        assert ids == sorted(ids, reverse=True) and len(ids) == 25
+
+        # Back from the last page to the first one
+        newer, has_newer = await log.history(1, 42, after=pages[-1][0].id)
+        assert [case.id for case in newer] == [case.id for case in pages[-2]] and has_newer
+
+        # Database outage: the queue is capped, the oldest cases go first
+        down = ModLog('postgresql://outage')
+
+        def write_failing(batch):
+            raise ConnectionError("database down")
+
+        down._write = write_failing
+        for i in range(MODLOG_MAX_PENDING + 500):
+            down.record(1, i, None, 'warn', "outage")
+        logging.disable(logging.ERROR)
+        await down.flush()
+        await down.flush()
+        logging.disable(logging.NOTSET)
+        assert len(down.pending) == MODLOG_MAX_PENDING and down.dropped == 500 and down.pending[0][1] == 500
+        print(f"Outage: {len(down.pending)} cases queued, {down.dropped} oldest dropped")
+
+    asyncio.run(selftest())
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
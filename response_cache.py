@@ -0,0 +1,123 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+
+# Response cache settings
+RESPONSE_CACHE_TTL = 30  # Seconds a cached panel is served, even without invalidation
+RESPONSE_CACHE_SIZE = 1000  # Cached responses (guild, command, params), least recently used dropped first
+
+class ResponseCache:
+    """Short-lived cache of command responses, e.g. admin stats embeds
+
+    Responses are cached per (guild, command, params) and depend on topics
+    ('verification', 'giveaways', 'vouches'...). Code changing the data calls
+    invalidate(guild_id, topic), which only bumps a counter: cached entries
+    built under an older counter are ignored on their next lookup. Admins
+    refreshing a panel at once share one build.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, maxsize=RESPONSE_CACHE_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries = OrderedDict()  # (guild_id, command, params) -> (expires, versions, response)
+        self.versions = {}  # (guild_id, topic) -> invalidation counter
+        self.inflight = {}  # key -> task building the response
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def invalidate(self, guild_id, topic):
+        key = (guild_id, topic)
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _versions(self, guild_id, topics):
+        return tuple(self.versions.get((guild_id, topic), 0) for topic in topics)
+
+    async def _build(self, key, versions, build):
+        self.builds += 1
+        response = await build()
+        self.entries[key] = (self.clock() + self.ttl, versions, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return response
+
+    async def get(self, guild_id, command, params, topics, build):
+        """Cached response, or the result of await build() cached for the next calls
+
+        params must be hashable (a tuple of the command options).
+        """
+        key = (guild_id, command, params)
+        versions = self._versions(guild_id, topics)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock() and entry[1] == versions:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            del self.entries[key]
+        self.misses += 1
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(key, versions, build))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self.inflight.pop(key, None))
+        # Shielded: one cancelled interaction must not cancel the build the others wait for
+        return await asyncio.shield(task)
+
+def _selftest(admins=50):
+    """Concurrent refreshes share a build, invalidation and expiry drop entries"""
+    now = [0.0]
+    built = []
+
+    async def selftest():
+        cache = ResponseCache(ttl=30, maxsize=2, clock=lambda: now[0])
+
+        def builder(guild_id):
+            async def build():
+                built.append(guild_id)
+                await asyncio.sleep(0.05)  # Aggregate query
+                return f"stats of {guild_id} v{len(built)}"
+            return build
+
+        # Many admins opening the same panel at once: one build
+        start = time.perf_counter()
+        results = await asyncio.gather(*(cache.get(1, 'verify_stats', (), ('verification',), builder(1)) for _ in range(admins)))
+        elapsed = time.perf_counter() - start
+        print(f"{admins} concurrent refreshes -> {cache.builds} build(s) in {elapsed * 1000:.0f}ms")
+        assert cache.builds == 1 and set(results) == {"stats of 1 v1"}
+
+        # Served from the cache until the topic is invalidated
+        assert await cache.get(1, 'verify_stats', (), ('verification',), builder(1)) == "stats of 1 v1"
+        cache.invalidate(2, 'verification')  # Other guild: no effect
+        cache.invalidate(1, 'vouches')  # Other topic: no effect
+        assert await cache.get(1, 'verify_stats', (), ('verification',), builder(1)) == "stats of 1 v1"
+        cache.invalidate(1, 'verification')
+        assert await cache.get(1, 'verify_stats', (), ('verification',), builder(1)) == "stats of 1 v2"
+
+        # Invalidated while building: the result is served once, not cached
+        pending = asyncio.ensure_future(cache.get(1, 'reconnect', (), ('verification',), builder(1)))
+        await asyncio.sleep(0)
+        cache.invalidate(1, 'verification')
+        assert await pending == "stats of 1 v3"
+        assert await cache.get(1, 'reconnect', (), ('verification',), builder(1)) == "stats of 1 v4"
+
+        # Expiry and size limit
+        now[0] += 31
+        assert await cache.get(1, 'reconnect', (), ('verification',), builder(1)) == "stats of 1 v5"
+        await cache.get(2, 'giveaway_info', (), ('giveaways',), builder(2))
+        await cache.get(3, 'giveaway_info', (), ('giveaways',), builder(3))
+        assert len(cache) == 2 and (1, 'reconnect', ()) not in cache.entries
+        print(f"hits {cache.hits}, misses {cache.misses}, builds {cache.builds}")
+
+    asyncio.run(selftest())
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
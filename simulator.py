@@ -0,0 +1,560 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import selectors
+import time
+from collections import Counter
+
+# The simulator never talks to Discord or a database
+os.environ['STATE_BACKEND'] = 'memory'
+
+# REST simulation settings
+REST_LATENCY = 0.06  # Seconds per API call
+REST_JITTER = 0.03  # Random extra latency per call
+GLOBAL_RATE_LIMIT = 50  # Requests per second across all routes (interaction callbacks excluded)
+
+# (method, route) -> (requests, per seconds), bucketed per major parameter like Discord does
+ROUTE_LIMITS = {
+    ('POST', '/channels/{channel_id}/messages'): (5, 5.0),
+    ('GET', '/channels/{channel_id}/messages/{message_id}'): (50, 1.0),
+    ('DELETE', '/channels/{channel_id}/messages/{message_id}'): (5, 1.0),
+    ('PATCH', '/guilds/{guild_id}/members/{user_id}'): (10, 10.0),
+    ('GET', '/guilds/{guild_id}/members/{user_id}'): (50, 1.0),
+    ('POST', '/guilds/{guild_id}/channels'): (10, 10.0),
+    ('POST', '/users/@me/channels'): (10, 10.0),
+    ('POST', '/interactions/{interaction_id}/{token}/callback'): None,  # Not rate limited
+    ('POST', '/webhooks/{application_id}/{token}'): None,  # Followups, limited per token only
+    ('PATCH', '/webhooks/{application_id}/{token}/messages/@original'): None,
+}
+
+class IdleSkippingSelector(selectors.DefaultSelector):
+    """Selector of VirtualClockLoop: jumps the clock instead of sleeping"""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        # Block for real when nothing is scheduled or a worker thread may wake the loop
+        if timeout is None or timeout <= 0 or self.loop is None or self.loop.executor_jobs:
+            return super().select(timeout)
+        events = super().select(0)
+        if not events:
+            self.loop.skipped += timeout
+        return events
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock skips idle time
+
+    When every task is waiting on a timer (REST latency, rate limit resets,
+    traffic pacing) the clock jumps to the next timer instead of sleeping, so
+    minutes of simulated traffic replay in the time the handlers take to run.
+    Latencies are reported in simulated time.
+    """
+
+    def __init__(self):
+        selector = IdleSkippingSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.skipped = 0.0
+        self.executor_jobs = 0  # asyncio.to_thread calls in flight
+
+    def time(self):
+        return super().time() + self.skipped
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self.executor_jobs += 1
+        future.add_done_callback(self._executor_job_done)
+        return future
+
+    def _executor_job_done(self, future):
+        self.executor_jobs -= 1
+
+_snowflakes = itertools.count(1_100_000_000_000_000_000)
+
+def snowflake():
+    return next(_snowflakes)
+
+class RateBucket:
+    __slots__ = ('limit', 'per', 'remaining', 'reset_at')
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def headers(self, now):
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset-After': f"{max(self.reset_at - now, 0):.3f}",
+        }
+
+class FakeREST:
+    """Simulated Discord REST API
+
+    Waits on exhausted buckets the way discord.py does after reading the
+    rate limit headers, then sleeps for the request latency.
+    """
+
+    def __init__(self, latency=REST_LATENCY, jitter=REST_JITTER, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.buckets = {}
+        self.global_bucket = RateBucket(GLOBAL_RATE_LIMIT, 1.0)
+        self.calls = Counter()  # "METHOD route" -> count
+        self.rate_limited = Counter()  # "METHOD route" -> waits on an exhausted bucket
+        self.rate_limit_wait = 0.0
+        self.last_headers = {}
+
+    async def _acquire(self, bucket, loop):
+        """Take a slot from a bucket, returns True if the request had to wait"""
+        waited = False
+        while True:
+            now = loop.time()
+            if now >= bucket.reset_at:
+                bucket.remaining = bucket.limit
+                bucket.reset_at = now + bucket.per
+            if bucket.remaining > 0:
+                bucket.remaining -= 1
+                return waited
+            waited = True
+            self.rate_limit_wait += bucket.reset_at - now
+            await asyncio.sleep(bucket.reset_at - now)
+
+    async def request(self, method, route, major_id=None):
+        loop = asyncio.get_running_loop()
+        key = f"{method} {route}"
+        self.calls[key] += 1
+
+        limit = ROUTE_LIMITS.get((method, route))
+        if limit is not None:
+            bucket = self.buckets.get((method, route, major_id))
+            if bucket is None:
+                bucket = self.buckets[(method, route, major_id)] = RateBucket(*limit)
+            if await self._acquire(bucket, loop):
+                self.rate_limited[key] += 1
+            await self._acquire(self.global_bucket, loop)
+            self.last_headers = bucket.headers(loop.time())
+
+        await asyncio.sleep(self.latency + self.rng.random() * self.jitter)
+
+class FakePermissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+class FakeRole:
+    def __init__(self, guild, name, administrator=False, default=False):
+        self.id = guild.id if default else snowflake()
+        self.name = name
+        self.guild = guild
+        self.permissions = FakePermissions(administrator)
+        self._default = default
+        self.mention = f"<@&{self.id}>"
+
+    def is_default(self):
+        return self._default
+
+class FakeMember:
+    def __init__(self, rest, guild, name, bot=False, administrator=False):
+        self.rest = rest
+        self.id = snowflake()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.guild = guild
+        self.roles = []
+        self.guild_permissions = FakePermissions(administrator)
+        self.mention = f"<@{self.id}>"
+        self.created_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        self.display_avatar = None
+
+    async def timeout(self, until, reason=None):
+        await self.rest.request('PATCH', '/guilds/{guild_id}/members/{user_id}', self.guild.id)
+
+    async def add_roles(self, *roles, reason=None):
+        await self.rest.request('PATCH', '/guilds/{guild_id}/members/{user_id}', self.guild.id)
+
+    async def send(self, content=None, embed=None, view=None):
+        await self.rest.request('POST', '/users/@me/channels')
+        await self.rest.request('POST', '/channels/{channel_id}/messages', self.id)
+        return FakeMessage(self, None, content, embed)
+
+class FakeMessage:
+    def __init__(self, author, channel, content, embed=None):
+        self.id = snowflake()
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild if channel is not None else None
+        self.content = content or ""
+        self.embeds = [embed] if embed else []
+        self.attachments = []
+
+    async def delete(self):
+        await self.author.rest.request('DELETE', '/channels/{channel_id}/messages/{message_id}', self.channel.id)
+
+class FakeCategory:
+    def __init__(self, guild, name):
+        self.id = snowflake()
+        self.name = name
+        self.guild = guild
+        self.channels = []
+
+class FakeTextChannel:
+    def __init__(self, guild, name, category=None):
+        self.id = snowflake()
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.mention = f"<#{self.id}>"
+        self.messages = {}  # Messages sent by the bot, for fetch_message
+
+    async def send(self, content=None, embed=None, view=None, delete_after=None):
+        await self.guild.rest.request('POST', '/channels/{channel_id}/messages', self.id)
+        message = FakeMessage(self.guild.me, self, content, embed)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.guild.rest.request('GET', '/channels/{channel_id}/messages/{message_id}', self.id)
+        message = self.messages.get(message_id)
+        if message is None:
+            raise LookupError(f"Unknown message {message_id}")
+        return message
+
+class FakeGuild:
+    def __init__(self, rest, name):
+        self.rest = rest
+        self.id = snowflake()
+        self.name = name
+        self.default_role = FakeRole(self, '@everyone', default=True)
+        self.roles = [self.default_role, FakeRole(self, 'Admin', administrator=True), FakeRole(self, 'Support')]
+        self.me = FakeMember(rest, self, 'Voralith', bot=True)
+        self.members = {}
+        self.categories = []
+        self.text_channels = []
+        self.shard_id = 0
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def fetch_member(self, user_id):
+        await self.rest.request('GET', '/guilds/{guild_id}/members/{user_id}', self.id)
+        return self.members.get(user_id)
+
+    def add_member(self, name, administrator=False):
+        member = FakeMember(self.rest, self, name, administrator=administrator)
+        self.members[member.id] = member
+        return member
+
+    def add_text_channel(self, name, category=None):
+        channel = FakeTextChannel(self, name, category)
+        self.text_channels.append(channel)
+        if category is not None:
+            category.channels.append(channel)
+        return channel
+
+    async def create_category(self, name):
+        await self.rest.request('POST', '/guilds/{guild_id}/channels', self.id)
+        category = FakeCategory(self, name)
+        self.categories.append(category)
+        return category
+
+    async def create_text_channel(self, name, category=None, overwrites=None):
+        await self.rest.request('POST', '/guilds/{guild_id}/channels', self.id)
+        return self.add_text_channel(name, category)
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _callback(self):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to before")
+        self._done = True
+        await self.interaction.rest.request('POST', '/interactions/{interaction_id}/{token}/callback')
+        self.interaction.acked_at = asyncio.get_running_loop().time()
+
+    async def send_message(self, content=None, embed=None, view=None, ephemeral=False):
+        await self._callback()
+
+    async def defer(self, ephemeral=False, thinking=False):
+        await self._callback()
+
+    async def edit_message(self, content=None, embed=None, view=None):
+        await self._callback()
+
+class FakeFollowup:
+    """interaction.followup, used once the middleware deferred for a slow handler"""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, embed=None, view=None, ephemeral=False, wait=False):
+        await self.interaction.rest.request('POST', '/webhooks/{application_id}/{token}')
+        return FakeMessage(self.interaction.guild.me, self.interaction.channel, content, embed)
+
+class FakeInteraction:
+    def __init__(self, rest, user, channel):
+        self.rest = rest
+        self.id = snowflake()
+        self.user = user
+        self.channel = channel
+        self.guild = channel.guild
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.acked_at = None
+
+    async def edit_original_response(self, content=None, embed=None, view=None):
+        await self.rest.request('PATCH', '/webhooks/{application_id}/{token}/messages/@original')
+        return FakeMessage(self.guild.me, self.channel, content, embed)
+
+class FakeGateway:
+    """Fake guilds plus the event dispatch of a gateway connection"""
+
+    def __init__(self, main, rest, guilds=2, channels=10, members=500, sticky_channels=2):
+        self.main = main
+        self.rest = rest
+        self.guilds = []
+        self.channels = {}
+        self.members = {}
+        for g in range(guilds):
+            guild = FakeGuild(rest, f"guild-{g}")
+            self.guilds.append(guild)
+            for c in range(channels):
+                channel = guild.add_text_channel(f"general-{c}")
+                self.channels[channel.id] = channel
+            tickets = FakeCategory(guild, "🎫 Tickets")
+            guild.categories.append(tickets)
+            for m in range(members):
+                member = guild.add_member(f"user{g}-{m}")
+                self.members[member.id] = member
+            for channel in guild.text_channels[:sticky_channels]:
+                main.state_backend.save_sticky_channel(guild.id, channel.id, snowflake())
+
+        # Hook the bot up to the fake gateway
+        main.bot.get_channel = self.channels.get
+        main.bot.process_commands = self._process_commands
+        self.views = {}  # giveaway_id -> GiveawayView
+
+    async def _process_commands(self, message):
+        pass  # Prefix commands are not part of the replayed traffic
+
+    async def dispatch(self, event):
+        """Run the handler main.py would run for a gateway event"""
+        main = self.main
+        kind = event['type']
+        if kind == 'message':
+            author = self.members[event['author']]
+            channel = self.channels[event['channel']]
+            await main.on_message(FakeMessage(author, channel, event['content']))
+        elif kind == 'member_join':
+            guild = self.guilds[event['guild']]
+            await main.on_member_join(guild.add_member(event['name']))
+        elif kind == 'giveaway_join':
+            member = self.members[event['user']]
+            view = self.views.get(event['giveaway'])
+            if view is None:
+                view = self.views[event['giveaway']] = main.GiveawayView(event['giveaway'])
+            await view.join_giveaway.callback(FakeInteraction(self.rest, member, member.guild.text_channels[0]))
+        elif kind == 'ticket_select':
+            member = self.members[event['user']]
+            menu = main.TicketSelectMenu()
+            menu._values = [event['category']]
+            await menu.callback(FakeInteraction(self.rest, member, member.guild.text_channels[0]))
+        else:
+            raise ValueError(f"Unknown event type {kind!r}")
+
+    def create_giveaway(self, guild_index=0):
+        """Start a giveaway in a guild, returns its ID"""
+        import datetime
+
+        guild = self.guilds[guild_index]
+        giveaway_id = self.main.state_backend.next_giveaway_id()
+        self.main.state_backend.add_giveaway({
+            'id': giveaway_id,
+            'guild_id': guild.id,
+            'prize': 'Simulated prize',
+            'end_time': datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+            'participants': [],
+            'channel_id': guild.text_channels[0].id,
+            'message_id': snowflake(),
+            'host_id': guild.me.id
+        })
+        return giveaway_id
+
+# Synthetic traffic: lists of events with a dispatch offset "t" in seconds
+
+def chat_traffic(gateway, rng, events=2000, rate=200):
+    """Normal chat across all channels, a few users spamming"""
+    members = list(gateway.members.values())
+    spammers = rng.sample(members, 5)
+    traffic = []
+    for i in range(events):
+        author = rng.choice(spammers) if rng.random() < 0.05 else rng.choice(members)
+        channel = rng.choice(author.guild.text_channels)
+        traffic.append({'t': i / rate, 'type': 'message', 'author': author.id, 'channel': channel.id,
+                        'content': f"message {i} about boosting ranks {rng.randint(0, 10**6)}"})
+    return traffic
+
+def raid_traffic(gateway, rng, events=1000, rate=300):
+    """Many accounts posting the same scam link"""
+    members = list(gateway.members.values())
+    traffic = []
+    for i in range(events):
+        author = rng.choice(members)
+        channel = rng.choice(author.guild.text_channels)
+        content = "FREE NITRO https://disc0rd-gift.example/claim?id=%d" % rng.randint(0, 10**6) if i % 3 else f"hello there {i}"
+        traffic.append({'t': i / rate, 'type': 'message', 'author': author.id, 'channel': channel.id, 'content': content})
+    return traffic
+
+def join_traffic(gateway, rng, events=1000, rate=100):
+    """Join burst on one guild"""
+    return [{'t': i / rate, 'type': 'member_join', 'guild': 0, 'name': f"joiner{i}"} for i in range(events)]
+
+def giveaway_traffic(gateway, rng, events=2000, rate=400):
+    """Members clicking the join button, some of them twice"""
+    giveaway_id = gateway.create_giveaway(0)
+    members = list(gateway.guilds[0].members.values())
+    return [{'t': i / rate, 'type': 'giveaway_join', 'giveaway': giveaway_id, 'user': rng.choice(members).id}
+            for i in range(events)]
+
+def ticket_traffic(gateway, rng, events=200, rate=20):
+    """Members opening tickets from the ticket menu"""
+    members = list(gateway.members.values())
+    categories = ['purchase', 'technical', 'general', 'report']
+    return [{'t': i / rate, 'type': 'ticket_select', 'user': rng.choice(members).id, 'category': rng.choice(categories)}
+            for i in range(events)]
+
+def double_click_traffic(gateway, rng, events=200, rate=20):
+    """Members double-clicking the ticket menu, the second click 20ms later"""
+    members = rng.sample(list(gateway.members.values()), events // 2)
+    traffic = []
+    for i, member in enumerate(members):
+        for offset in (0.0, 0.02):
+            traffic.append({'t': 2 * i / rate + offset, 'type': 'ticket_select', 'user': member.id, 'category': 'general'})
+    return traffic
+
+SCENARIOS = {
+    'chat': chat_traffic,
+    'raid': raid_traffic,
+    'joins': join_traffic,
+    'giveaway': giveaway_traffic,
+    'tickets': ticket_traffic,
+    'double_clicks': double_click_traffic,
+}
+
+def save_traffic(path, traffic):
+    with open(path, 'w', encoding='utf-8') as f:
+        for event in traffic:
+            f.write(json.dumps(event) + "\n")
+
+def load_traffic(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def reset_bot_state(main):
+    """Start every scenario with empty bot state"""
+    from antiraid import RaidDetector, JoinRateTracker, WelcomeQueue
+
+    main.bot_state.guilds.clear()
+    main.raid_detector = RaidDetector()
+    main.join_guard = JoinRateTracker()
+    main.welcome_queue = WelcomeQueue()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def replay(gateway, traffic):
+    """Dispatch events at their offsets, each as its own task like discord.py does"""
+    loop = asyncio.get_running_loop()
+    latencies = []
+    errors = Counter()
+
+    async def run(event):
+        started = loop.time()
+        try:
+            await gateway.dispatch(event)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append(loop.time() - started)
+
+    start = loop.time()
+    tasks = []
+    for event in traffic:
+        delay = start + event['t'] - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run(event)))
+    await asyncio.gather(*tasks)
+    return loop.time() - start, sorted(latencies), errors
+
+async def run_scenario(main, name, traffic_fn=None, traffic=None, record=None, seed=0):
+    rest = FakeREST(seed=seed)
+    reset_bot_state(main)
+    gateway = FakeGateway(main, rest)
+    if traffic is None:
+        traffic = traffic_fn(gateway, random.Random(seed))
+        if record:
+            save_traffic(record, traffic)
+
+    wall_start = time.perf_counter()
+    elapsed, latencies, errors = await replay(gateway, traffic)
+    wall = time.perf_counter() - wall_start
+
+    print(f"\n== {name}: {len(traffic)} events in {elapsed:.2f}s simulated ({len(traffic) / elapsed:,.0f} events/s), {wall:.2f}s wall")
+    print(f"   handler latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f}ms, p99 {percentile(latencies, 0.99) * 1000:.1f}ms, "
+          f"max {latencies[-1] * 1000 if latencies else 0:.1f}ms")
+    print(f"   REST calls: {sum(rest.calls.values())}, waited {rest.rate_limit_wait:.1f}s on rate limits")
+    for route, count in rest.calls.most_common():
+        limited = rest.rate_limited.get(route, 0)
+        print(f"     {count:>6}  {route}" + (f"  ({limited} rate limited)" if limited else ""))
+    if errors:
+        print(f"   handler errors: {dict(errors)}")
+    if main.interaction_flights.rejected:
+        print(f"   duplicate interactions rejected: {main.interaction_flights.rejected}")
+        main.interaction_flights.rejected = 0
+    return {'events': len(traffic), 'elapsed': elapsed, 'latencies': latencies, 'rest_calls': dict(rest.calls)}
+
+async def _main(args):
+    import main
+
+    if not args.verbose:
+        # Per-message info logs would dominate the measurement
+        main.logger.setLevel(logging.WARNING)
+
+    if args.replay:
+        await run_scenario(main, os.path.basename(args.replay), traffic=load_traffic(args.replay), seed=args.seed)
+        return
+
+    for name in args.scenarios or list(SCENARIOS):
+        await run_scenario(main, name, SCENARIOS[name], record=args.record, seed=args.seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay traffic through the bot's handlers without Discord")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--replay', help="Replay a recorded JSONL traffic file instead")
+    parser.add_argument('--record', help="Write the generated traffic of the scenario to a JSONL file")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="Keep the bot's info logging")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    with asyncio.Runner(loop_factory=VirtualClockLoop) as runner:
+        runner.run(_main(args))
@@ -0,0 +1,45 @@
+import functools
+import time
+
+class SingleFlight:
+    """Keyed in-flight markers for component interactions
+
+    Keys are tuples like (user_id, 'ticket_create') or (channel_id, 'ticket_close').
+    All callbacks run on the bot's event loop, so a dict is enough; interactions
+    of a guild are always handled by the process that owns its shard.
+    """
+
+    def __init__(self):
+        self.inflight = {}  # key -> start time
+        self.rejected = 0
+
+    def acquire(self, key):
+        """Mark a key as running, False if it already is"""
+        if key in self.inflight:
+            self.rejected += 1
+            return False
+        self.inflight[key] = time.monotonic()
+        return True
+
+    def release(self, key):
+        self.inflight.pop(key, None)
+
+    def guard(self, key, busy_message):
+        """Decorator for component callbacks: one run per key at a time
+
+        key(component, interaction) builds the key. Duplicates get busy_message
+        as an ephemeral reply and nothing else runs.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(component, interaction, *args):
+                flight_key = key(component, interaction)
+                if not self.acquire(flight_key):
+                    await interaction.response.send_message(busy_message, ephemeral=True)
+                    return
+                try:
+                    return await func(component, interaction, *args)
+                finally:
+                    self.release(flight_key)
+            return wrapper
+        return decorator
@@ -0,0 +1,107 @@
+import bisect
+from collections import defaultdict, deque
+
+class GuildState:
+    """All in-memory bot state belonging to a single guild"""
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.giveaways = {}  # giveaway_id -> giveaway dict
+        self.giveaway_schedule = []  # (end_time, giveaway_id) of active giveaways, soonest first
+        self.ended_giveaways = {}  # giveaway_id -> ended giveaway with its entrant snapshot, kept for rerolls
+        self.automod_rules = set()  # (kind, value): blocked terms and regex patterns
+        self.sticky_channels = {}  # channel_id -> sticky message_id
+        self.user_message_times = defaultdict(deque)  # user_id -> message timestamps (anti-spam)
+        self.user_warnings = defaultdict(int)  # user_id -> spam warnings
+        self.verified_users = set()  # user ids verified in this guild
+        self.verification_pending = {}  # user_id -> pending verification data
+        self.oauth_states = {}  # user_id -> OAuth2 state for security
+
+    def add_giveaway(self, giveaway):
+        self.remove_giveaway(giveaway['id'])
+        self.giveaways[giveaway['id']] = giveaway
+        bisect.insort(self.giveaway_schedule, (giveaway['end_time'], giveaway['id']))
+
+    def remove_giveaway(self, giveaway_id):
+        """Take a giveaway out of the partition, returns it or None"""
+        giveaway = self.giveaways.pop(giveaway_id, None)
+        if giveaway is not None:
+            entry = (giveaway['end_time'], giveaway_id)
+            index = bisect.bisect_left(self.giveaway_schedule, entry)
+            if index < len(self.giveaway_schedule) and self.giveaway_schedule[index] == entry:
+                del self.giveaway_schedule[index]
+        return giveaway
+
+    def giveaways_by_end(self, offset=0, limit=None):
+        """Active giveaways ordered by end time, soonest first"""
+        stop = None if limit is None else offset + limit
+        return [self.giveaways[giveaway_id] for _, giveaway_id in self.giveaway_schedule[offset:stop]]
+
+    def due_giveaways(self, now):
+        """Giveaways whose end time has passed, without scanning the others"""
+        index = bisect.bisect_right(self.giveaway_schedule, (now, float('inf')))
+        return [self.giveaways[giveaway_id] for _, giveaway_id in self.giveaway_schedule[:index]]
+
+def shard_id_for(guild_id, shard_count):
+    """Shard that owns a guild, using Discord's sharding formula"""
+    if guild_id is None or not shard_count:
+        return 0  # DMs are always delivered to shard 0
+    return (guild_id >> 22) % shard_count
+
+class BotState:
+    """Bot state partitioned by guild_id
+
+    Nothing is keyed across guilds, so the partitions of one shard range can be
+    moved to another process without touching the rest.
+    DMs use the guild_id None partition.
+    """
+
+    def __init__(self):
+        self.guilds = {}  # guild_id -> GuildState
+        self.giveaway_counter = 0
+
+    def guild(self, guild_id):
+        """Get (or create) the state partition for a guild"""
+        state = self.guilds.get(guild_id)
+        if state is None:
+            state = self.guilds[guild_id] = GuildState(guild_id)
+        return state
+
+    def drop_guild(self, guild_id):
+        """Forget everything about a guild, e.g. after the bot was removed"""
+        return self.guilds.pop(guild_id, None)
+
+    def for_shard(self, shard_id, shard_count):
+        """All partitions owned by a shard"""
+        return [state for guild_id, state in list(self.guilds.items()) if shard_id_for(guild_id, shard_count) == shard_id]
+
+    def next_giveaway_id(self):
+        """Allocate a new giveaway ID"""
+        self.giveaway_counter += 1
+        return self.giveaway_counter
+
+    def due_giveaways(self, now):
+        """Ended giveaways of every guild"""
+        return [giveaway for state in list(self.guilds.values()) for giveaway in state.due_giveaways(now)]
+
+    def iter_giveaways(self):
+        """Yield (guild_id, giveaway_id, giveaway) for every active giveaway"""
+        for guild_id, state in list(self.guilds.items()):
+            for giveaway_id, giveaway in list(state.giveaways.items()):
+                yield guild_id, giveaway_id, giveaway
+
+def parse_shard_ids(value):
+    """Parse a shard range like '0-3' or '0,2,4' into a list of shard ids"""
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
@@ -0,0 +1,754 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+from giveaway_draw import EntrantSnapshot
+from state import shard_id_for
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Postgres backend settings
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))  # Connections shared by the worker threads running backend calls
+# Connections kept open: psycopg2 closes a connection handed back while this many are idle,
+# so anything much lower reconnects on every burst of concurrent calls
+DB_POOL_MIN = min(int(os.getenv('DB_POOL_MIN', str(DB_POOL_MAX))), DB_POOL_MAX)
+LEADER_CHECK_INTERVAL = 15  # Seconds a leadership check is trusted before the lock connection is probed again
+
+class ConnectionPool:
+    """Postgres connections shared by the worker threads of one process
+
+    Created lazily on first use. Callers beyond DB_POOL_MAX wait for a free
+    connection instead of getting a PoolError.
+    """
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Connection from the pool, handed back when done
+
+        The pool rolls back a connection left in a transaction when it is handed back.
+        """
+        with self._slots:
+            with self._lock:
+                if self._pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+                    self._pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, self.dsn)
+                pool = self._pool
+            conn = pool.getconn()
+            try:
+                yield conn
+            finally:
+                # Broken connections (server restart) are closed, not reused
+                pool.putconn(conn, close=bool(conn.closed))
+
+_pools = {}  # dsn -> ConnectionPool
+_pools_lock = threading.Lock()
+
+def shared_pool(dsn):
+    """The process-wide pool of a database, shared by the state backend and the moderation log"""
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = _pools[dsn] = ConnectionPool(dsn)
+        return pool
+
+class InProcessStateBackend:
+    """State shared only inside this process, stored directly in the BotState partitions
+
+    This is the single-process default. PostgresStateBackend keeps the same
+    partitions as a local cache and writes through to Postgres so several
+    processes (each owning a shard range) can share giveaways, sticky channels,
+    spam counters and verification state.
+    """
+
+    def __init__(self, bot_state):
+        self.bot_state = bot_state
+        self._claims = {}  # (kind, key) -> expiry timestamp
+        self._lock = threading.Lock()  # Flask callbacks run in another thread
+
+    def init_schema(self):
+        """Create backing tables, nothing to do in memory"""
+
+    # Giveaways
+    def next_giveaway_id(self):
+        return self.bot_state.next_giveaway_id()
+
+    def add_giveaway(self, giveaway):
+        self.bot_state.guild(giveaway['guild_id']).add_giveaway(giveaway)
+
+    def add_giveaway_participant(self, guild_id, giveaway_id, user_id, weight=1):
+        """Add an entrant with `weight` entries, returns False if they already joined"""
+        giveaway = self.bot_state.guild(guild_id).giveaways.get(giveaway_id)
+        if giveaway is None or user_id in giveaway['participants']:
+            return False
+        giveaway['participants'].append(user_id)
+        if weight > 1:
+            giveaway.setdefault('weights', {})[user_id] = weight
+        return True
+
+    def load_giveaways(self, shard_ids=None, shard_count=None):
+        """Fill the local cache with giveaways of the owned shards"""
+
+    def due_giveaways(self, now):
+        """Giveaways of every guild whose end time has passed"""
+        return self.bot_state.due_giveaways(now)
+
+    def prune_giveaways(self, now):
+        """Drop cached giveaways that another process already ended"""
+
+    def finish_giveaway(self, guild_id, giveaway_id):
+        """Atomically take a giveaway out of the active set
+
+        Returns the giveaway (with participants) to the single caller that
+        ended it, None to everyone else.
+        """
+        return self.bot_state.guild(guild_id).remove_giveaway(giveaway_id)
+
+    # Ended giveaways (entrant snapshots for rerolls)
+    def save_ended_giveaway(self, ended):
+        """Keep an ended giveaway: id, guild_id, channel_id, prize, ended_at, snapshot, draws"""
+        self.bot_state.guild(ended['guild_id']).ended_giveaways[ended['id']] = ended
+
+    def get_ended_giveaway(self, guild_id, giveaway_id):
+        return self.bot_state.guild(guild_id).ended_giveaways.get(giveaway_id)
+
+    def reroll_giveaway(self, ended, count, seed):
+        """Draw up to `count` winners who never won this giveaway and record the draw
+
+        Returns the new winner ids, empty once every entrant has won.
+        """
+        winner_ids = ended['snapshot'].draw(count, seed)
+        if winner_ids:
+            ended['draws'].append([f"{seed:016x}", winner_ids])
+        return winner_ids
+
+    def prune_ended_giveaways(self, before):
+        """Forget snapshots of giveaways that ended before the retention limit"""
+        for state in list(self.bot_state.guilds.values()):
+            for giveaway_id, ended in list(state.ended_giveaways.items()):
+                if ended['ended_at'] < before:
+                    del state.ended_giveaways[giveaway_id]
+
+    # Sticky channels
+    def load_sticky_channels(self, shard_ids=None, shard_count=None):
+        """Fill the local cache with sticky channels of the owned shards"""
+
+    def save_sticky_channel(self, guild_id, channel_id, message_id):
+        self.bot_state.guild(guild_id).sticky_channels[channel_id] = message_id
+
+    def remove_sticky_channel(self, guild_id, channel_id):
+        self.bot_state.guild(guild_id).sticky_channels.pop(channel_id, None)
+
+    # Automod rules
+    def load_automod_rules(self, shard_ids=None, shard_count=None):
+        """Fill the local cache with automod rules of the owned shards"""
+
+    def add_automod_rule(self, guild_id, kind, value):
+        self.bot_state.guild(guild_id).automod_rules.add((kind, value))
+
+    def remove_automod_rule(self, guild_id, kind, value):
+        self.bot_state.guild(guild_id).automod_rules.discard((kind, value))
+
+    # Spam counters
+    def add_spam_warning(self, guild_id, user_id, minimum=0):
+        """Increment a user's spam warnings and return the new count"""
+        warnings = self.bot_state.guild(guild_id).user_warnings
+        warnings[user_id] = max(warnings[user_id] + 1, minimum)
+        return warnings[user_id]
+
+    def reset_spam_warnings(self, guild_id, user_id):
+        self.bot_state.guild(guild_id).user_warnings.pop(user_id, None)
+
+    # Verification
+    def mark_verified(self, guild_id, user_id):
+        self.bot_state.guild(guild_id).verified_users.add(user_id)
+
+    def is_verified(self, guild_id, user_id):
+        return user_id in self.bot_state.guild(guild_id).verified_users
+
+    def verified_count(self, guild_id):
+        return len(self.bot_state.guild(guild_id).verified_users)
+
+    # Ticket logs (kept in memory by TicketLogStore, nothing to save in-process)
+    def load_ticket_logs(self, channel_ids):
+        """Saved logs of these channels as (channel_id, has_head, overflow, [(message_id, data)])"""
+        return []
+
+    def save_ticket_logs(self, logs, dropped):
+        """Save the changes of TicketLogStore.take_changes(), delete the logs of dropped channels"""
+
+    # Coordination
+    def claim(self, kind, key, ttl=600):
+        """Return True for the first caller claiming (kind, key) within ttl seconds"""
+        now = time.time()
+        with self._lock:
+            expires = self._claims.get((kind, key))
+            if expires is not None and expires > now:
+                return False
+            self._claims[(kind, key)] = now + ttl
+            if len(self._claims) > 10000:
+                self._claims = {k: v for k, v in self._claims.items() if v > now}
+            return True
+
+    def is_leader(self, job):
+        """A single process is always the leader"""
+        return True
+
+class PostgresStateBackend(InProcessStateBackend):
+    """State shared between bot processes through one Postgres database
+
+    Leadership for singleton jobs uses session-level advisory locks held on a
+    dedicated connection per job: if the leader process dies its connection
+    closes, the lock is released and another process takes over. Every other
+    statement borrows a connection from a pool.
+    """
+
+    def __init__(self, bot_state, dsn):
+        super().__init__(bot_state)
+        self.dsn = dsn
+        self._leader_connections = {}  # job -> connection holding the advisory lock
+        self._leader_checks = {}  # job -> (monotonic time of the last check, leader or not)
+        self._pool = shared_pool(dsn)
+
+    def _connect(self):
+        import psycopg2
+        return psycopg2.connect(self.dsn)
+
+    def _connection(self):
+        return self._pool.connection()
+
+    @traced('db')
+    def _execute(self, query, params=(), fetch=None):
+        """Run one statement in its own transaction"""
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                result = None
+                if fetch == 'one':
+                    result = cursor.fetchone()
+                elif fetch == 'all':
+                    result = cursor.fetchall()
+                conn.commit()
+                return result
+
+    def init_schema(self):
+        """Create the shared state tables"""
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("CREATE SEQUENCE IF NOT EXISTS bot_giveaway_id_seq")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_giveaways (
+                        id BIGINT PRIMARY KEY,
+                        guild_id BIGINT,
+                        channel_id BIGINT,
+                        message_id BIGINT,
+                        host_id BIGINT,
+                        prize TEXT,
+                        end_time TIMESTAMP NOT NULL
+                    )
+                """)
+                cursor.execute("ALTER TABLE bot_giveaways ADD COLUMN IF NOT EXISTS winners INTEGER DEFAULT 1")
+                cursor.execute("ALTER TABLE bot_giveaways ADD COLUMN IF NOT EXISTS bonus_entries TEXT")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_bot_giveaways_end_time ON bot_giveaways (end_time)")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_giveaway_entries (
+                        giveaway_id BIGINT,
+                        user_id BIGINT,
+                        PRIMARY KEY (giveaway_id, user_id)
+                    )
+                """)
+                cursor.execute("ALTER TABLE bot_giveaway_entries ADD COLUMN IF NOT EXISTS weight INTEGER DEFAULT 1")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_giveaway_snapshots (
+                        id BIGINT PRIMARY KEY,
+                        guild_id BIGINT,
+                        channel_id BIGINT,
+                        prize TEXT,
+                        ended_at TIMESTAMP NOT NULL,
+                        entrants BYTEA,
+                        weights BYTEA,
+                        draws TEXT
+                    )
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_bot_giveaway_snapshots_ended_at ON bot_giveaway_snapshots (ended_at)")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_automod_rules (
+                        guild_id BIGINT,
+                        kind VARCHAR(10),
+                        value TEXT,
+                        PRIMARY KEY (guild_id, kind, value)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_spam_warnings (
+                        guild_id BIGINT,
+                        user_id BIGINT,
+                        warnings INTEGER DEFAULT 0,
+                        PRIMARY KEY (guild_id, user_id)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_verified_users (
+                        guild_id BIGINT,
+                        user_id BIGINT,
+                        verified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (guild_id, user_id)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_ticket_logs (
+                        channel_id BIGINT PRIMARY KEY,
+                        has_head BOOLEAN NOT NULL,
+                        overflow BOOLEAN NOT NULL DEFAULT FALSE
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_ticket_messages (
+                        channel_id BIGINT,
+                        message_id BIGINT,
+                        data TEXT,
+                        PRIMARY KEY (channel_id, message_id)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS bot_claims (
+                        kind VARCHAR(50),
+                        key TEXT,
+                        expires_at TIMESTAMP NOT NULL,
+                        PRIMARY KEY (kind, key)
+                    )
+                """)
+                conn.commit()
+                logger.info("Shared state tables initialized")
+
+    # Giveaways
+    def next_giveaway_id(self):
+        return self._execute("SELECT nextval('bot_giveaway_id_seq')", fetch='one')[0]
+
+    def add_giveaway(self, giveaway):
+        self._execute("""
+            INSERT INTO bot_giveaways (id, guild_id, channel_id, message_id, host_id, prize, end_time, winners, bonus_entries)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET message_id = EXCLUDED.message_id
+        """, (giveaway['id'], giveaway['guild_id'], giveaway['channel_id'], giveaway['message_id'],
+              giveaway['host_id'], giveaway['prize'], giveaway['end_time'],
+              giveaway.get('winners', 1), json.dumps(giveaway.get('bonus_entries') or {})))
+        super().add_giveaway(giveaway)
+
+    def add_giveaway_participant(self, guild_id, giveaway_id, user_id, weight=1):
+        inserted = self._execute("""
+            INSERT INTO bot_giveaway_entries (giveaway_id, user_id, weight)
+            SELECT %s, %s, %s WHERE EXISTS (SELECT 1 FROM bot_giveaways WHERE id = %s)
+            ON CONFLICT DO NOTHING
+            RETURNING user_id
+        """, (giveaway_id, user_id, weight, giveaway_id), fetch='one')
+        if inserted:
+            super().add_giveaway_participant(guild_id, giveaway_id, user_id, weight)
+        return inserted is not None
+
+    def _rows_to_giveaways(self, cursor, rows):
+        giveaways = {}
+        for row in rows:
+            giveaways[row[0]] = {
+                'id': row[0],
+                'guild_id': row[1],
+                'channel_id': row[2],
+                'message_id': row[3],
+                'host_id': row[4],
+                'prize': row[5],
+                'end_time': row[6],
+                'winners': row[7] or 1,
+                'bonus_entries': json.loads(row[8]) if row[8] else {},
+                'participants': [],
+                'weights': {}
+            }
+        if giveaways:
+            cursor.execute(
+                "SELECT giveaway_id, user_id, weight FROM bot_giveaway_entries WHERE giveaway_id = ANY(%s)",
+                (list(giveaways),)
+            )
+            for giveaway_id, user_id, weight in cursor.fetchall():
+                giveaways[giveaway_id]['participants'].append(user_id)
+                if weight and weight > 1:
+                    giveaways[giveaway_id]['weights'][user_id] = weight
+        return list(giveaways.values())
+
+    def load_giveaways(self, shard_ids=None, shard_count=None):
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, guild_id, channel_id, message_id, host_id, prize, end_time, winners, bonus_entries FROM bot_giveaways")
+                giveaways = self._rows_to_giveaways(cursor, cursor.fetchall())
+
+        loaded = 0
+        for giveaway in giveaways:
+            if shard_ids and shard_id_for(giveaway['guild_id'], shard_count) not in shard_ids:
+                continue
+            super().add_giveaway(giveaway)
+            loaded += 1
+        logger.info(f"Loaded {loaded} active giveaways from shared state")
+
+    def due_giveaways(self, now):
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id, guild_id, channel_id, message_id, host_id, prize, end_time, winners, bonus_entries FROM bot_giveaways WHERE end_time <= %s",
+                    (now,)
+                )
+                return self._rows_to_giveaways(cursor, cursor.fetchall())
+
+    def prune_giveaways(self, now):
+        due = [(g['guild_id'], g['id']) for g in self.bot_state.due_giveaways(now)]
+        if not due:
+            return
+        rows = self._execute(
+            "SELECT id FROM bot_giveaways WHERE id = ANY(%s)",
+            ([giveaway_id for _, giveaway_id in due],), fetch='all'
+        )
+        still_active = {row[0] for row in rows}
+        for guild_id, giveaway_id in due:
+            if giveaway_id not in still_active:
+                super().finish_giveaway(guild_id, giveaway_id)
+
+    def finish_giveaway(self, guild_id, giveaway_id):
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                # DELETE ... RETURNING makes exactly one process the finisher
+                cursor.execute("""
+                    DELETE FROM bot_giveaways WHERE id = %s
+                    RETURNING id, guild_id, channel_id, message_id, host_id, prize, end_time, winners, bonus_entries
+                """, (giveaway_id,))
+                row = cursor.fetchone()
+                giveaway = self._rows_to_giveaways(cursor, [row])[0] if row else None
+                cursor.execute("DELETE FROM bot_giveaway_entries WHERE giveaway_id = %s", (giveaway_id,))
+                conn.commit()
+
+        super().finish_giveaway(guild_id, giveaway_id)
+        return giveaway
+
+    def save_ended_giveaway(self, ended):
+        snapshot = ended['snapshot']
+        self._execute("""
+            INSERT INTO bot_giveaway_snapshots (id, guild_id, channel_id, prize, ended_at, entrants, weights, draws)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO NOTHING
+        """, (ended['id'], ended['guild_id'], ended['channel_id'], ended['prize'], ended['ended_at'],
+              snapshot.entrants_bytes(), snapshot.weights_bytes(),
+              json.dumps(ended['draws'])))
+        super().save_ended_giveaway(ended)
+
+    def get_ended_giveaway(self, guild_id, giveaway_id):
+        # The leader process may have ended it, so look in the shared table
+        ended = super().get_ended_giveaway(guild_id, giveaway_id)
+        if ended is not None:
+            return ended
+        row = self._execute(
+            "SELECT id, guild_id, channel_id, prize, ended_at, entrants, weights, draws FROM bot_giveaway_snapshots WHERE id = %s AND guild_id = %s",
+            (giveaway_id, guild_id), fetch='one'
+        )
+        if row is None:
+            return None
+        draws = json.loads(row[7]) if row[7] else []
+        ended = {
+            'id': row[0],
+            'guild_id': row[1],
+            'channel_id': row[2],
+            'prize': row[3],
+            'ended_at': row[4],
+            'snapshot': EntrantSnapshot.from_bytes(row[5], row[6], [user_id for _, winners in draws for user_id in winners]),
+            'draws': draws
+        }
+        super().save_ended_giveaway(ended)
+        return ended
+
+    def reroll_giveaway(self, ended, count, seed):
+        # Row lock: rerolls from other processes are finished and their winners excluded
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT draws FROM bot_giveaway_snapshots WHERE id = %s FOR UPDATE", (ended['id'],))
+                row = cursor.fetchone()
+                if row is not None:
+                    ended['draws'] = json.loads(row[0]) if row[0] else []
+                    ended['snapshot'].winners = [user_id for _, winners in ended['draws'] for user_id in winners]
+                winner_ids = super().reroll_giveaway(ended, count, seed)
+                if winner_ids and row is not None:
+                    cursor.execute("UPDATE bot_giveaway_snapshots SET draws = %s WHERE id = %s", (json.dumps(ended['draws']), ended['id']))
+                conn.commit()
+        return winner_ids
+
+    def prune_ended_giveaways(self, before):
+        self._execute("DELETE FROM bot_giveaway_snapshots WHERE ended_at < %s", (before,))
+        super().prune_ended_giveaways(before)
+
+    # Sticky channels (same table the single-process bot always used)
+    def load_sticky_channels(self, shard_ids=None, shard_count=None):
+        rows = self._execute("SELECT guild_id, channel_id, message_id FROM sticky_channels", fetch='all')
+        loaded = 0
+        for guild_id, channel_id, message_id in rows:
+            # Only load guilds owned by this process' shards
+            if shard_ids and shard_id_for(guild_id, shard_count) not in shard_ids:
+                continue
+            super().save_sticky_channel(guild_id, channel_id, message_id)
+            loaded += 1
+        logger.info(f"Loaded {loaded} sticky channels from database")
+
+    def save_sticky_channel(self, guild_id, channel_id, message_id):
+        self._execute("""
+            INSERT INTO sticky_channels (guild_id, channel_id, message_id)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (channel_id)
+            DO UPDATE SET message_id = EXCLUDED.message_id
+        """, (guild_id, channel_id, message_id))
+        super().save_sticky_channel(guild_id, channel_id, message_id)
+
+    def remove_sticky_channel(self, guild_id, channel_id):
+        self._execute("DELETE FROM sticky_channels WHERE channel_id = %s", (channel_id,))
+        super().remove_sticky_channel(guild_id, channel_id)
+
+    # Automod rules
+    def load_automod_rules(self, shard_ids=None, shard_count=None):
+        rows = self._execute("SELECT guild_id, kind, value FROM bot_automod_rules", fetch='all')
+        loaded = 0
+        for guild_id, kind, value in rows:
+            if shard_ids and shard_id_for(guild_id, shard_count) not in shard_ids:
+                continue
+            super().add_automod_rule(guild_id, kind, value)
+            loaded += 1
+        logger.info(f"Loaded {loaded} automod rules from shared state")
+
+    def add_automod_rule(self, guild_id, kind, value):
+        self._execute("""
+            INSERT INTO bot_automod_rules (guild_id, kind, value) VALUES (%s, %s, %s)
+            ON CONFLICT DO NOTHING
+        """, (guild_id, kind, value))
+        super().add_automod_rule(guild_id, kind, value)
+
+    def remove_automod_rule(self, guild_id, kind, value):
+        self._execute("DELETE FROM bot_automod_rules WHERE guild_id = %s AND kind = %s AND value = %s", (guild_id, kind, value))
+        super().remove_automod_rule(guild_id, kind, value)
+
+    # Spam counters
+    def add_spam_warning(self, guild_id, user_id, minimum=0):
+        row = self._execute("""
+            INSERT INTO bot_spam_warnings (guild_id, user_id, warnings)
+            VALUES (%s, %s, GREATEST(1, %s))
+            ON CONFLICT (guild_id, user_id)
+            DO UPDATE SET warnings = GREATEST(bot_spam_warnings.warnings + 1, %s)
+            RETURNING warnings
+        """, (guild_id or 0, user_id, minimum, minimum), fetch='one')
+        self.bot_state.guild(guild_id).user_warnings[user_id] = row[0]
+        return row[0]
+
+    def reset_spam_warnings(self, guild_id, user_id):
+        self._execute("DELETE FROM bot_spam_warnings WHERE guild_id = %s AND user_id = %s", (guild_id or 0, user_id))
+        super().reset_spam_warnings(guild_id, user_id)
+
+    # Verification
+    def mark_verified(self, guild_id, user_id):
+        self._execute("""
+            INSERT INTO bot_verified_users (guild_id, user_id) VALUES (%s, %s)
+            ON CONFLICT DO NOTHING
+        """, (guild_id or 0, user_id))
+        super().mark_verified(guild_id, user_id)
+
+    def is_verified(self, guild_id, user_id):
+        if super().is_verified(guild_id, user_id):
+            return True
+        row = self._execute(
+            "SELECT 1 FROM bot_verified_users WHERE guild_id = %s AND user_id = %s",
+            (guild_id or 0, user_id), fetch='one'
+        )
+        if row:
+            super().mark_verified(guild_id, user_id)
+        return row is not None
+
+    def verified_count(self, guild_id):
+        return self._execute(
+            "SELECT COUNT(*) FROM bot_verified_users WHERE guild_id = %s", (guild_id or 0,), fetch='one'
+        )[0]
+
+    # Ticket logs
+    def load_ticket_logs(self, channel_ids):
+        if not channel_ids:
+            return []
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT channel_id, has_head, overflow FROM bot_ticket_logs WHERE channel_id = ANY(%s)", (list(channel_ids),))
+                logs = {channel_id: (channel_id, has_head, overflow, []) for channel_id, has_head, overflow in cursor.fetchall()}
+                cursor.execute(
+                    "SELECT channel_id, message_id, data FROM bot_ticket_messages WHERE channel_id = ANY(%s) ORDER BY message_id",
+                    (list(logs),)
+                )
+                for channel_id, message_id, data in cursor.fetchall():
+                    logs[channel_id][3].append((message_id, data))
+        return list(logs.values())
+
+    def save_ticket_logs(self, logs, dropped):
+        from psycopg2.extras import execute_values
+
+        with self._connection() as conn:
+            with conn.cursor() as cursor:
+                if dropped:
+                    cursor.execute("DELETE FROM bot_ticket_messages WHERE channel_id = ANY(%s)", (dropped,))
+                    cursor.execute("DELETE FROM bot_ticket_logs WHERE channel_id = ANY(%s)", (dropped,))
+                if logs:
+                    execute_values(cursor, """
+                        INSERT INTO bot_ticket_logs (channel_id, has_head, overflow) VALUES %s
+                        ON CONFLICT (channel_id) DO UPDATE SET has_head = EXCLUDED.has_head, overflow = EXCLUDED.overflow
+                    """, [(channel_id, has_head, overflow) for channel_id, has_head, overflow, _, _ in logs])
+                    rows = [(channel_id, message_id, data) for channel_id, _, _, messages, _ in logs for message_id, data in messages]
+                    if rows:
+                        execute_values(cursor, """
+                            INSERT INTO bot_ticket_messages (channel_id, message_id, data) VALUES %s
+                            ON CONFLICT (channel_id, message_id) DO UPDATE SET data = EXCLUDED.data
+                        """, rows)
+                    removed = [(channel_id, message_id) for channel_id, _, _, _, removed in logs for message_id in removed]
+                    if removed:
+                        execute_values(cursor, """
+                            DELETE FROM bot_ticket_messages AS m USING (VALUES %s) AS r (channel_id, message_id)
+                            WHERE m.channel_id = r.channel_id AND m.message_id = r.message_id
+                        """, removed, template="(%s::bigint, %s::bigint)")
+                conn.commit()
+
+    # Coordination
+    def claim(self, kind, key, ttl=600):
+        row = self._execute("""
+            INSERT INTO bot_claims (kind, key, expires_at)
+            VALUES (%s, %s, NOW() + make_interval(secs => %s))
+            ON CONFLICT (kind, key) DO UPDATE SET expires_at = EXCLUDED.expires_at
+            WHERE bot_claims.expires_at < NOW()
+            RETURNING kind
+        """, (kind, key, ttl), fetch='one')
+        return row is not None
+
+    def is_leader(self, job):
+        """Leadership for a singleton job, rechecked at most every LEADER_CHECK_INTERVAL seconds"""
+        checked = self._leader_checks.get(job)
+        if checked is not None and time.monotonic() - checked[0] < LEADER_CHECK_INTERVAL:
+            return checked[1]
+        leader = self._check_leader(job)
+        self._leader_checks[job] = (time.monotonic(), leader)
+        return leader
+
+    def _check_leader(self, job):
+        """Hold (or try to take) the advisory lock for a singleton job"""
+        conn = self._leader_connections.get(job)
+        if conn is not None:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                return True
+            except Exception:
+                # Connection lost, so was the lock
+                logger.warning(f"Lost leadership for {job}")
+                self._leader_connections.pop(job, None)
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+        try:
+            conn = self._connect()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", (advisory_lock_key(job),))
+                acquired = cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Leader election error for {job}: {e}")
+            return False
+
+        if not acquired:
+            conn.close()
+            return False
+        self._leader_connections[job] = conn
+        logger.info(f"Became leader for {job}")
+        return True
+
+def advisory_lock_key(job):
+    """Stable 32-bit advisory lock key for a job name"""
+    return zlib.crc32(f"voralith:{job}".encode())
+
+def create_state_backend(bot_state):
+    """Pick the backend from STATE_BACKEND (memory or postgres)
+
+    Defaults to postgres when DATABASE_URL is set, like the rest of the bot.
+    """
+    dsn = os.environ.get('DATABASE_URL')
+    backend = os.environ.get('STATE_BACKEND', 'postgres' if dsn else 'memory').lower()
+    if backend == 'postgres':
+        if not dsn:
+            raise RuntimeError("STATE_BACKEND=postgres requires DATABASE_URL")
+        return PostgresStateBackend(bot_state, dsn)
+    return InProcessStateBackend(bot_state)
+
+def _worker(dsn, worker_id, rounds, results):
+    """One simulated bot process: compete for leadership and end due giveaways"""
+    import datetime
+    from state import BotState
+
+    backend = PostgresStateBackend(BotState(), dsn)
+    finished = []
+    led = 0
+    for _ in range(rounds):
+        if backend.is_leader('check_giveaways'):
+            led += 1
+        # Every process also tries to end every due giveaway directly; the
+        # DELETE ... RETURNING claim must still hand each one out exactly once
+        for giveaway in backend.due_giveaways(datetime.datetime.utcnow()):
+            if backend.finish_giveaway(giveaway['guild_id'], giveaway['id']):
+                finished.append(giveaway['id'])
+        if backend.claim('oauth_code', 'same-code'):
+            finished.append('oauth')
+        time.sleep(0.05)
+    results.put((worker_id, led, finished))
+
+def _multiprocess_check(processes=4, giveaways=50, rounds=20):
+    """Run several processes against one Postgres and check nothing is done twice"""
+    import datetime
+    import multiprocessing
+    from state import BotState
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print("Set DATABASE_URL to a local Postgres to run the multi-process check")
+        return
+
+    backend = PostgresStateBackend(BotState(), dsn)
+    backend.init_schema()
+    backend._execute("DELETE FROM bot_claims WHERE kind = 'oauth_code' AND key = 'same-code'")
+    past = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    ids = []
+    for i in range(giveaways):
+        giveaway_id = backend.next_giveaway_id()
+        ids.append(giveaway_id)
+        backend.add_giveaway({'id': giveaway_id, 'guild_id': 1 + i % 7, 'channel_id': 1, 'message_id': 1,
+                              'host_id': 1, 'prize': 'test', 'end_time': past, 'participants': []})
+        backend.add_giveaway_participant(1 + i % 7, giveaway_id, 42)
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, args=(dsn, i, rounds, results)) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    finished = [g for _, _, done in outcomes for g in done if g != 'oauth' and g in ids]
+    oauth = sum(1 for _, _, done in outcomes for g in done if g == 'oauth')
+    leaders = [worker_id for worker_id, led, _ in outcomes if led]
+    print(f"{processes} processes: leaders={leaders}, giveaways finished={len(finished)}/{giveaways} "
+          f"(unique {len(set(finished))}), oauth claims={oauth}")
+    ok = len(finished) == len(set(finished)) == giveaways and oauth == 1 and leaders
+    print("OK" if ok else "FAILED")
+
+if __name__ == "__main__":
+    _multiprocess_check()
@@ -0,0 +1,275 @@
+import datetime
+import json
+from collections import OrderedDict
+
+# Ticket log settings
+TICKET_LOG_MAX_MESSAGES = 20000  # Beyond this a ticket falls back to reading the channel history
+TICKET_LOG_SAVE_INTERVAL = 10  # Seconds between two saves of the changed logs to the state backend
+
+def is_ticket_channel(channel):
+    """Ticket and custom order channels, by name"""
+    name = getattr(channel, 'name', None) or ''
+    return name.startswith("ticket-") or "custom-order" in name.lower()
+
+class LoggedAuthor:
+    __slots__ = ('id', 'display_name', 'bot')
+
+    def __init__(self, author_id, display_name, bot):
+        self.id = author_id
+        self.display_name = display_name
+        self.bot = bot
+
+class LoggedAttachment:
+    __slots__ = ('filename', 'url')
+
+    def __init__(self, filename, url):
+        self.filename = filename
+        self.url = url
+
+class LoggedMessage:
+    """Compact copy of a ticket message with the fields the transcript reads"""
+    __slots__ = ('id', 'author', 'content', 'created_at', 'edited_at', 'attachments', 'embeds')
+
+    def __init__(self, message_id, author, content, created_at, attachments=(), embeds=(), edited_at=None):
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.created_at = created_at
+        self.edited_at = edited_at
+        self.attachments = list(attachments)
+        self.embeds = tuple(embeds)  # Embed titles, only their presence matters for the transcript
+
+    @classmethod
+    def from_message(cls, message, authors):
+        author = authors.get(message.author.id)
+        if author is None or author.display_name != message.author.display_name:
+            author = authors[message.author.id] = LoggedAuthor(message.author.id, message.author.display_name, message.author.bot)
+        return cls(
+            message.id,
+            author,
+            message.content,
+            message.created_at,
+            [LoggedAttachment(a.filename, a.url) for a in message.attachments],
+            [e.title or '' for e in message.embeds],
+            message.edited_at
+        )
+
+    def to_json(self):
+        """Stored form, see from_json"""
+        return json.dumps({
+            'author': [self.author.id, self.author.display_name, self.author.bot],
+            'content': self.content,
+            'created_at': self.created_at.isoformat(),
+            'edited_at': self.edited_at.isoformat() if self.edited_at else None,
+            'attachments': [[a.filename, a.url] for a in self.attachments],
+            'embeds': list(self.embeds)
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, message_id, data, authors):
+        data = json.loads(data)
+        author_id, display_name, bot = data['author']
+        author = authors.get(author_id)
+        if author is None or author.display_name != display_name:
+            author = authors[author_id] = LoggedAuthor(author_id, display_name, bot)
+        return cls(
+            message_id,
+            author,
+            data['content'],
+            datetime.datetime.fromisoformat(data['created_at']),
+            [LoggedAttachment(filename, url) for filename, url in data['attachments']],
+            data['embeds'],
+            datetime.datetime.fromisoformat(data['edited_at']) if data['edited_at'] else None
+        )
+
+class TicketLog:
+    """Messages of one ticket channel in arrival order"""
+
+    def __init__(self, has_head):
+        self.messages = OrderedDict()  # message_id -> LoggedMessage
+        self.authors = {}  # author_id -> LoggedAuthor, shared by all their messages
+        self.has_head = has_head  # True if no message before the first logged one is missing
+        self.dirty = False  # True if messages may have been missed since the last one (downtime)
+        self.overflow = False  # Too many messages, the transcript reads the channel history instead
+        # Not saved yet (see TicketLogStore.take_changes)
+        self.changed = set()  # Added or edited message ids
+        self.removed = set()  # Deleted message ids
+        self.flags_changed = True  # has_head or overflow
+
+    @property
+    def last_id(self):
+        return max(self.messages) if self.messages else None
+
+    def add(self, message):
+        """Log a message, returns the logged copy or None if it was already logged or doesn't fit"""
+        if message.id in self.messages:
+            return None
+        if len(self.messages) >= TICKET_LOG_MAX_MESSAGES:
+            if not self.overflow:
+                self.overflow = self.flags_changed = True
+            return None
+        logged = self.messages[message.id] = LoggedMessage.from_message(message, self.authors)
+        self.changed.add(message.id)
+        return logged
+
+    def update(self, message_id, data):
+        """Apply a raw MESSAGE_UPDATE payload, returns the logged copy if there is one"""
+        logged = self.messages.get(message_id)
+        if logged is None:
+            return None
+        if 'content' in data:
+            logged.content = data['content']
+        if 'attachments' in data:
+            logged.attachments = [LoggedAttachment(a['filename'], a['url']) for a in data['attachments']]
+        if 'embeds' in data:
+            logged.embeds = tuple(e.get('title') or '' for e in data['embeds'])
+        if data.get('edited_timestamp'):
+            logged.edited_at = datetime.datetime.fromisoformat(data['edited_timestamp'])
+        self.changed.add(message_id)
+        return logged
+
+    def remove(self, message_id):
+        if self.messages.pop(message_id, None) is not None:
+            self.changed.discard(message_id)
+            self.removed.add(message_id)
+
+    def sorted_messages(self):
+        # Snowflakes sort by creation time; reconciled messages may arrive out of order
+        return sorted(self.messages.values(), key=lambda m: m.id)
+
+class TicketLogStore:
+    """Incremental message logs of open ticket channels
+
+    Messages are appended from on_message and updated from raw edit/delete
+    events, so closing a ticket needs no history API calls. Logs live in
+    memory and are saved in batches through take_changes(); after a restart
+    they are restored, and after a restart or reconnect they are marked
+    dirty and reconcile() fetches only what was missed since the last
+    logged message.
+
+    on_attachments(attachments) is called with the attachments of every
+    newly logged or edited message, while their signed links are fresh.
+    """
+
+    def __init__(self, on_attachments=None):
+        self.logs = {}  # channel_id -> TicketLog
+        self.on_attachments = on_attachments
+        self.dropped = set()  # Channel ids whose saved log must be deleted
+
+    def _logged(self, logged):
+        if logged is not None and logged.attachments and self.on_attachments is not None:
+            self.on_attachments(logged.attachments)
+
+    def track(self, channel_id, new_channel=False):
+        """Start logging a channel; new_channel means it has no earlier history"""
+        log = self.logs.get(channel_id)
+        if log is None:
+            log = self.logs[channel_id] = TicketLog(has_head=new_channel)
+        return log
+
+    def get(self, channel_id):
+        return self.logs.get(channel_id)
+
+    def drop(self, channel_id):
+        self.dropped.add(channel_id)
+        return self.logs.pop(channel_id, None)
+
+    def restore(self, channel_id, has_head, overflow, rows):
+        """Load a saved log, rows are (message_id, to_json() data)
+
+        Messages logged since the start are kept; a log that is already
+        complete is left alone (on_ready fires again after reconnects).
+        """
+        log = self.track(channel_id)
+        if log.has_head:
+            return log
+        for message_id, data in rows:
+            if message_id not in log.messages:
+                log.messages[message_id] = LoggedMessage.from_json(message_id, data, log.authors)
+        log.has_head = has_head
+        log.overflow = log.overflow or overflow
+        log.dirty = True
+        return log
+
+    def take_changes(self):
+        """Unsaved changes as (logs, dropped channel ids), and forget them
+
+        logs is a list of (channel_id, has_head, overflow, [(message_id, data)], [removed message ids]).
+        """
+        logs = []
+        for channel_id, log in self.logs.items():
+            if not (log.changed or log.removed or log.flags_changed):
+                continue
+            rows = [(message_id, log.messages[message_id].to_json()) for message_id in log.changed]
+            logs.append((channel_id, log.has_head, log.overflow, rows, list(log.removed)))
+            log.changed = set()
+            log.removed = set()
+            log.flags_changed = False
+        dropped = list(self.dropped)
+        self.dropped = set()
+        return logs, dropped
+
+    def keep_changes(self, logs, dropped):
+        """Put back changes taken by take_changes() that could not be saved"""
+        for channel_id, _, _, rows, removed in logs:
+            log = self.logs.get(channel_id)
+            if log is None:
+                continue
+            log.changed.update(message_id for message_id, _ in rows if message_id in log.messages)
+            log.removed.update(removed)
+            log.flags_changed = True
+        self.dropped.update(dropped)
+
+    def mark_dirty(self):
+        """Events may have been missed, e.g. after a gateway reconnect"""
+        for log in self.logs.values():
+            log.dirty = True
+
+    def on_message(self, message):
+        log = self.logs.get(message.channel.id)
+        if log is None:
+            if not is_ticket_channel(message.channel):
+                return
+            # Ticket opened while the bot was offline, reconcile() fills the start
+            log = self.track(message.channel.id)
+        self._logged(log.add(message))
+
+    def on_raw_edit(self, channel_id, message_id, data):
+        log = self.logs.get(channel_id)
+        if log is not None:
+            logged = log.update(message_id, data)
+            if 'attachments' in data:
+                self._logged(logged)
+
+    def on_raw_delete(self, channel_id, message_ids):
+        log = self.logs.get(channel_id)
+        if log is not None:
+            for message_id in message_ids:
+                log.remove(message_id)
+
+    async def reconcile(self, channel):
+        """Fetch messages missed while not connected
+
+        Edits made during downtime to already logged messages are not picked up.
+        """
+        import discord
+
+        log = self.track(channel.id)
+        after = discord.Object(id=log.last_id) if log.has_head and log.last_id else None
+        fetched = 0
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            self._logged(log.add(message))
+            fetched += 1
+        if not log.has_head:
+            log.has_head = log.flags_changed = True
+        log.dirty = False
+        return fetched
+
+    async def messages(self, channel):
+        """All messages of a ticket in order, reconciling first if needed"""
+        log = self.logs.get(channel.id)
+        if log is not None and (log.dirty or not log.has_head):
+            await self.reconcile(channel)
+        if log is None or log.overflow:
+            return [message async for message in channel.history(limit=None, oldest_first=True)]
+        return log.sorted_messages()
@@ -0,0 +1,300 @@
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import functools
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+from loadmon import percentile
+
+logger = logging.getLogger(__name__)
+
+# Interaction tracing settings
+TRACE_FILE = os.getenv('INTERACTION_TRACE_FILE', '')  # One JSON line per interaction, off unless a path is set
+TRACE_FILE_MAX_BYTES = 20 * 1024 * 1024  # Rotated to <file>.1 past this size
+TRACE_FLUSH_INTERVAL = 5  # Seconds between writes to the trace file
+TRACE_MAX_PENDING = 10000  # Unwritten traces kept, the oldest are dropped past this
+TRACE_WINDOW = 500  # Recent interactions per handler kept for percentiles
+ACK_DEADLINE = 3.0  # Seconds Discord gives to acknowledge an interaction
+
+# Trace of the interaction being handled by the current task (or thread, via asyncio.to_thread)
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+class InteractionTrace:
+    __slots__ = ('name', 'kind', 'guild_id', 'user_id', 'created', 'started', 'start', 'ack', 'reply', 'end',
+                 'db', 'db_calls', 'rest', 'rest_calls', 'auto_deferred', 'outcome')
+
+    def __init__(self, name, kind, guild_id, user_id, created=None):
+        self.name = name
+        self.kind = kind  # 'command' or 'component'
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.created = created  # Discord's timestamp of the interaction, if known
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.ack = None
+        self.reply = None  # First response of the handler itself, later than ack when the middleware deferred
+        self.end = None
+        self.db = 0.0
+        self.db_calls = 0
+        self.rest = 0.0
+        self.rest_calls = 0
+        self.auto_deferred = False
+        self.outcome = None
+
+    @property
+    def ack_time(self):
+        """Seconds from the handler start to the first response, None if never acknowledged"""
+        return self.ack - self.start if self.ack is not None else None
+
+    @property
+    def reply_time(self):
+        """Seconds from the handler start to its own first response, None if it never answered"""
+        reply = self.reply if self.reply is not None else self.ack
+        return reply - self.start if reply is not None else None
+
+    def to_dict(self):
+        return {
+            'ts': round(self.started, 3),
+            'name': self.name,
+            'kind': self.kind,
+            'guild': self.guild_id,
+            'user': self.user_id,
+            'outcome': self.outcome,
+            # Gateway and queueing delay before the handler ran (clock skew included)
+            'wait_ms': round((self.started - self.created) * 1000, 1) if self.created is not None else None,
+            'ack_ms': round(self.ack_time * 1000, 1) if self.ack is not None else None,
+            'reply_ms': round(self.reply_time * 1000, 1) if self.reply_time is not None else None,
+            'auto_deferred': self.auto_deferred,
+            'total_ms': round((self.end - self.start) * 1000, 1),
+            'db_ms': round(self.db * 1000, 1),
+            'db_calls': self.db_calls,
+            'rest_ms': round(self.rest * 1000, 1),
+            'rest_calls': self.rest_calls,
+        }
+
+@contextlib.contextmanager
+def span(kind):
+    """Add the time of a 'db' or 'rest' call to the running interaction's trace"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if kind == 'db':
+            trace.db += elapsed
+            trace.db_calls += 1
+        else:
+            trace.rest += elapsed
+            trace.rest_calls += 1
+
+def traced(kind):
+    """Decorator timing every call of a function (sync or async) as a span"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(kind):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(kind):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument(cls, name, kind):
+    """Time a library method (e.g. the REST client) as a span"""
+    setattr(cls, name, traced(kind)(getattr(cls, name)))
+
+def instrument_ack(cls, name):
+    """Record the first completed call of a response method as the interaction's ack"""
+    func = getattr(cls, name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        result = await func(*args, **kwargs)
+        trace = current_trace.get()
+        if trace is not None and trace.ack is None:
+            trace.ack = time.perf_counter()
+        return result
+    setattr(cls, name, wrapper)
+
+class HandlerStats:
+    __slots__ = ('count', 'errors', 'denied', 'late_acks', 'auto_defers', 'ack', 'reply', 'total', 'db', 'rest')
+
+    def __init__(self, window):
+        self.count = 0
+        self.errors = 0
+        self.denied = 0
+        self.late_acks = 0  # Acknowledged after the deadline, or never
+        self.auto_defers = 0
+        self.ack = deque(maxlen=window)
+        self.reply = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.db = deque(maxlen=window)
+        self.rest = deque(maxlen=window)
+
+class InteractionTracer:
+    """Per-handler latency of interactions, for /metrics and a JSONL trace file
+
+    Each trace records the time to acknowledge, the total handler time and
+    the time spent in database and REST calls. Finished traces are buffered
+    and appended to the trace file by a background task.
+    """
+
+    def __init__(self, path=TRACE_FILE, window=TRACE_WINDOW):
+        self.path = path
+        self.window = window
+        self.handlers = {}  # handler name -> HandlerStats
+        self.pending = deque(maxlen=TRACE_MAX_PENDING)  # JSON lines not written yet
+        self.written = 0
+
+    def start(self, name, kind, interaction):
+        guild = getattr(interaction, 'guild', None)
+        user = getattr(interaction, 'user', None)
+        created_at = getattr(interaction, 'created_at', None)
+        return InteractionTrace(
+            name, kind,
+            guild.id if guild else None,
+            user.id if user else None,
+            created_at.timestamp() if isinstance(created_at, datetime.datetime) else None
+        )
+
+    def finish(self, trace, outcome):
+        trace.end = time.perf_counter()
+        trace.outcome = outcome
+        stats = self.handlers.get(trace.name)
+        if stats is None:
+            stats = self.handlers[trace.name] = HandlerStats(self.window)
+        stats.count += 1
+        if outcome == 'error':
+            stats.errors += 1
+        elif outcome == 'denied':
+            stats.denied += 1
+        ack_time = trace.ack_time
+        if ack_time is None or ack_time > ACK_DEADLINE:
+            stats.late_acks += 1
+        if ack_time is not None:
+            stats.ack.append(ack_time)
+        if trace.auto_deferred:
+            stats.auto_defers += 1
+        if trace.reply_time is not None:
+            stats.reply.append(trace.reply_time)
+        stats.total.append(trace.end - trace.start)
+        stats.db.append(trace.db)
+        stats.rest.append(trace.rest)
+        if self.path:
+            self.pending.append(json.dumps(trace.to_dict()))
+
+    def reply_estimate(self, name, quantile, min_samples):
+        """Recent quantile of the time a handler takes to answer, None with too few samples"""
+        stats = self.handlers.get(name)
+        if stats is None or len(stats.reply) < min_samples:
+            return None
+        return percentile(sorted(stats.reply), quantile)
+
+    def snapshot(self):
+        """Counters and recent percentiles (milliseconds) per handler"""
+        handlers = {}
+        for name, stats in sorted(self.handlers.items()):
+            ack = sorted(stats.ack)
+            reply = sorted(stats.reply)
+            total = sorted(stats.total)
+            handlers[name] = {
+                'count': stats.count,
+                'errors': stats.errors,
+                'denied': stats.denied,
+                'late_acks': stats.late_acks,
+                'auto_defers': stats.auto_defers,
+                'ack_p50_ms': round(percentile(ack, 0.5) * 1000, 1),
+                'ack_p99_ms': round(percentile(ack, 0.99) * 1000, 1),
+                'reply_p50_ms': round(percentile(reply, 0.5) * 1000, 1),
+                'reply_p99_ms': round(percentile(reply, 0.99) * 1000, 1),
+                'total_p50_ms': round(percentile(total, 0.5) * 1000, 1),
+                'total_p99_ms': round(percentile(total, 0.99) * 1000, 1),
+                'db_avg_ms': round(sum(stats.db) / len(stats.db) * 1000, 1) if stats.db else 0.0,
+                'rest_avg_ms': round(sum(stats.rest) / len(stats.rest) * 1000, 1) if stats.rest else 0.0,
+            }
+        return handlers
+
+    def _write(self, lines):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_FILE_MAX_BYTES:
+            os.replace(self.path, f"{self.path}.1")
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        if not self.pending:
+            return 0
+        lines = list(self.pending)
+        self.pending.clear()
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except Exception as e:
+            logger.error(f"Error writing {len(lines)} interaction trace(s): {e}")
+            return 0
+        self.written += len(lines)
+        return len(lines)
+
+    async def run(self, interval=TRACE_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+def _selftest():
+    """Spans are attributed to the right interaction, also across threads"""
+    import tempfile
+    from types import SimpleNamespace
+
+    @traced('db')
+    def query():
+        time.sleep(0.02)
+
+    class Response:
+        async def send_message(self):
+            await asyncio.sleep(0.01)
+
+    instrument_ack(Response, 'send_message')
+
+    async def handler(tracer, name, db_calls):
+        trace = tracer.start(name, 'command', SimpleNamespace(guild=SimpleNamespace(id=1), user=SimpleNamespace(id=2)))
+        token = current_trace.set(trace)
+        try:
+            for _ in range(db_calls):
+                await asyncio.to_thread(query)
+            await Response().send_message()
+        finally:
+            current_trace.reset(token)
+            tracer.finish(trace, 'ok')
+        return trace
+
+    async def selftest(path):
+        tracer = InteractionTracer(path)
+        traces = await asyncio.gather(handler(tracer, '/a', 1), handler(tracer, '/b', 3))
+        assert [trace.db_calls for trace in traces] == [1, 3]
+        assert traces[1].db >= 0.06 and traces[1].ack_time >= traces[1].db
+        query()  # Outside of an interaction: not traced
+        assert await tracer.flush() == 2
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        for name, stats in tracer.snapshot().items():
+            print(f"{name}: ack {stats['ack_p50_ms']}ms, db {stats['db_avg_ms']}ms, total {stats['total_p50_ms']}ms")
+        assert [line['name'] for line in lines] == ['/a', '/b']
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(selftest(os.path.join(directory, 'traces.jsonl')))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
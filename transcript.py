@@ -0,0 +1,504 @@
+import asyncio
+import io
+import multiprocessing
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Transcript rendering settings
+TRANSCRIPT_OFFLOAD_MESSAGES = 500  # Tickets with more messages render in the process pool
+TRANSCRIPT_WORKERS = 2  # Render processes; further closes wait in FIFO order
+TRANSCRIPT_SIZE_MARGIN = 64 * 1024  # Kept free below the guild's upload limit for the request overhead
+TRANSCRIPT_STYLESHEET = 'style.css'  # Shared stylesheet inside transcript archives
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+def transcript_rows(messages, mirrored=None):
+    """Flatten messages into plain tuples for rendering
+
+    Row: (author_id, display_name, is_bot, timestamp, content, attachments)
+    Attachment: (filename, url, preview_url or None for non-images)
+    Plain tuples pickle compactly and carry no discord objects into the pool.
+    """
+    mirrored = mirrored or {}
+    rows = []
+    for message in messages:
+        # Skip empty bot embeds but keep bot text messages
+        if message.author.bot and not message.content and message.embeds:
+            continue
+
+        attachments = []
+        for attachment in message.attachments:
+            # Prefer the mirrored copy, CDN links expire
+            stored = mirrored.get(attachment.url)
+            url = stored.url if stored else attachment.url
+            preview_url = None
+            if attachment.filename.lower().endswith(IMAGE_EXTENSIONS):
+                preview_url = (stored.thumbnail_url or stored.url) if stored else attachment.url
+            attachments.append((attachment.filename, url, preview_url))
+
+        rows.append((
+            message.author.id,
+            message.author.display_name,
+            message.author.bot,
+            message.created_at.strftime('%d/%m/%Y %H:%M:%S'),
+            message.content,
+            tuple(attachments)
+        ))
+    return rows
+
+TRANSCRIPT_CSS = """
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+        
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            background: linear-gradient(135deg, #2c2f33 0%, #23272a 100%);
+            color: #dcddde;
+            line-height: 1.6;
+        }
+        
+        .container {
+            max-width: 900px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        
+        .header {
+            background: linear-gradient(135deg, #5B2C6F 0%, #7c3aed 100%);
+            padding: 30px;
+            border-radius: 15px;
+            margin-bottom: 30px;
+            text-align: center;
+            box-shadow: 0 10px 30px rgba(0,0,0,0.3);
+        }
+        
+        .header h1 {
+            color: white;
+            font-size: 2.5rem;
+            margin-bottom: 10px;
+            text-shadow: 0 2px 4px rgba(0,0,0,0.3);
+        }
+        
+        .header-info {
+            background: rgba(255,255,255,0.1);
+            padding: 15px;
+            border-radius: 10px;
+            margin-top: 20px;
+        }
+        
+        .header-info p {
+            margin: 5px 0;
+            font-size: 1.1rem;
+        }
+        
+        .messages {
+            background: #36393f;
+            border-radius: 15px;
+            padding: 20px;
+            box-shadow: 0 5px 20px rgba(0,0,0,0.2);
+        }
+        
+        .message {
+            margin-bottom: 20px;
+            padding: 15px;
+            background: #40444b;
+            border-radius: 10px;
+            border-left: 4px solid #5B2C6F;
+            transition: transform 0.2s ease;
+        }
+        
+        .message:hover {
+            transform: translateX(5px);
+        }
+        
+        .message-header {
+            display: flex;
+            align-items: center;
+            margin-bottom: 10px;
+        }
+        
+        .avatar {
+            width: 40px;
+            height: 40px;
+            border-radius: 50%;
+            background: linear-gradient(45deg, #5B2C6F, #7c3aed);
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            margin-right: 15px;
+            font-weight: bold;
+            color: white;
+            text-transform: uppercase;
+        }
+        
+        .message-info {
+            flex: 1;
+        }
+        
+        .username {
+            font-weight: bold;
+            color: #ffffff;
+            font-size: 1.1rem;
+        }
+        
+        .timestamp {
+            color: #72767d;
+            font-size: 0.9rem;
+            margin-left: 10px;
+        }
+        
+        .message-content {
+            margin-left: 55px;
+            line-height: 1.6;
+            word-wrap: break-word;
+        }
+        
+        .attachment {
+            background: #2f3136;
+            border: 1px solid #5B2C6F;
+            border-radius: 8px;
+            padding: 10px;
+            margin: 10px 0;
+            display: inline-block;
+        }
+        
+        .attachment a {
+            color: #7c3aed;
+            text-decoration: none;
+            font-weight: bold;
+        }
+        
+        .attachment a:hover {
+            text-decoration: underline;
+        }
+        
+        .image-preview {
+            max-width: 400px;
+            max-height: 300px;
+            border-radius: 8px;
+            margin: 10px 0;
+        }
+        
+        .bot-message {
+            border-left-color: #7289da;
+        }
+        
+        .bot-message .avatar {
+            background: linear-gradient(45deg, #7289da, #5865f2);
+        }
+        
+        .footer {
+            text-align: center;
+            margin-top: 30px;
+            padding: 20px;
+            color: #72767d;
+            font-size: 0.9rem;
+        }
+        
+        .stats {
+            display: grid;
+            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
+            gap: 15px;
+            margin: 20px 0;
+        }
+        
+        .stat {
+            background: rgba(255,255,255,0.1);
+            padding: 15px;
+            border-radius: 10px;
+            text-align: center;
+        }
+        
+        .stat-number {
+            font-size: 2rem;
+            font-weight: bold;
+            color: #7c3aed;
+        }
+        
+        .stat-label {
+            color: #dcddde;
+            margin-top: 5px;
+        }
+"""
+
+TRANSCRIPT_FOOTER = """
+        </div>
+        
+        <div class="footer">
+            <p>Transcript généré automatiquement par <strong>Voralith Support System</strong></p>
+            <p>© 2025 Voralith - Système de support professionnel</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+def render_head(channel_name, closed_by_name, generated_at, rows, stylesheet=None, title_suffix=""):
+    """Transcript header; the CSS is inlined unless a stylesheet file is linked"""
+    if stylesheet:
+        style = f'<link rel="stylesheet" href="{stylesheet}">'
+    else:
+        style = f"<style>{TRANSCRIPT_CSS}    </style>"
+    return f"""
+<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Transcript - {channel_name}{title_suffix}</title>
+    {style}
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🎫 Transcript Voralith</h1>
+            <div class="header-info">
+                <p><strong>Salon:</strong> {channel_name}</p>
+                <p><strong>Fermé par:</strong> {closed_by_name}</p>
+                <p><strong>Date:</strong> {generated_at.strftime('%d/%m/%Y à %H:%M')}</p>
+            </div>
+            <div class="stats">
+                <div class="stat">
+                    <div class="stat-number">{len(rows)}</div>
+                    <div class="stat-label">Messages</div>
+                </div>
+                <div class="stat">
+                    <div class="stat-number">{len(set(row[0] for row in rows))}</div>
+                    <div class="stat-label">Participants</div>
+                </div>
+            </div>
+        </div>
+        
+        <div class="messages">
+"""
+
+def render_messages(rows):
+    """HTML block of each message, in order"""
+    blocks = []
+    for author_id, display_name, is_bot, timestamp, content, attachments in rows:
+        parts = []
+
+        # Get first letter for avatar
+        avatar_letter = display_name[0] if display_name else "?"
+
+        # Bot or user styling
+        message_class = "message bot-message" if is_bot else "message"
+
+        # Format content
+        content = content if content else "<em>Aucun contenu texte</em>"
+        content = content.replace('\n', '<br>')
+
+        parts.append(f"""
+            <div class="{message_class}">
+                <div class="message-header">
+                    <div class="avatar">{avatar_letter}</div>
+                    <div class="message-info">
+                        <span class="username">{display_name}</span>
+                        <span class="timestamp">{timestamp}</span>
+                    </div>
+                </div>
+                <div class="message-content">
+                    {content}
+""")
+
+        # Add attachments
+        for filename, url, preview_url in attachments:
+            if preview_url:
+                parts.append(f"""
+                    <div class="attachment">
+                        <p>📷 <strong>Image:</strong> <a href="{url}" target="_blank">{filename}</a></p>
+                        <img src="{preview_url}" alt="{filename}" class="image-preview">
+                    </div>
+""")
+            else:
+                parts.append(f"""
+                    <div class="attachment">
+                        📎 <strong>Fichier:</strong> <a href="{url}" target="_blank">{filename}</a>
+                    </div>
+""")
+
+        parts.append("""
+                </div>
+            </div>
+""")
+
+        blocks.append("".join(parts))
+    return blocks
+
+def render_transcript(channel_name, closed_by_name, generated_at, rows):
+    """Render the HTML transcript of a ticket from transcript_rows()"""
+    head = render_head(channel_name, closed_by_name, generated_at, rows)
+    return head + "".join(render_messages(rows)) + TRANSCRIPT_FOOTER
+
+class TranscriptFile:
+    __slots__ = ('filename', 'data', 'html_size')
+
+    def __init__(self, filename, data, html_size):
+        self.filename = filename
+        self.data = data
+        self.html_size = html_size  # Uncompressed HTML inside the file
+
+def _archive(html_name, html):
+    """Zip of one HTML page and the shared stylesheet"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(TRANSCRIPT_STYLESHEET, TRANSCRIPT_CSS)
+        archive.writestr(html_name, html)
+    return out.getvalue()
+
+def package_transcript(channel_name, closed_by_name, generated_at, rows, upload_limit):
+    """Transcript files that each fit the upload limit
+
+    In order of preference: one HTML file with inline CSS, one zip with the
+    HTML and the stylesheet, or numbered zips splitting the messages.
+    """
+    budget = upload_limit - TRANSCRIPT_SIZE_MARGIN
+    base = f"transcript-{channel_name}"
+    blocks = render_messages(rows)
+
+    html = (render_head(channel_name, closed_by_name, generated_at, rows) + "".join(blocks) + TRANSCRIPT_FOOTER).encode('utf-8')
+    if len(html) <= budget:
+        return [TranscriptFile(f"{base}.html", html, len(html))]
+
+    html = (render_head(channel_name, closed_by_name, generated_at, rows, TRANSCRIPT_STYLESHEET) + "".join(blocks) + TRANSCRIPT_FOOTER).encode('utf-8')
+    archive = _archive(f"{base}.html", html)
+    if len(archive) <= budget:
+        return [TranscriptFile(f"{base}.zip", archive, len(html))]
+
+    # Split the messages into parts sized by the compression ratio just measured
+    target = int(budget * len(html) / len(archive) * 0.9)
+    chunks = []
+    current = []
+    size = 0
+    for block in blocks:
+        block_size = len(block.encode('utf-8'))
+        if current and size + block_size > target:
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append(block)
+        size += block_size
+    chunks.append(current)
+
+    while True:
+        pages = []
+        for number, chunk in enumerate(chunks, 1):
+            suffix = f" ({number}/{len(chunks)})"
+            page = (render_head(channel_name, closed_by_name, generated_at, rows, TRANSCRIPT_STYLESHEET, suffix) + "".join(chunk) + TRANSCRIPT_FOOTER).encode('utf-8')
+            pages.append((page, _archive(f"{base}-part{number}.html", page)))
+        # A part that compressed worse than the average is halved and all parts renumbered
+        oversized = [i for i, (_, data) in enumerate(pages) if len(data) > budget and len(chunks[i]) > 1]
+        if not oversized:
+            break
+        for i in reversed(oversized):
+            half = len(chunks[i]) // 2
+            chunks[i:i + 1] = [chunks[i][:half], chunks[i][half:]]
+
+    return [TranscriptFile(f"{base}-part{number}of{len(pages)}.zip", data, len(page))
+            for number, (page, data) in enumerate(pages, 1)]
+
+def format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    return f"{size / 1024:.0f} KB"
+
+def describe_files(files):
+    """Size summary for the transcript embed"""
+    html_size = sum(f.html_size for f in files)
+    if len(files) == 1 and files[0].filename.endswith('.html'):
+        return f"{files[0].filename} ({format_size(html_size)})"
+    sizes = ", ".join(format_size(len(f.data)) for f in files)
+    if len(files) == 1:
+        return f"{files[0].filename} ({sizes}, {format_size(html_size)} HTML)"
+    return f"{len(files)} parts ({sizes}, {format_size(html_size)} HTML)"
+
+class TranscriptRenderer:
+    """Renders large transcripts in a bounded process pool
+
+    Small tickets render inline, where pickling would cost more than it saves.
+    The pool's work queue is FIFO, so concurrent closes are served in order
+    while the event loop keeps running.
+    """
+
+    def __init__(self, workers=TRANSCRIPT_WORKERS, threshold=TRANSCRIPT_OFFLOAD_MESSAGES):
+        self.workers = workers
+        self.threshold = threshold
+        self.pool = None
+        self.queued = 0
+        self.offloaded = 0
+
+    def _pool(self):
+        if self.pool is None:
+            # spawn: workers only import this module, never main.py or the bot
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    async def _run(self, func, channel_name, closed_by_name, generated_at, rows, *args):
+        if len(rows) < self.threshold:
+            return func(channel_name, closed_by_name, generated_at, rows, *args)
+
+        loop = asyncio.get_running_loop()
+        self.queued += 1
+        try:
+            result = await loop.run_in_executor(self._pool(), func, channel_name, closed_by_name, generated_at, rows, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            self.pool = None
+            result = func(channel_name, closed_by_name, generated_at, rows, *args)
+        finally:
+            self.queued -= 1
+        self.offloaded += 1
+        return result
+
+    async def render(self, channel_name, closed_by_name, generated_at, rows):
+        """HTML transcript as one string"""
+        return await self._run(render_transcript, channel_name, closed_by_name, generated_at, rows)
+
+    async def package(self, channel_name, closed_by_name, generated_at, rows, upload_limit):
+        """TranscriptFiles that fit upload_limit, see package_transcript()"""
+        return await self._run(package_transcript, channel_name, closed_by_name, generated_at, rows, upload_limit)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+def _selftest(messages=20000, upload_limit=1024 * 1024):
+    """Package a synthetic ticket under a small upload limit"""
+    import datetime
+    import random
+    import time
+
+    rng = random.Random(0)
+    start = datetime.datetime(2026, 1, 1)
+    rows = [(i % 7, f"user{i % 7}", i % 4 == 0, (start + datetime.timedelta(seconds=30 * i)).strftime('%d/%m/%Y %H:%M:%S'),
+             f"message {i}\n" + " ".join(f"{rng.getrandbits(32):x}" for _ in range(rng.randint(5, 60))),
+             ((f"proof{i}.png", f"https://cdn.example/proof{i}.png", f"https://cdn.example/proof{i}.png"),) if i % 20 == 0 else ())
+            for i in range(messages)]
+
+    for count in (100, messages // 10, messages):
+        began = time.perf_counter()
+        files = package_transcript("ticket-test", "staff", start, rows[:count], upload_limit)
+        elapsed = time.perf_counter() - began
+        print(f"{count:>6} messages: {describe_files(files)} in {elapsed:.2f}s")
+        assert all(len(f.data) <= upload_limit - TRANSCRIPT_SIZE_MARGIN for f in files)
+        for f in files:
+            if f.filename.endswith('.zip'):
+                with zipfile.ZipFile(io.BytesIO(f.data)) as archive:
+                    assert archive.namelist()[0] == TRANSCRIPT_STYLESHEET
+
+    # Every message appears in exactly one part
+    pages = []
+    for f in files:
+        with zipfile.ZipFile(io.BytesIO(f.data)) as archive:
+            pages.append(archive.read(archive.namelist()[1]).decode('utf-8'))
+    assert sum((page.count('<div class="message">') + page.count('<div class="message bot-message">')) for page in pages) == messages
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()
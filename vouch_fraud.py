@@ -0,0 +1,426 @@
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import sys
+import time
+from array import array
+from collections import defaultdict
+
+import requests
+
+from antiraid import normalize_content, simhash64
+
+try:
+    from PIL import Image  # Optional, image checks are off without it
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Vouch image check settings
+IMAGE_MATCH_DISTANCE = 10  # Differing bits (of 64) for two images to count as the same screenshot
+IMAGE_MAX_BYTES = 10 * 1024 * 1024  # Same limit as /vouch
+IMAGE_TIMEOUT = 15  # Seconds per download
+IMAGE_QUEUE_SIZE = 500  # Images waiting to be hashed before new ones are skipped
+HASH_BLOCKS = 4  # 16-bit blocks of the multi-index
+
+# Vouch text check settings
+TEXT_MATCH_DISTANCE = 7  # Differing SimHash bits for two vouch texts to count as copies
+TEXT_MIN_LENGTH = 40  # Shorter vouches ("fast and legit") are expected to repeat
+
+_MASK64 = (1 << 64) - 1
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+# Low-frequency DCT-II basis: _DCT[u][x] = cos(pi * (2x + 1) * u / 64)
+_DCT = [[math.cos(math.pi * (2 * x + 1) * u / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)] for u in range(_HASH_SIZE)]
+
+def dct_hash(pixels):
+    """64-bit perceptual hash (pHash) of a 32x32 grayscale image, row by row
+
+    Each bit tells if one of the 8x8 lowest DCT frequencies is above their
+    median, which survives resizing, recompression and small edits.
+    """
+    partial = []  # 32 rows x 8 horizontal frequencies
+    for y in range(_DCT_SIZE):
+        row = pixels[y * _DCT_SIZE:(y + 1) * _DCT_SIZE]
+        partial.append([sum(c * p for c, p in zip(basis, row)) for basis in _DCT])
+    low = [sum(_DCT[v][y] * partial[y][u] for y in range(_DCT_SIZE)) for v in range(_HASH_SIZE) for u in range(_HASH_SIZE)]
+
+    # The DC term (overall brightness) is left out of the median
+    median = sorted(low[1:])[len(low) // 2 - 1]
+    value = 0
+    for coefficient in low:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+def signed64(value):
+    """A 64-bit hash as a Postgres BIGINT, which is signed"""
+    return value - (1 << 64) if value >> 63 else value
+
+def _stable_hash(feature):
+    # hash() of a str changes with every restart, stored fingerprints must not
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+
+def text_fingerprint(message):
+    """64-bit SimHash of a vouch text, None if it is too short to tell copies apart"""
+    text = normalize_content(message or '')
+    if len(text) < TEXT_MIN_LENGTH:
+        return None
+    return simhash64(text, _stable_hash)
+
+def image_hash(data):
+    """pHash of an encoded image, None if it can't be decoded"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = list(image.convert('L').resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    return dct_hash(pixels)
+
+def _neighbours(value, bits, radius):
+    """Every `bits`-bit value within `radius` flipped bits of value"""
+    yield value
+    if radius >= 1:
+        for i in range(bits):
+            flipped = value ^ (1 << i)
+            yield flipped
+            if radius >= 2:
+                for j in range(i + 1, bits):
+                    yield flipped ^ (1 << j)
+
+class HammingIndex:
+    """64-bit hashes searchable by Hamming distance (multi-index hashing)
+
+    Hashes are split into 4 blocks of 16 bits, each with its own table. Two
+    hashes within `max_distance` bits agree on at least one block up to
+    max_distance // 4 bits, so a query only probes those few block values
+    instead of comparing against every stored hash.
+    """
+
+    def __init__(self, max_distance, blocks=HASH_BLOCKS):
+        self.max_distance = max_distance
+        self.bits = 64 // blocks
+        self.mask = (1 << self.bits) - 1
+        self.radius = max_distance // blocks
+        self.tables = [defaultdict(list) for _ in range(blocks)]  # block value -> positions
+        self.hashes = array('Q')
+        self.items = []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, value, item):
+        position = len(self.hashes)
+        self.hashes.append(value & _MASK64)
+        self.items.append(item)
+        for i, table in enumerate(self.tables):
+            table[(value >> (i * self.bits)) & self.mask].append(position)
+
+    def query(self, value):
+        """[(distance, item)] of stored hashes within max_distance, closest first"""
+        value &= _MASK64
+        seen = set()
+        found = []
+        for i, table in enumerate(self.tables):
+            for block in _neighbours((value >> (i * self.bits)) & self.mask, self.bits, self.radius):
+                for position in table.get(block, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (self.hashes[position] ^ value).bit_count()
+                    if distance <= self.max_distance:
+                        found.append((distance, self.items[position]))
+        found.sort(key=lambda match: match[0])
+        return found
+
+class ImageJob:
+    __slots__ = ('guild_id', 'channel_id', 'vouch_number', 'user_id', 'url', 'submitted')
+
+    def __init__(self, guild_id, channel_id, vouch_number, user_id, url):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.vouch_number = vouch_number
+        self.user_id = user_id
+        self.url = url
+        self.submitted = time.monotonic()
+
+class VouchImageIndex:
+    """Perceptual hashes of vouch images, to catch recycled screenshots
+
+    Vouches only queue their image; a background task downloads and hashes
+    it off the event loop, looks it up among earlier images of the guild,
+    stores it and calls on_match(job, matches) for near-duplicates. Hashes
+    are kept in vouch_image_hashes and loaded into memory at startup.
+    """
+
+    def __init__(self, dsn=None, on_match=None):
+        self.dsn = dsn
+        self.on_match = on_match  # async on_match(job, [(distance, (vouch_number, user_id))])
+        self.queue = asyncio.Queue(maxsize=IMAGE_QUEUE_SIZE)
+        self.indexes = {}  # guild_id -> HammingIndex of (vouch_number, user_id)
+        self.session = requests.Session()
+        self.hashed = 0
+        self.flagged = 0
+        self.skipped = 0
+        self.failures = 0
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def _connect(self):
+        import psycopg2
+        return psycopg2.connect(self.dsn)
+
+    def init_schema(self):
+        if not self.dsn:
+            return
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS vouch_image_hashes (
+                        guild_id BIGINT NOT NULL,
+                        vouch_number INTEGER NOT NULL,
+                        user_id BIGINT NOT NULL,
+                        hash BIGINT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (guild_id, vouch_number)
+                    )
+                """)
+                conn.commit()
+        finally:
+            conn.close()
+
+    def load(self):
+        """Fill the in-memory indexes from the database (blocking)"""
+        if not self.dsn:
+            return 0
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT guild_id, vouch_number, user_id, hash FROM vouch_image_hashes ORDER BY guild_id, vouch_number")
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+        for guild_id, vouch_number, user_id, value in rows:
+            self._index(guild_id).add(value, (vouch_number, user_id))
+        return len(rows)
+
+    def _index(self, guild_id):
+        index = self.indexes.get(guild_id)
+        if index is None:
+            index = self.indexes[guild_id] = HammingIndex(IMAGE_MATCH_DISTANCE)
+        return index
+
+    def submit(self, guild_id, channel_id, vouch_number, user_id, url):
+        """Queue the image of a posted vouch, never waits"""
+        if not self.enabled:
+            return
+        try:
+            self.queue.put_nowait(ImageJob(guild_id, channel_id, vouch_number, user_id, url))
+        except asyncio.QueueFull:
+            self.skipped += 1
+            logger.warning(f"Vouch image queue full, vouch #{vouch_number} of guild {guild_id} not checked")
+
+    def _download_hash(self, url):
+        """Worker thread: download an image and hash it"""
+        with self.session.get(url, stream=True, timeout=IMAGE_TIMEOUT) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise ValueError(f"image larger than {IMAGE_MAX_BYTES} bytes")
+                chunks.append(chunk)
+        return image_hash(b''.join(chunks))
+
+    def _store(self, job, value):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO vouch_image_hashes (guild_id, vouch_number, user_id, hash)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (guild_id, vouch_number) DO NOTHING
+                """, (job.guild_id, job.vouch_number, job.user_id, signed64(value)))
+                conn.commit()
+        finally:
+            conn.close()
+
+    async def process(self, job, value=None):
+        """Hash (unless given), look up and store the image of one vouch"""
+        if value is None:
+            value = await asyncio.to_thread(self._download_hash, job.url)
+            if value is None:
+                self.failures += 1
+                return []
+
+        index = self._index(job.guild_id)
+        matches = index.query(value)
+        index.add(value, (job.vouch_number, job.user_id))
+        self.hashed += 1
+        if self.dsn:
+            await asyncio.to_thread(self._store, job, value)
+
+        if matches:
+            self.flagged += 1
+            if self.on_match is not None:
+                await self.on_match(job, matches)
+        return matches
+
+    async def run(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.process(job)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error checking the image of vouch #{job.vouch_number}: {e}")
+
+class VouchTextIndex:
+    """SimHash fingerprints of vouch texts, to catch copy-pasted vouches
+
+    Fingerprints are stored in the simhash column of vouches (by save_vouch)
+    and kept in one in-memory index per guild. With a 7-bit threshold a
+    query probes 17 values in each of the 4 block tables, microseconds
+    whatever the number of vouches.
+    """
+
+    def __init__(self, dsn=None):
+        self.dsn = dsn
+        self.indexes = {}  # guild_id -> HammingIndex of (vouch_number, user_id)
+        self.flagged = 0
+
+    def _connect(self):
+        import psycopg2
+        return psycopg2.connect(self.dsn)
+
+    def _index(self, guild_id):
+        index = self.indexes.get(guild_id)
+        if index is None:
+            index = self.indexes[guild_id] = HammingIndex(TEXT_MATCH_DISTANCE)
+        return index
+
+    def load(self):
+        """Fill the in-memory indexes, fingerprinting older vouches first (blocking)"""
+        if not self.dsn:
+            return 0
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, message FROM vouches WHERE simhash IS NULL")
+                missing = [(signed64(fingerprint), vouch_id) for vouch_id, message in cursor.fetchall()
+                           if (fingerprint := text_fingerprint(message)) is not None]
+                if missing:
+                    cursor.executemany("UPDATE vouches SET simhash = %s WHERE id = %s", missing)
+                    conn.commit()
+                cursor.execute("SELECT guild_id, vouch_number, user_id, simhash FROM vouches WHERE simhash IS NOT NULL ORDER BY id")
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+        for guild_id, vouch_number, user_id, fingerprint in rows:
+            self._index(guild_id).add(fingerprint, (vouch_number, user_id))
+        return len(rows)
+
+    def check(self, guild_id, vouch_number, user_id, fingerprint):
+        """Earlier vouches with nearly the same text [(distance, (vouch_number, user_id))], then index this one"""
+        if fingerprint is None:
+            return []
+        index = self._index(guild_id)
+        matches = index.query(fingerprint)
+        index.add(fingerprint, (vouch_number, user_id))
+        if matches:
+            self.flagged += 1
+        return matches
+
+def _selftest(stored=300_000, queries=1000):
+    """pHash robustness on synthetic images, then index lookups at scale"""
+    import random
+
+    rng = random.Random(0)
+
+    def picture():
+        # 64x64: a few soft blobs on a gradient, like the broad shapes of a screenshot
+        blobs = [(rng.uniform(0, 64), rng.uniform(0, 64), rng.uniform(6, 20), rng.uniform(-80, 80)) for _ in range(6)]
+        slope = rng.uniform(-1, 1)
+        return [128 + slope * (x - 32) + sum(weight * math.exp(-((x - bx) ** 2 + (y - by) ** 2) / (2 * size ** 2))
+                                             for bx, by, size, weight in blobs)
+                for y in range(64) for x in range(64)]
+
+    def downscale(pixels):
+        # What the resize to 32x32 does: average 2x2 squares
+        return [(pixels[y * 128 + x] + pixels[y * 128 + x + 1] + pixels[y * 128 + 64 + x] + pixels[y * 128 + 65 + x]) / 4
+                for y in range(32) for x in range(0, 64, 2)]
+
+    same = []
+    different = []
+    for _ in range(50):
+        original = picture()
+        # Recompressed (per-pixel noise) and brightened copy
+        copy = [p * 1.1 + 5 + rng.uniform(-4, 4) for p in original]
+        same.append((dct_hash(downscale(original)) ^ dct_hash(downscale(copy))).bit_count())
+        different.append((dct_hash(downscale(original)) ^ dct_hash(downscale(picture()))).bit_count())
+    print(f"pHash distance: copies max {max(same)}, different images min {min(different)} (threshold {IMAGE_MATCH_DISTANCE})")
+    assert max(same) <= IMAGE_MATCH_DISTANCE < min(different)
+
+    index = HammingIndex(IMAGE_MATCH_DISTANCE)
+    values = [rng.getrandbits(64) for _ in range(stored)]
+    start = time.perf_counter()
+    for number, value in enumerate(values):
+        index.add(value, (number, 0))
+    print(f"Indexed {stored} hashes in {time.perf_counter() - start:.2f}s")
+
+    probes = []
+    for _ in range(queries):
+        number = rng.randrange(stored)
+        flipped = values[number]
+        for bit in rng.sample(range(64), rng.randint(0, IMAGE_MATCH_DISTANCE)):
+            flipped ^= 1 << bit
+        probes.append((number, flipped))
+    start = time.perf_counter()
+    for number, flipped in probes:
+        assert any(item[0] == number for _, item in index.query(flipped))
+    elapsed = time.perf_counter() - start
+    brute = time.perf_counter()
+    for value in values:
+        (value ^ probes[0][1]).bit_count() <= IMAGE_MATCH_DISTANCE
+    brute = time.perf_counter() - brute
+    print(f"{queries} near-duplicate queries: {elapsed / queries * 1e6:.0f}us each (full scan {brute * 1000:.0f}ms)")
+
+    # The worker flags the second vouch with the same image
+    async def worker():
+        flags = []
+
+        async def on_match(job, matches):
+            flags.append((job.vouch_number, matches))
+
+        images = VouchImageIndex(on_match=on_match)
+        await images.process(ImageJob(1, 10, 1, 100, ''), value=values[0])
+        await images.process(ImageJob(1, 10, 2, 200, ''), value=values[0] ^ 0b101)
+        await images.process(ImageJob(2, 20, 1, 300, ''), value=values[0])
+        assert flags == [(2, [(2, (1, 100))])]
+
+    asyncio.run(worker())
+
+    # Vouch texts: a reworded copy is caught, a different review is not
+    texts = VouchTextIndex()
+    original = "Amazing service, got my account to Grand Champ in two days, super friendly booster!"
+    for number in range(stored // 10):
+        texts.check(1, number + 2, number, rng.getrandbits(64))
+    assert texts.check(1, 1, 100, text_fingerprint(original)) == []
+    start = time.perf_counter()
+    matches = texts.check(1, 99999, 200, text_fingerprint("amazing service,  got my account to GRAND CHAMP in two days, super friendly booster!!"))
+    elapsed = time.perf_counter() - start
+    assert matches and matches[0][1] == (1, 100)
+    assert texts.check(1, 99998, 200, text_fingerprint(original.replace("two", "2")))
+    assert texts.check(1, 100000, 300, text_fingerprint("Bought the tournament rewards pack, delivered within the hour, will buy again")) == []
+    assert text_fingerprint("fast and legit") is None
+    print(f"Vouch text check among {stored // 10} vouches: {elapsed * 1e6:.0f}us, copy at distance {matches[0][0]}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] == "selftest":
+        _selftest()